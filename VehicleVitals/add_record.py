@@ -9,10 +9,18 @@ from uuid import uuid4
 
 import typer
 
-from .database_utilities import get_db_location
+from .database_utilities import (
+    connection,
+    natural_key,
+    to_cents,
+    to_mills,
+    to_timestamp,
+)
+from .mpg import recompute_window
+from .resolver import forget_vehicles, vehicle_option
 
 # Create the Typer app
-app = typer.Typer()
+app = typer.Typer(add_completion=False)
 
 
 class ServiceTypes(str, Enum):
@@ -61,9 +69,343 @@ class FuelTypes(str, Enum):
     diesel = "Diesel"
 
 
+def fill_up_status(filled_up: bool = True, missed_last_fill_up: bool = False) -> str:
+    """
+    Return the logs.IsFillUp value of a fuel up: "Full", "Partial", or "Reset" when
+    the previous fill up was not recorded (see mpg.py).
+    """
+    if missed_last_fill_up:
+        return "Reset"
+    return "Full" if filled_up else "Partial"
+
+
+def octane_rating(fuel_type: FuelTypes) -> str:
+    """
+    Convert a fuel type to the format used in the database:
+    "Regular" -> "Regular [Octane: 87]", "Diesel" -> "Diesel [Centane: 40]"
+    """
+    match fuel_type:
+        case FuelTypes.regular:
+            return f"{fuel_type.value} [Octane: 87]"
+        case FuelTypes.mid_grade:
+            return f"{fuel_type.value} [Octane: 89]"
+        case FuelTypes.premium:
+            return f"{fuel_type.value} [Octane: 91]"
+        case FuelTypes.diesel:
+            return f"{fuel_type.value} [Centane: 40]"
+        case _:
+            raise ValueError(f"Invalid fuel type: {fuel_type}")
+
+
+# ID of the entry a retried insert duplicates, see insert_fuel_up.
+LOG_BY_NATURAL_KEY_QUERY = "SELECT ID FROM logs WHERE NaturalKey = ?"
+
+
+def insert_fuel_up(
+    conn: sqlite3.Connection,
+    vehicle_id: str,
+    odometer: float,
+    gallons: float,
+    cost_per_gallon: float,
+    entry_timestamp: str,
+    is_fill_up: str = "Full",
+    fuel_type: FuelTypes = FuelTypes.premium,
+    location: str | None = "Home",
+) -> tuple[str, bool]:
+    """
+    Insert a fuel up, update the MPG it affects and move the vehicle mileage forward.
+    The caller commits.
+
+    The same fuel up recorded again (same vehicle, time, odometer and cost, e.g. a
+    retried command or request) is not inserted, and nothing else changes.
+
+    Returns:
+        tuple[str, bool]: ID of the log entry, and False if it was already recorded.
+    """
+    log_id = str(uuid4())
+    total_cost_cents = to_cents(cost_per_gallon * gallons)
+    key = natural_key(vehicle_id, entry_timestamp, odometer, "Gas", total_cost_cents)
+    # Insert the fuel up entry, the MPG is calculated below
+    query = """
+        INSERT INTO logs (
+            ID, VehicleID, EntryType, OdometerReading, IsFillUp,
+            EntryTimestamp, Location, CostPerGallonMills,
+            GallonsFilled, TotalCostCents, OctaneRating, NaturalKey
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (NaturalKey) DO NOTHING
+    """
+    cursor = conn.execute(
+        query,
+        (
+            log_id,
+            vehicle_id,
+            "Gas",
+            odometer,
+            is_fill_up,
+            entry_timestamp,
+            location,
+            to_mills(cost_per_gallon),
+            gallons,
+            total_cost_cents,
+            octane_rating(fuel_type),
+            key,
+        ),
+    )
+    if not cursor.rowcount:
+        (existing_id,) = conn.execute(LOG_BY_NATURAL_KEY_QUERY, (key,)).fetchone()
+        return existing_id, False
+
+    # This fuel up and, when backdated, the following ones up to the next full tank
+    recompute_window(conn, vehicle_id, (entry_timestamp, odometer))
+
+    # A backdated fuel up must not move the mileage back
+    query = "UPDATE vehicles SET mileage = max(mileage, ?) WHERE id = ?"
+    conn.execute(query, (odometer, vehicle_id))
+    return log_id, True
+
+
+SERVICE_TYPE_BY_NAME_QUERY = "SELECT id FROM service_types WHERE name = ?"
+PART_BY_NAME_QUERY = "SELECT id, cost FROM parts WHERE name = ? ORDER BY rowid LIMIT 1"
+
+# Parts linked to a service type with `vv add part --service-type`.
+STANDARD_PARTS_QUERY = """
+    SELECT p.name, p.cost
+    FROM service_type_parts sp
+    JOIN parts p ON p.id = sp.part_id
+    WHERE sp.service_type_id = ?
+"""
+
+# Using a part twice in one service counts it twice.
+INSERT_LOG_PART_SQL = """
+    INSERT INTO log_parts (log_id, part_id, quantity, unit_cost_cents)
+    VALUES (?, ?, 1, ?)
+    ON CONFLICT (log_id, part_id) DO UPDATE SET quantity = quantity + 1
+"""
+
+
+def parse_part(spec: str) -> tuple[str, float | None]:
+    """
+    Split a --part value, NAME or NAME=COST, into the part name and its unit cost in
+    dollars (None to use the cost in the parts catalog).
+
+    Raises:
+        ValueError: If the name is blank or the cost is not a number.
+    """
+    name, separator, cost = spec.rpartition("=") if "=" in spec else (spec, "", "")
+    if not name.strip():
+        raise ValueError(f"Missing part name in {spec!r}")
+    try:
+        return name.strip(), float(cost) if separator else None
+    except ValueError:
+        raise ValueError(f"Invalid part cost in {spec!r}, expected NAME=0.00")
+
+
+def insert_part(
+    conn: sqlite3.Connection,
+    name: str,
+    cost: float | None = None,
+    description: str | None = None,
+    service_type: ServiceTypes | None = None,
+) -> str:
+    """
+    Add a part to the parts catalog, or update the cost and description of the part
+    with this name. The caller commits.
+
+    Args:
+        service_type (ServiceTypes | None): Service type the part is used for, its
+            services record the part with --standard-parts.
+
+    Returns:
+        str: ID of the part.
+    """
+    if row := conn.execute(PART_BY_NAME_QUERY, (name,)).fetchone():
+        part_id = row[0]
+        conn.execute(
+            """
+            UPDATE parts SET cost = coalesce(?, cost),
+                description = coalesce(?, description)
+            WHERE id = ?
+            """,
+            (cost, description, part_id),
+        )
+    else:
+        part_id = str(uuid4())
+        conn.execute(
+            "INSERT INTO parts (id, name, description, cost) VALUES (?, ?, ?, ?)",
+            (part_id, name, description, cost),
+        )
+    if service_type is not None:
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO service_type_parts (service_type_id, part_id)
+            SELECT id, ? FROM service_types WHERE name = ?
+            """,
+            (part_id, service_type.value),
+        )
+    return part_id
+
+
+def record_parts(
+    conn: sqlite3.Connection, log_id: str, parts: list[tuple[str, float | None]]
+):
+    """
+    Record the parts used by a service entry in log_parts, adding the parts missing
+    from the catalog. The caller commits.
+
+    Args:
+        log_id (str): ID of the service entry.
+        parts (list[tuple[str, float | None]]): (name, unit cost in dollars) of each
+            part used, None for the catalog cost.
+    """
+    for name, cost in parts:
+        if row := conn.execute(PART_BY_NAME_QUERY, (name,)).fetchone():
+            part_id, catalog_cost = row
+        else:
+            part_id, catalog_cost = insert_part(conn, name, cost), cost
+        unit_cost = cost if cost is not None else catalog_cost
+        conn.execute(
+            INSERT_LOG_PART_SQL,
+            (log_id, part_id, to_cents(unit_cost) if unit_cost is not None else None),
+        )
+
+
+def insert_service(
+    conn: sqlite3.Connection,
+    vehicle_id: str,
+    odometer: float,
+    service_type: ServiceTypes,
+    cost: float,
+    entry_timestamp: str,
+    location: str | None = None,
+    parts: list[tuple[str, float | None]] = (),
+    standard_parts: bool = False,
+) -> tuple[str, bool]:
+    """
+    Insert a service entry with the parts it used and move the vehicle mileage
+    forward. The caller commits.
+
+    The same service recorded again (same vehicle, time, odometer and cost) is not
+    inserted, and its parts are not recorded a second time.
+
+    Args:
+        parts (list[tuple[str, float | None]]): (name, unit cost) of the parts used,
+            see record_parts.
+        standard_parts (bool): Also record the parts linked to the service type.
+
+    Returns:
+        tuple[str, bool]: ID of the log entry, and False if it was already recorded.
+    """
+    log_id = str(uuid4())
+    total_cost_cents = to_cents(cost)
+    key = natural_key(
+        vehicle_id, entry_timestamp, odometer, "Service", total_cost_cents
+    )
+    # Link the entry to its service type, which carries the service intervals. The
+    # label stays in Services for the search index.
+    row = conn.execute(SERVICE_TYPE_BY_NAME_QUERY, (service_type.value,)).fetchone()
+    service_type_id = row[0] if row else None
+    query = """
+        INSERT INTO logs (
+            ID, VehicleID, EntryType, OdometerReading,
+            EntryTimestamp, Location, TotalCostCents, Services, service_type_id,
+            NaturalKey
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (NaturalKey) DO NOTHING
+    """
+    cursor = conn.execute(
+        query,
+        (
+            log_id,
+            vehicle_id,
+            "Service",
+            odometer,
+            entry_timestamp,
+            location,
+            total_cost_cents,
+            service_type.value,
+            service_type_id,
+            key,
+        ),
+    )
+    if not cursor.rowcount:
+        (existing_id,) = conn.execute(LOG_BY_NATURAL_KEY_QUERY, (key,)).fetchone()
+        return existing_id, False
+    if standard_parts and service_type_id:
+        parts = [*conn.execute(STANDARD_PARTS_QUERY, (service_type_id,)), *parts]
+    record_parts(conn, log_id, parts)
+
+    # A backdated service must not move the mileage back
+    query = "UPDATE vehicles SET mileage = max(mileage, ?) WHERE id = ?"
+    conn.execute(query, (odometer, vehicle_id))
+    return log_id, True
+
+
+def insert_vehicle(
+    conn: sqlite3.Connection,
+    year: int,
+    make: str,
+    model: str,
+    color: str,
+    mileage: float,
+    name: str | None = None,
+    trim: str | None = None,
+    engine: str | None = None,
+) -> str:
+    """
+    Insert a vehicle. The caller commits.
+
+    Returns:
+        str: ID of the new vehicle.
+    """
+    vehicle_id = str(uuid4())
+    query = """
+        INSERT INTO vehicles (
+            id, name, Year, Make, Model, mileage, trim, Engine, Color
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    conn.execute(
+        query,
+        (vehicle_id, name or None, year, make, model, mileage, trim, engine, color),
+    )
+    # A new vehicle can make a cached ID prefix ambiguous
+    forget_vehicles()
+    return vehicle_id
+
+
+def entry_timestamp_option(entry_date: str, entry_time: str) -> str:
+    """
+    Convert the --entry-date and --entry-time options with `to_timestamp`.
+
+    Raises:
+        typer.BadParameter: If the date or the time is not valid.
+    """
+    try:
+        datetime.strptime(entry_date.strip(), "%Y-%m-%d")
+    except ValueError:
+        raise typer.BadParameter(
+            f"Invalid date: {entry_date}, use YYYY-MM-DD.", param_hint="--entry-date"
+        )
+    try:
+        return to_timestamp(entry_date, entry_time)
+    except ValueError as error:
+        raise typer.BadParameter(str(error), param_hint="--entry-time")
+
+
+def echo_added(vehicle_id: str, added: bool):
+    if added:
+        typer.echo(f"Added log entry for {vehicle_id}.")
+    else:
+        typer.echo(f"The log entry for {vehicle_id} was already recorded.")
+
+
 @app.command()
 def fuel_up(
-    vehicle_id: Annotated[str, typer.Option(help="Vehicle ID")],
+    vehicle_id: Annotated[
+        str, typer.Option(help="Vehicle ID, ID prefix or name", callback=vehicle_option)
+    ],
     odometer: Annotated[float, typer.Option(help="Odometer reading")],
     gallons: Annotated[float, typer.Option(help="Gallons filled")],
     cost_per_gallon: Annotated[float, typer.Option(help="Cost per gallon")],
@@ -85,91 +427,30 @@ def fuel_up(
     Add a fuel up entry to the database.
 
     Example:
-        vv add fuel-up --vehicle-id 23b3db142984 --odometer 1000 --gallons 10.0 --cost-per-gallon 2.50
-    """
-
-    # convert Fuel type to the format used in the database:
-    # "Regular" -> "Regular [Octane: 87]"
-    # "Diesel" -> "Diesel [Centane: 40]"
-    is_fill_up = "Unknown"  # Set a default value
-    match (filled_up, missed_last_fill_up):
-        case (True, False):
-            is_fill_up = "Full"
-        case (False, True):
-            is_fill_up = "Reset"
-        case (True, True):
-            is_fill_up = "Reset"
-        case (False, False):
-            is_fill_up = "Partial"
-
-    match fuel_type:
-        case FuelTypes.regular:
-            fuel_type = f"{fuel_type.value} [Octane: 87]"
-        case FuelTypes.mid_grade:
-            fuel_type = f"{fuel_type.value} [Octane: 89]"
-        case FuelTypes.premium:
-            fuel_type = f"{fuel_type.value} [Octane: 91]"
-        case FuelTypes.diesel:
-            fuel_type = f"{fuel_type.value} [Centane: 40]"
-        case _:
-            raise ValueError(f"Invalid fuel type: {fuel_type}")
-
-    with sqlite3.connect(get_db_location()) as conn:
-        if is_fill_up == "Full":
-            cursor = conn.cursor()
-            # Fetch the last fuel up entry for the vehicle to determine the MPG
-            last_fuel_up_query = """
-                        SELECT OdometerReading, GallonsFilled
-                        FROM logs
-                        WHERE VehicleID = ? and EntryType = 'Gas'
-                        ORDER BY EntryDate DESC, EntryTime DESC
-                        LIMIT 1
-                        """
-            cursor.execute(last_fuel_up_query, (vehicle_id,))
-            if last_fuel_up := cursor.fetchone():
-                last_odometer, last_gallons = last_fuel_up
-                mpg = (odometer - last_odometer) / gallons if last_gallons > 0 else None
-            else:
-                mpg = None
-
-        # Insert the fuel up entry
-        query = """
-            INSERT INTO logs (
-                ID, VehicleID, EntryType, MPG, OdometerReading, IsFillUp,
-                EntryDate, EntryTime, Location, CostPerGallon, 
-                GallonsFilled, TotalCost, OctaneRating
-            ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-
-        cursor.execute(
-            query,
-            (
-                str(uuid4()),
-                vehicle_id,
-                "Gas",
-                mpg,
-                odometer,
-                is_fill_up,
-                entry_date,
-                entry_time,
-                location,
-                f"${cost_per_gallon:.3f}",
-                gallons,
-                f"${cost_per_gallon * gallons:.2f}",
-                fuel_type,
-            ),
-        ),
-
-        query = "UPDATE vehicles SET mileage = ? WHERE id = ?"
-        cursor.execute(query, (odometer, vehicle_id))
-        conn.commit()
-        typer.echo(f"Added log entry for {vehicle_id}.")
+        vv add fuel-up --vehicle-id 6a9ab94e --odometer 1000 --gallons 10.0 --cost-per-gallon 2.50
+    """
+    entry_timestamp = entry_timestamp_option(entry_date, entry_time)
+
+    with connection() as conn:
+        _, added = insert_fuel_up(
+            conn,
+            vehicle_id,
+            odometer,
+            gallons,
+            cost_per_gallon,
+            entry_timestamp,
+            is_fill_up=fill_up_status(filled_up, missed_last_fill_up),
+            fuel_type=fuel_type,
+            location=location,
+        )
+        echo_added(vehicle_id, added)
 
 
 @app.command()
 def service(
-    vehicle_id: Annotated[str, typer.Option(help="Vehicle ID")],
+    vehicle_id: Annotated[
+        str, typer.Option(help="Vehicle ID, ID prefix or name", callback=vehicle_option)
+    ],
     odometer: Annotated[float, typer.Option(help="Odometer reading")],
     service_type: Annotated[ServiceTypes, typer.Option(help="Type of service")],
     cost: Annotated[float, typer.Option(help="Cost of service ($0.00)")],
@@ -180,41 +461,62 @@ def service(
         str, typer.Option(help="Time of service")
     ] = datetime.now().strftime("%I:%M %p"),
     location: Annotated[str, typer.Option(help="Location of service")] = None,
+    part: Annotated[
+        list[str],
+        typer.Option(help="Part used, NAME or NAME=COST, repeat for each part"),
+    ] = None,
+    standard_parts: Annotated[
+        bool,
+        typer.Option(help="Also record the parts of the service type (vv add part)"),
+    ] = False,
 ):
     """
     Add a service entry to the database.
 
     Example:
-        vv add service --vehicle-id 23b3db142984 --odometer 1000 --service-type "Oil Change" --cost 50.00
-    """
-    with sqlite3.connect(get_db_location()) as conn:
-        cursor = conn.cursor()
-        query = """
-            INSERT INTO logs (
-                ID, VehicleID, EntryType, OdometerReading, 
-                EntryDate, EntryTime, Location, TotalCost, Services
-            ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-
-        cursor.execute(
-            query,
-            (
-                str(uuid4()),
-                vehicle_id,
-                "Service",
-                odometer,
-                entry_date,
-                entry_time,
-                location,
-                f"${cost:.2f}",
-                service_type.value,
-            ),
-        ),
-        query = "UPDATE vehicles SET mileage = ? WHERE id = ?"
-        cursor.execute(query, (odometer, vehicle_id))
-        conn.commit()
-        typer.echo(f"Added log entry for {vehicle_id}.")
+        vv add service --vehicle-id "Daily Driver" --odometer 1000 --service-type "Oil Change" --cost 50.00 --part "Oil filter=8.99"
+    """
+    entry_timestamp = entry_timestamp_option(entry_date, entry_time)
+    try:
+        parts = [parse_part(spec) for spec in part or ()]
+    except ValueError as error:
+        raise typer.BadParameter(str(error), param_hint="--part")
+
+    with connection() as conn:
+        _, added = insert_service(
+            conn,
+            vehicle_id,
+            odometer,
+            service_type,
+            cost,
+            entry_timestamp,
+            location,
+            parts=parts,
+            standard_parts=standard_parts,
+        )
+        echo_added(vehicle_id, added)
+
+
+@app.command()
+def part(
+    name: Annotated[str, typer.Option(help="Name of the part")],
+    cost: Annotated[float, typer.Option(help="Unit cost of the part ($0.00)")] = None,
+    description: Annotated[str, typer.Option(help="Description of the part")] = None,
+    service_type: Annotated[
+        ServiceTypes,
+        typer.Option(help="Service type using the part, for --standard-parts"),
+    ] = None,
+):
+    """
+    Add a part to the parts catalog, or update the part with this name.
+
+    Example:
+        vv add part --name "Oil filter" --cost 8.99 --service-type "Oil Change"
+    """
+    with connection() as conn:
+        insert_part(conn, name, cost, description, service_type)
+    linked = f", used for {service_type.value}" if service_type else ""
+    typer.echo(f"Saved part {name}{linked}.")
 
 
 @app.command()
@@ -223,7 +525,9 @@ def vehicle(
     make: Annotated[str, typer.Option(help="Make of vehicle")],
     model: Annotated[str, typer.Option(help="Model of vehicle")],
     color: Annotated[str, typer.Option(help="Color of vehicle")],
-    milage: Annotated[float, typer.Option(help="Odometer reading")],
+    milage: Annotated[
+        float, typer.Option("--mileage", "--milage", help="Odometer reading")
+    ],
     name: Annotated[str, typer.Option(help="Short name of vehicle")] = None,
     trim: Annotated[str, typer.Option(help="Trim level vehicle")] = None,
     engine: Annotated[str, typer.Option(help="Engine of vehicle")] = None,
@@ -235,31 +539,19 @@ def vehicle(
         vv add vehicle --year 2021 --make Honda --model Civic --mileage 1000 --color Red
     """
 
-    with sqlite3.connect(get_db_location()) as conn:
-        cursor = conn.cursor()
-        query = """
-            INSERT INTO vehicles (
-                id, name, Year, Make, Model, mileage, trim, Engine, Color
-            ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-
-        cursor.execute(
-            query,
-            (
-                str(uuid4()),
-                name,
-                year,
-                make,
-                model,
-                milage,
-                trim,
-                engine,
-                color,
-            ),
-        ),
-        conn.commit()
-        typer.echo(f"Added vehicle {year} {make} {model}, to the database.")
+    with connection() as conn:
+        try:
+            vehicle_id = insert_vehicle(
+                conn, year, make, model, color, milage, name, trim, engine
+            )
+        except sqlite3.IntegrityError:
+            raise typer.BadParameter(
+                f"Another vehicle is named {name}.", param_hint="--name"
+            )
+        typer.echo(
+            f"Added vehicle {year} {make} {model}, to the database "
+            f"(ID {vehicle_id[:8]})."
+        )
 
 
 if __name__ == "__main__":
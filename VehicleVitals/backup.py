@@ -0,0 +1,169 @@
+"""
+This module contains the functions to back up the database while it is in use.
+
+Backups are copied with the SQLite online backup API, BACKUP_STEP_PAGES pages at a
+time, from a read only connection holding one read transaction for the whole copy.
+In WAL mode writers keep committing meanwhile and the backup is the database as of
+its start. Without that read transaction every commit of another connection would
+restart the copy, and a busy writer could keep it from ever finishing.
+
+A backup is written under a temporary name, switched to the rollback journal so it is
+a single self-contained file, checked with PRAGMA quick_check and optionally gzip
+compressed. Only then is it renamed to its final name, so a file with a backup name
+is always a complete, verified backup.
+"""
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+
+from .database_utilities import connect
+
+# Pages copied per step of the backup, 4 MiB with the default page size.
+BACKUP_STEP_PAGES = 1024
+
+# Fastest gzip level, database pages still compress well and a database of a few GB
+# is compressed in seconds rather than minutes.
+COMPRESS_LEVEL = 1
+
+# Backups of each kind kept by default, the oldest are deleted first.
+DEFAULT_KEEP = 7
+
+# Label of the snapshots taken before a schema migration (migrations.migrate).
+MIGRATION_LABEL = "pre-migration"
+
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupError(Exception):
+    """A backup did not pass its integrity check."""
+
+
+def backup_directory(db_path: Path) -> Path:
+    """Return the default directory of the backups of a database, next to it."""
+    return db_path.parent / "backups"
+
+
+def backup_name(db_path: Path, label: str = "", compress: bool = False) -> str:
+    """
+    Return the file name of a new backup of a database, e.g.
+    VehicleVitals-20260118-103000.db.gz or VehicleVitals-pre-migration-....db.
+    """
+    prefix = f"{db_path.stem}-{label}-" if label else f"{db_path.stem}-"
+    suffix = ".db.gz" if compress else ".db"
+    return f"{prefix}{datetime.now().strftime(TIMESTAMP_FORMAT)}{suffix}"
+
+
+def list_backups(directory: Path, db_path: Path, label: str = "") -> list[Path]:
+    """Return the backups of a database with this label, the oldest first."""
+    prefix = f"{db_path.stem}-{label}-" if label else f"{db_path.stem}-"
+    pattern = re.compile(re.escape(prefix) + r"\d{8}-\d{6}\.db(\.gz)?")
+    if not directory.is_dir():
+        return []
+    backups = [path for path in directory.iterdir() if pattern.fullmatch(path.name)]
+    return sorted(backups, key=lambda path: path.name)
+
+
+def prune_backups(
+    directory: Path, db_path: Path, keep: int, label: str = ""
+) -> list[Path]:
+    """
+    Delete all but the `keep` latest backups of a database with this label.
+
+    Returns:
+        list[Path]: The deleted backups.
+    """
+    backups = list_backups(directory, db_path, label)
+    deleted = backups[: max(len(backups) - keep, 0)]
+    for path in deleted:
+        path.unlink()
+    return deleted
+
+
+def verify_backup(conn: sqlite3.Connection):
+    """
+    Raises:
+        BackupError: If PRAGMA quick_check finds a problem in the backup.
+    """
+    problems = [row[0] for row in conn.execute("PRAGMA quick_check")]
+    if problems != ["ok"]:
+        raise BackupError(f"The backup failed its integrity check: {problems[0]}")
+
+
+def backup_database(
+    db_path: Path,
+    destination: Path,
+    compress: bool = False,
+    progress: Callable[[int, int, int], None] | None = None,
+) -> int:
+    """
+    Back up a database to `destination`, see the module docstring.
+
+    Args:
+        db_path (Path): Database to back up.
+        destination (Path): File to write, it ends with .gz when compressed.
+        compress (bool): gzip the backup.
+        progress (Callable | None): Called after each step with (status, pages left,
+            total pages), see sqlite3.Connection.backup.
+
+    Returns:
+        int: Number of pages copied.
+
+    Raises:
+        BackupError: If the backup failed its integrity check.
+    """
+    partial = destination.with_name(f".{destination.name}.partial")
+    copy = partial.with_suffix("") if compress else partial
+    source = connect(db_path, read_only=True)
+    try:
+        # The read transaction pins the snapshot the backup copies
+        source.execute("BEGIN")
+        source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+        copy.unlink(missing_ok=True)
+        target = sqlite3.connect(copy)
+        try:
+            source.backup(target, pages=BACKUP_STEP_PAGES, progress=progress)
+            target.execute("PRAGMA journal_mode = DELETE")
+            verify_backup(target)
+            (pages,) = target.execute("PRAGMA page_count").fetchone()
+        finally:
+            target.close()
+    except BaseException:
+        copy.unlink(missing_ok=True)
+        raise
+    finally:
+        source.close()
+
+    if compress:
+        try:
+            with open(copy, "rb") as data, gzip.open(
+                partial, "wb", compresslevel=COMPRESS_LEVEL
+            ) as output:
+                shutil.copyfileobj(data, output, 1 << 20)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        finally:
+            copy.unlink()
+    os.replace(partial, destination)
+    return pages
+
+
+def snapshot_before_migration(db_path: Path) -> Path:
+    """
+    Back up a database before its schema is migrated, keeping the DEFAULT_KEEP latest
+    of these snapshots.
+
+    Returns:
+        Path: The snapshot.
+    """
+    directory = backup_directory(db_path)
+    directory.mkdir(parents=True, exist_ok=True)
+    destination = directory / backup_name(db_path, MIGRATION_LABEL)
+    backup_database(db_path, destination)
+    prune_backups(directory, db_path, DEFAULT_KEEP, MIGRATION_LABEL)
+    return destination
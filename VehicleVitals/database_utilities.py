@@ -2,12 +2,257 @@
 This module contains function to initialize the database and create the tables.
 """
 
+import atexit
+import hashlib
 import os
 import sqlite3
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from functools import cache
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+# Totals kept per vehicle in vehicle_stats and per vehicle and month in
+# vehicle_monthly_stats, as the amount one logs row ({row}) adds to each of them.
+STATS_MEASURES = {
+    "log_count": "1",
+    "fuel_ups": "{row}.EntryType IS 'Gas'",
+    "gallons": "iif({row}.EntryType IS 'Gas', coalesce({row}.GallonsFilled, 0), 0)",
+    "fuel_cents": "iif({row}.EntryType IS 'Gas', coalesce({row}.TotalCostCents, 0), 0)",
+    "service_cents": (
+        "iif({row}.EntryType IS 'Gas', 0, coalesce({row}.TotalCostCents, 0))"
+    ),
+    "mpg_sum": "coalesce({row}.MPG, 0)",
+    "mpg_count": "{row}.MPG IS NOT NULL",
+}
+
+# (table, key columns, key values of a logs row)
+STATS_TABLES = (
+    ("vehicle_monthly_stats", "VehicleID, month", "{row}.VehicleID, {month}"),
+    ("vehicle_stats", "VehicleID", "{row}.VehicleID"),
+)
+
+STATS_MONTH = "substr({row}.EntryTimestamp, 1, 7)"
+
+
+def _stats_add_sql(row: str) -> str:
+    """Statements adding a logs row (NEW or OLD) to the stats tables."""
+    measures = ", ".join(STATS_MEASURES)
+    statements = []
+    for table, keys, key_values in STATS_TABLES:
+        month = STATS_MONTH.format(row=row)
+        values = ", ".join(expr.format(row=row) for expr in STATS_MEASURES.values())
+        totals = ",\n        ".join(f"{m} = {m} + excluded.{m}" for m in STATS_MEASURES)
+        statements.append(
+            f"""
+    INSERT INTO {table} (
+        {keys}, {measures}, min_odometer, max_odometer, last_entry
+    )
+    SELECT {key_values.format(row=row, month=month)}, {values},
+        {row}.OdometerReading, {row}.OdometerReading, {row}.EntryTimestamp
+    WHERE {row}.VehicleID IS NOT NULL AND {row}.EntryTimestamp IS NOT NULL
+    ON CONFLICT ({keys}) DO UPDATE SET
+        {totals},
+        min_odometer = coalesce(
+            min(min_odometer, excluded.min_odometer),
+            min_odometer,
+            excluded.min_odometer
+        ),
+        max_odometer = coalesce(
+            max(max_odometer, excluded.max_odometer),
+            max_odometer,
+            excluded.max_odometer
+        ),
+        last_entry = max(last_entry, excluded.last_entry);"""
+        )
+    return "".join(statements)
+
+
+def _stats_remove_sql(row: str) -> str:
+    """
+    Statements removing a logs row from the stats tables. The lowest and highest
+    odometer reading and the last entry cannot be subtracted, they are looked up again
+    when the removed row held one of them: from the logs of that month (an index range)
+    for the monthly totals, from the monthly totals for the lifetime ones.
+    """
+    month = STATS_MONTH.format(row=row)
+    statements = []
+    for table, _, _ in STATS_TABLES:
+        totals = ",\n        ".join(
+            f"{measure} = {measure} - ({expr.format(row=row)})"
+            for measure, expr in STATS_MEASURES.items()
+        )
+        where = f"VehicleID = {row}.VehicleID AND {row}.EntryTimestamp IS NOT NULL"
+        if table == "vehicle_monthly_stats":
+            where += f" AND month = {month}"
+        statements.append(
+            f"""
+    UPDATE {table} SET
+        {totals}
+    WHERE {where};"""
+        )
+
+    extremes = f"""({row}.OdometerReading IN (min_odometer, max_odometer)
+            OR {row}.EntryTimestamp = last_entry)"""
+    month_logs = f"""FROM logs
+            WHERE VehicleID = {row}.VehicleID AND EntryTimestamp
+                BETWEEN vehicle_monthly_stats.month
+                AND vehicle_monthly_stats.month || '-99'"""
+    vehicle_months = f"FROM vehicle_monthly_stats m WHERE m.VehicleID = {row}.VehicleID"
+    statements.append(
+        f"""
+    UPDATE vehicle_monthly_stats SET
+        min_odometer = (SELECT min(OdometerReading) {month_logs}),
+        max_odometer = (SELECT max(OdometerReading) {month_logs}),
+        last_entry = (SELECT max(EntryTimestamp) {month_logs})
+    WHERE VehicleID = {row}.VehicleID AND month = {month}
+        AND {extremes};
+    UPDATE vehicle_stats SET
+        min_odometer = (SELECT min(m.min_odometer) {vehicle_months}),
+        max_odometer = (SELECT max(m.max_odometer) {vehicle_months}),
+        last_entry = (SELECT max(m.last_entry) {vehicle_months})
+    WHERE VehicleID = {row}.VehicleID AND {extremes};
+    DELETE FROM vehicle_monthly_stats
+    WHERE VehicleID = {row}.VehicleID AND log_count <= 0;
+    DELETE FROM vehicle_stats WHERE VehicleID = {row}.VehicleID AND log_count <= 0;"""
+    )
+    return "".join(statements)
+
+
+# Columns that move a logs row between stats rows or change more than its MPG.
+STATS_UPDATE_COLUMNS = (
+    "VehicleID",
+    "EntryType",
+    "EntryTimestamp",
+    "OdometerReading",
+    "GallonsFilled",
+    "TotalCostCents",
+)
+
+_stats_unchanged = " AND ".join(f"OLD.{c} IS NEW.{c}" for c in STATS_UPDATE_COLUMNS)
+
+STATS_TRIGGERS_SQL = f"""
+-- Keep vehicle_stats and vehicle_monthly_stats current as logs change. Entries without
+-- a vehicle or timestamp are not counted.
+CREATE TRIGGER IF NOT EXISTS "logs_stats_insert" AFTER INSERT ON "logs"
+BEGIN{_stats_add_sql("NEW")}
+END;
+-- Logs moved to the archive database (archive_moves) stay counted.
+CREATE TRIGGER IF NOT EXISTS "logs_stats_delete" AFTER DELETE ON "logs"
+WHEN NOT EXISTS (SELECT 1 FROM archive_moves)
+BEGIN{_stats_remove_sql("OLD")}
+END;
+CREATE TRIGGER IF NOT EXISTS "logs_stats_update"
+AFTER UPDATE OF {", ".join(STATS_UPDATE_COLUMNS)} ON "logs"
+WHEN NOT ({_stats_unchanged})
+BEGIN{_stats_remove_sql("OLD")}{_stats_add_sql("NEW")}
+END;
+-- MPG recalculations (mpg.py) only touch the MPG totals.
+CREATE TRIGGER IF NOT EXISTS "logs_stats_update_mpg" AFTER UPDATE OF MPG ON "logs"
+WHEN OLD.MPG IS NOT NEW.MPG AND {_stats_unchanged}
+BEGIN
+    UPDATE vehicle_monthly_stats SET
+        mpg_sum = mpg_sum - coalesce(OLD.MPG, 0) + coalesce(NEW.MPG, 0),
+        mpg_count = mpg_count - (OLD.MPG IS NOT NULL) + (NEW.MPG IS NOT NULL)
+    WHERE VehicleID = NEW.VehicleID AND month = substr(NEW.EntryTimestamp, 1, 7);
+    UPDATE vehicle_stats SET
+        mpg_sum = mpg_sum - coalesce(OLD.MPG, 0) + coalesce(NEW.MPG, 0),
+        mpg_count = mpg_count - (OLD.MPG IS NOT NULL) + (NEW.MPG IS NOT NULL)
+    WHERE VehicleID = NEW.VehicleID AND NEW.EntryTimestamp IS NOT NULL;
+END;
+"""
+
+# Free text columns of logs in the full-text index (search.py).
+SEARCH_COLUMNS = ("Notes", "Location", "GasBrand", "EntryTags", "Services")
+
+_search_columns = ", ".join(SEARCH_COLUMNS)
+_search_old = ", ".join(f"OLD.{column}" for column in SEARCH_COLUMNS)
+_search_new = ", ".join(f"NEW.{column}" for column in SEARCH_COLUMNS)
+_search_unchanged = " AND ".join(f"OLD.{c} IS NEW.{c}" for c in SEARCH_COLUMNS)
+
+SEARCH_INDEX_SQL = f"""
+-- Full-text index of the free text columns of logs. It is an external content table,
+-- the text is only stored in logs and the triggers keep the index in step with it.
+CREATE VIRTUAL TABLE IF NOT EXISTS "logs_fts" USING fts5(
+    {_search_columns},
+    content='logs', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS "logs_fts_insert" AFTER INSERT ON "logs"
+BEGIN
+    INSERT INTO logs_fts (rowid, {_search_columns}) VALUES (NEW.rowid, {_search_new});
+END;
+CREATE TRIGGER IF NOT EXISTS "logs_fts_delete" AFTER DELETE ON "logs"
+BEGIN
+    INSERT INTO logs_fts (logs_fts, rowid, {_search_columns})
+    VALUES ('delete', OLD.rowid, {_search_old});
+END;
+-- Only edits of the indexed text reindex a row, not MPG or stats updates.
+CREATE TRIGGER IF NOT EXISTS "logs_fts_update"
+AFTER UPDATE OF {_search_columns} ON "logs"
+WHEN NOT ({_search_unchanged})
+BEGIN
+    INSERT INTO logs_fts (logs_fts, rowid, {_search_columns})
+    VALUES ('delete', OLD.rowid, {_search_old});
+    INSERT INTO logs_fts (rowid, {_search_columns}) VALUES (NEW.rowid, {_search_new});
+END;
+"""
+
+# Service types recorded by `vv add service`, one per add_record.ServiceTypes label.
+# Service entries are linked by service_types.id, a database that already has a type
+# of that name keeps its own row and intervals.
+SERVICE_TYPES_SQL = """
+INSERT INTO service_types (id, name, description, interval_days, interval_miles)
+SELECT * FROM (
+    VALUES
+    ('8282A7C0-0FA6-455C-9610-A0C5E96551EB', 'Oil Change',
+        'Change engine oil and filter', 180, 5000),
+    ('899939E4-3842-4CA2-A2E7-D878F9010329', 'Tire Rotation',
+        'Rotate the tires', 180, 7500),
+    ('AE82DC29-8CE2-4805-9BAE-212C259716E3', 'Air Filter',
+        'Replace air filter', 365, 15000),
+    ('057666FE-7A4D-4982-B79E-217E830918CC', 'Cabin Filter',
+        'Replace cabin air filter', 365, 15000),
+    ('6954A847-8C7B-43E4-B9B7-6AD988295654', 'Tire Replacement',
+        'Replace the tires', 1825, 50000),
+    ('735D2A66-ECF9-4980-A124-7059A27B6327', 'Car Wash',
+        'Wash the car', 30, NULL),
+    ('656060C1-8579-4245-9AEB-F9622EEB5E3D', 'Car Detailing',
+        'Detail the car', 180, NULL)
+) AS seed
+WHERE NOT EXISTS (SELECT 1 FROM service_types t WHERE t.name = seed.column2);
+"""
+
+# Regenerate the full-text index from logs, e.g. after a VACUUM renumbered the rowids.
+REBUILD_SEARCH_SQL = "INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')"
+
+# Regenerate the stats tables from logs, archived ones included (all_logs, see
+# attach_archive): one grouped pass over logs for the monthly totals, the lifetime
+# totals are summed from those.
+REBUILD_STATS_SQL = f"""
+DELETE FROM vehicle_monthly_stats;
+DELETE FROM vehicle_stats;
+INSERT INTO vehicle_monthly_stats (
+    VehicleID, month, {", ".join(STATS_MEASURES)},
+    min_odometer, max_odometer, last_entry
+)
+SELECT VehicleID, substr(EntryTimestamp, 1, 7),
+    {", ".join(f"sum({expr})" for expr in STATS_MEASURES.values()).format(row="logs")},
+    min(OdometerReading), max(OdometerReading), max(EntryTimestamp)
+FROM all_logs logs
+WHERE VehicleID IS NOT NULL AND EntryTimestamp IS NOT NULL
+GROUP BY VehicleID, substr(EntryTimestamp, 1, 7);
+INSERT INTO vehicle_stats (
+    VehicleID, {", ".join(STATS_MEASURES)}, min_odometer, max_odometer, last_entry
+)
+SELECT VehicleID, {", ".join(f"sum({m})" for m in STATS_MEASURES)},
+    min(min_odometer), max(max_odometer), max(last_entry)
+FROM vehicle_monthly_stats
+GROUP BY VehicleID;
+"""
+
 INIT_DATABASE_SQL = """
 -- logs table
 CREATE TABLE IF NOT EXISTS "logs" (
@@ -16,13 +261,12 @@ CREATE TABLE IF NOT EXISTS "logs" (
         CONSTRAINT logs_vehicles_id_fk REFERENCES vehicles,
     EntryType       TEXT,
     MPG             REAL,
-    EntryDate       TEXT,
-    EntryTime       TEXT,
+    EntryTimestamp  TEXT,    -- ISO-8601 local time, YYYY-MM-DDTHH:MM:SS
     OdometerReading REAL,
     IsFillUp        TEXT,
-    CostPerGallon   REAL,
+    CostPerGallonMills INTEGER,  -- 1/1000 dollar, fuel is priced to a tenth of a cent
     GallonsFilled   REAL,
-    TotalCost       REAL,
+    TotalCostCents  INTEGER,
     OctaneRating    INT,
     GasBrand        TEXT,
     Location        TEXT,
@@ -30,7 +274,9 @@ CREATE TABLE IF NOT EXISTS "logs" (
     PaymentType     TEXT,
     TirePressure    TEXT,
     Notes           TEXT,
-    Services        TEXT
+    Services        TEXT,
+    service_type_id TEXT,
+    NaturalKey      TEXT     -- natural_key() of the entry, NULL for a duplicate
 );
 
 -- vehicles table
@@ -74,9 +320,125 @@ CREATE TABLE IF NOT EXISTS "service_type_parts" (
     FOREIGN KEY ("service_type_id") REFERENCES "service_types" ("id"),
     FOREIGN KEY ("part_id") REFERENCES "parts" ("id")
 );
-"""
 
+-- log_parts table (junction table), the parts used by a service entry
+CREATE TABLE IF NOT EXISTS "log_parts" (
+    "log_id"          TEXT NOT NULL,  -- logs.ID, not a unique key so no foreign key
+    "part_id"         TEXT NOT NULL,
+    "quantity"        REAL NOT NULL DEFAULT 1,
+    "unit_cost_cents" INTEGER,
+    PRIMARY KEY("log_id", "part_id"),
+    FOREIGN KEY ("part_id") REFERENCES "parts" ("id")
+) WITHOUT ROWID;
+
+-- Totals per vehicle, kept current by the logs_stats_* triggers (display.stats)
+CREATE TABLE IF NOT EXISTS "vehicle_stats" (
+    "VehicleID"     TEXT NOT NULL,
+    "log_count"     INTEGER NOT NULL DEFAULT 0,
+    "fuel_ups"      INTEGER NOT NULL DEFAULT 0,
+    "gallons"       REAL NOT NULL DEFAULT 0,
+    "fuel_cents"    INTEGER NOT NULL DEFAULT 0,
+    "service_cents" INTEGER NOT NULL DEFAULT 0,
+    "mpg_sum"       REAL NOT NULL DEFAULT 0,  -- Average MPG = mpg_sum / mpg_count
+    "mpg_count"     INTEGER NOT NULL DEFAULT 0,
+    "min_odometer"  REAL,
+    "max_odometer"  REAL,
+    "last_entry"    TEXT,
+    PRIMARY KEY("VehicleID")
+) WITHOUT ROWID;
 
+-- The same totals per vehicle and month (YYYY-MM), for trailing totals and reports
+CREATE TABLE IF NOT EXISTS "vehicle_monthly_stats" (
+    "VehicleID"     TEXT NOT NULL,
+    "month"         TEXT NOT NULL,
+    "log_count"     INTEGER NOT NULL DEFAULT 0,
+    "fuel_ups"      INTEGER NOT NULL DEFAULT 0,
+    "gallons"       REAL NOT NULL DEFAULT 0,
+    "fuel_cents"    INTEGER NOT NULL DEFAULT 0,
+    "service_cents" INTEGER NOT NULL DEFAULT 0,
+    "mpg_sum"       REAL NOT NULL DEFAULT 0,
+    "mpg_count"     INTEGER NOT NULL DEFAULT 0,
+    "min_odometer"  REAL,
+    "max_odometer"  REAL,
+    "last_entry"    TEXT,
+    PRIMARY KEY("VehicleID", "month")
+) WITHOUT ROWID;
+
+-- Holds the cutoff while `vv db maintain` moves older logs to the archive database,
+-- the delete triggers leave the totals and parts of the moved logs alone.
+CREATE TABLE IF NOT EXISTS "archive_moves" ("cutoff" TEXT NOT NULL);
+
+-- Indexes for the log hot paths
+-- A vehicle's fuel ups in order, for the MPG calculation (mpg.py).
+CREATE INDEX IF NOT EXISTS "logs_vehicle_type_timestamp_idx" ON "logs" (
+    "VehicleID", "EntryType", "EntryTimestamp", "OdometerReading", "GallonsFilled"
+);
+-- Newest logs first, for all vehicles or one vehicle (display.logs). The rowid in
+-- every index entry breaks ties between logs with the same timestamp.
+CREATE INDEX IF NOT EXISTS "logs_timestamp_idx" ON "logs" ("EntryTimestamp");
+CREATE INDEX IF NOT EXISTS "logs_vehicle_timestamp_idx" ON "logs" (
+    "VehicleID", "EntryTimestamp"
+);
+-- Latest service of each type per vehicle (display.due), only logs linked to a type.
+CREATE INDEX IF NOT EXISTS "logs_service_due_idx" ON "logs" (
+    "VehicleID", "service_type_id", "EntryTimestamp", "OdometerReading"
+) WHERE "service_type_id" IS NOT NULL;
+-- Service type lookup by name (add_record.service, migrations).
+CREATE INDEX IF NOT EXISTS "service_types_name_idx" ON "service_types" ("name");
+-- A log by ID (log_parts.log_id) and the logs using a part, for parts rollups.
+CREATE INDEX IF NOT EXISTS "logs_id_idx" ON "logs" ("ID");
+CREATE INDEX IF NOT EXISTS "log_parts_part_idx" ON "log_parts" ("part_id");
+-- Part lookup by name (add_record.part).
+CREATE INDEX IF NOT EXISTS "parts_name_idx" ON "parts" ("name");
+-- A log entry is recorded once, inserts skip an entry with the same natural key.
+CREATE UNIQUE INDEX IF NOT EXISTS "logs_natural_key_idx" ON "logs" ("NaturalKey");
+-- Vehicle lookup by name (resolver.py), a name identifies one vehicle.
+CREATE UNIQUE INDEX IF NOT EXISTS "vehicles_name_idx" ON "vehicles" ("name");
+-- Vehicles in display order (display.vehicles).
+CREATE INDEX IF NOT EXISTS "vehicles_display_order_idx" ON "vehicles" (
+    "Year" DESC, "Make", "Model", "id"
+);
+-- The parts of a deleted log go with it, unless another log has the same ID or the
+-- log was moved to the archive database.
+CREATE TRIGGER IF NOT EXISTS "logs_parts_delete" AFTER DELETE ON "logs"
+WHEN NOT EXISTS (SELECT 1 FROM logs WHERE ID = OLD.ID)
+    AND NOT EXISTS (SELECT 1 FROM archive_moves)
+BEGIN
+    DELETE FROM log_parts WHERE log_id = OLD.ID;
+END;
+""" + STATS_TRIGGERS_SQL + SEARCH_INDEX_SQL + SERVICE_TYPES_SQL
+
+# Stored in PRAGMA user_version, bump it whenever INIT_DATABASE_SQL changes. Changes to
+# existing tables also need a script in the migration directory (see migrations.py).
+SCHEMA_VERSION = 11
+
+
+def natural_key(
+    vehicle_id: str | None,
+    entry_timestamp: str | None,
+    odometer: float | None,
+    entry_type: str | None,
+    total_cost_cents: int | None,
+) -> str:
+    """
+    Return the natural key of a log entry: a hash of the vehicle, time, odometer
+    reading, entry type and amount, the same for every copy of the entry. It is
+    stored in logs.NaturalKey and registered as the natural_key() SQL function.
+
+    Returns:
+        str: 32 hex digits.
+    """
+    fields = (
+        vehicle_id or "",
+        entry_timestamp or "",
+        repr(float(odometer)) if isinstance(odometer, (int, float)) else odometer or "",
+        entry_type or "",
+        "" if total_cost_cents is None else str(int(total_cost_cents)),
+    )
+    return hashlib.blake2b("\x1f".join(fields).encode(), digest_size=16).hexdigest()
+
+
+@cache
 def get_db_location() -> Path:
     """
     Check for the database configuration in the order of:
@@ -84,6 +446,9 @@ def get_db_location() -> Path:
     2. Check for the environment variable VEHICLE_VITALS_DATABASE_LOCATION.
     3. Use the default value if neither .env nor environment variable exists.
 
+    The location is resolved once per process, use `get_db_location.cache_clear()`
+    after changing the environment.
+
     Returns:
         Path: Path object representing the location of the database.
     """
@@ -100,20 +465,307 @@ def get_db_location() -> Path:
     return Path.home() / ".config" / "VehicleVitals.db"
 
 
-def initialize_database():
+# Connection tuning, each can be overridden with an environment variable (or .env).
+CONNECTION_SETTINGS = {
+    # Page cache per connection in KiB.
+    "VEHICLE_VITALS_CACHE_SIZE_KIB": 16 * 1024,
+    # Bytes of the database file read through a memory map, 0 to disable.
+    "VEHICLE_VITALS_MMAP_SIZE": 64 * 1024 * 1024,
+    # How long to wait for another process's write lock before failing.
+    "VEHICLE_VITALS_BUSY_TIMEOUT_MS": 5000,
+    # Prepared statements kept per connection.
+    "VEHICLE_VITALS_STATEMENT_CACHE": 256,
+}
+
+_shared_connection: sqlite3.Connection | None = None
+
+
+class Connection(sqlite3.Connection):
+    """
+    The connections `connect` opens. Unlike sqlite3.Connection they can be weakly
+    referenced, the caches kept per connection (history.py, resolver.py) do not keep
+    closed connections alive.
+    """
+
+
+# Class of the connections `connect` opens, `vv --trace` swaps in one that records
+# every statement (profiling.TracedConnection).
+connection_class: type[Connection] = Connection
+
+# Set by begin_batch, while it is set every unit of work runs in a savepoint of one
+# open transaction instead of committing on its own.
+_batch = False
+
+
+def connection_setting(name: str) -> int:
+    """Return a connection setting from the environment or its default."""
+    value = os.getenv(name)
+    return int(value) if value else CONNECTION_SETTINGS[name]
+
+
+def connect(
+    path: Path | str | None = None,
+    read_only: bool = False,
+    check_same_thread: bool = True,
+) -> sqlite3.Connection:
     """
-    Load the SQL statements from the init_database.sql file and execute them.
-    If database or tables do not exist, they will be created.
+    Open a connection to the database with the tuning every command shares:
+    - WAL journal, so readers do not block behind a writer and commits append to the
+      log instead of rewriting pages.
+    - synchronous=NORMAL, safe with WAL: a commit is only synced at checkpoints, an
+      OS crash may lose the last transactions but never corrupts the database.
+    - Larger page cache and memory mapped reads (CONNECTION_SETTINGS).
+    - A busy timeout instead of failing at once when another process is writing.
+    - Foreign key enforcement, which SQLite leaves off by default.
+    - Incremental auto vacuum for a new database, `vv db maintain` returns the pages
+      of deleted rows to the file system.
+    - The natural_key() SQL function, for migrations and `vv db dedupe`.
+
+    Args:
+        path (Path | str | None): Database file, the configured database if None.
+        read_only (bool): Open the database read only, it must exist.
+        check_same_thread (bool): False for a connection handed between threads, one
+            thread at a time (server.ReadPool).
+
+    Returns:
+        sqlite3.Connection: The configured connection.
+    """
+    path = Path(path or get_db_location())
+    target = f"file:{path}?mode=ro" if read_only else str(path)
+    new_database = not read_only and not path.exists()
+    conn = sqlite3.connect(
+        target,
+        uri=read_only,
+        timeout=connection_setting("VEHICLE_VITALS_BUSY_TIMEOUT_MS") / 1000,
+        cached_statements=connection_setting("VEHICLE_VITALS_STATEMENT_CACHE"),
+        check_same_thread=check_same_thread,
+        factory=connection_class,
+    )
+    if new_database:
+        # Only possible before the first page is written, `vv db maintain` converts
+        # older databases with a VACUUM.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if not read_only:
+        # Stored in the database file, later connections open it in WAL mode.
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(
+        f"PRAGMA cache_size = {-connection_setting('VEHICLE_VITALS_CACHE_SIZE_KIB')}"
+    )
+    conn.execute(f"PRAGMA mmap_size = {connection_setting('VEHICLE_VITALS_MMAP_SIZE')}")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.create_function("natural_key", 5, natural_key, deterministic=True)
+    return conn
+
+
+def archive_location(path: Path) -> Path:
+    """Return the archive database of a database, e.g. VehicleVitals-archive.db."""
+    return path.with_name(f"{path.stem}-archive{path.suffix}")
+
+
+def log_columns(conn: sqlite3.Connection, schema: str = "main") -> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(logs)")]
+
+
+def attach_archive(conn: sqlite3.Connection, create: bool = False) -> bool:
+    """
+    Attach the archive database that `vv db maintain` moves older logs to as
+    "archive", and create the temporary view all_logs: the logs of the database
+    followed by the archived ones. Without an archive all_logs is the logs table.
+
+    An archive attached while the database gained logs columns reads them as NULL,
+    `vv db maintain` adds them to it.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database, not in a transaction
+            (ATTACH is not allowed in one, all_logs is then the logs table).
+        create (bool): Create the archive database and its logs table if needed,
+            and add the missing columns.
+
+    Returns:
+        bool: True if the archive is attached.
+    """
+    databases = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+    if "archive" not in databases and databases.get("main"):
+        path = archive_location(Path(databases["main"]))
+        if (create or path.exists()) and not conn.in_transaction:
+            conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+            databases["archive"] = str(path)
+
+    columns = log_columns(conn)
+    select = f"SELECT {', '.join(columns)} FROM main.logs"
+    attached = "archive" in databases
+    if attached:
+        archived = log_columns(conn, "archive")
+        if create and not archived:
+            conn.executescript(
+                """
+                CREATE TABLE archive.logs AS SELECT * FROM main.logs WHERE 0;
+                CREATE UNIQUE INDEX archive.logs_natural_key_idx ON logs (NaturalKey);
+                CREATE INDEX archive.logs_vehicle_timestamp_idx
+                    ON logs (VehicleID, EntryTimestamp);
+                """
+            )
+            archived = columns
+        for column in columns:
+            if create and column not in archived:
+                conn.execute(f"ALTER TABLE archive.logs ADD COLUMN {column}")
+                archived.append(column)
+        if archived:
+            archived_columns = ", ".join(
+                column if column in archived else f"NULL AS {column}"
+                for column in columns
+            )
+            select += f" UNION ALL SELECT {archived_columns} FROM archive.logs"
+    conn.execute("DROP VIEW IF EXISTS temp.all_logs")
+    conn.execute(f"CREATE TEMP VIEW all_logs AS {select}")
+    return attached
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the connection shared by everything in this process, opened with `connect`
+    on first use and closed at exit.
+    """
+    global _shared_connection
+    if _shared_connection is None:
+        _shared_connection = connect()
+        atexit.register(close_connection)
+    return _shared_connection
+
+
+def close_connection():
+    """Close the shared connection, the next `get_connection` opens a new one."""
+    global _shared_connection, _batch
+    _batch = False
+    if _shared_connection is not None:
+        _shared_connection.close()
+        _shared_connection = None
+
+
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """
+    Use the shared connection for one unit of work: committed when the block ends,
+    rolled back if it raises, like `with sqlite3.connect(...) as conn`. Inside a batch
+    (`begin_batch`) the unit of work is a savepoint and the batch commits it.
+
+    Example:
+        with connection() as conn:
+            conn.execute("UPDATE vehicles SET mileage = ? WHERE id = ?", (1000, id))
+    """
+    conn = get_connection()
+    if not _batch:
+        with conn:
+            yield conn
+        return
+
+    conn.execute("SAVEPOINT unit_of_work")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK TO unit_of_work")
+        conn.execute("RELEASE unit_of_work")
+        raise
+    conn.execute("RELEASE unit_of_work")
+
+
+def in_batch() -> bool:
+    """Return True while a batch started by `begin_batch` is open."""
+    return _batch
+
+
+def begin_batch():
+    """
+    Open a transaction on the shared connection that groups the following units of
+    work until `end_batch`. A unit of work that fails is rolled back to its savepoint
+    without undoing the rest of the batch.
+    """
+    global _batch
+    if not _batch:
+        get_connection().execute("BEGIN IMMEDIATE")
+        _batch = True
+
+
+def end_batch(commit: bool = True):
+    """Commit, or roll back, the batch opened by `begin_batch`."""
+    global _batch
+    if _batch:
+        _batch = False
+        if commit:
+            get_connection().commit()
+        else:
+            get_connection().rollback()
+
+
+def to_timestamp(entry_date: str, entry_time: str | None = None) -> str:
+    """
+    Combine a date ("%Y-%m-%d") and an optional time ("%I:%M %p" or 24 hour "%H:%M")
+    into the ISO-8601 timestamp stored in logs.EntryTimestamp.
+
+    Returns:
+        str: Timestamp in the format YYYY-MM-DDTHH:MM:SS.
+    """
+    moment = datetime.strptime(entry_date.strip(), "%Y-%m-%d")
+    if entry_time and entry_time.strip():
+        for time_format in ("%I:%M %p", "%H:%M", "%H:%M:%S"):
+            try:
+                parsed = datetime.strptime(entry_time.strip().upper(), time_format)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Invalid time: {entry_time}")
+        moment = moment.replace(
+            hour=parsed.hour, minute=parsed.minute, second=parsed.second
+        )
+    return moment.isoformat(timespec="seconds")
+
+
+def to_cents(dollars: float) -> int:
+    """Convert a dollar amount to the integer cents stored in logs.TotalCostCents."""
+    return round(dollars * 100)
+
+
+def to_mills(dollars: float) -> int:
+    """Convert a fuel price to the mills (1/1000 dollar) in logs.CostPerGallonMills."""
+    return round(dollars * 1000)
+
+
+def format_cents(cents: int | None) -> str:
+    """Format integer cents for display, e.g. 123456 -> "$1,234.56"."""
+    return f"${cents / 100:,.2f}" if cents is not None else "N/A"
+
+
+def initialize_database(progress=None):
+    """
+    Execute the SQL statements to create the tables.
+    If database or tables do not exist, they will be created, an existing database is
+    upgraded by applying its pending migrations first.
+
+    Args:
+        progress (Callable | None): Migration progress callback, see migrations.migrate.
     Returns:
         None
     """
+    # The migrations module imports the schema from this module
+    from .migrations import migrate
+
+    migrate(get_connection(), progress=progress)
 
-    with sqlite3.connect(get_db_location()) as conn:
-        cursor = conn.cursor()
 
-        # Execute the SQL statements to create the tables
-        cursor.executescript(INIT_DATABASE_SQL)
-        conn.commit()
+def ensure_schema():
+    """
+    Initialize the database only when the schema version stored in PRAGMA user_version
+    is behind SCHEMA_VERSION, so an up to date database costs a single PRAGMA read.
+    Returns:
+        None
+    """
+    (version,) = get_connection().execute("PRAGMA user_version").fetchone()
+    if version < SCHEMA_VERSION:
+        from .migrations import echo_progress
+
+        initialize_database(progress=echo_progress)
 
 
 if __name__ == "__main__":
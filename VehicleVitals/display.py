@@ -1,62 +1,620 @@
 """
 This module contains the functions to read from the database.
 """
-import sqlite3
+import base64
+import json
+import math
+import sys
+from collections.abc import Callable, Iterable
+from datetime import date, datetime
+from enum import Enum
 from typing import Annotated
 
 import typer
 from rich.console import Console
 from rich.table import Table
 
-from .database_utilities import get_db_location
+from .add_record import ServiceTypes
+from .database_utilities import (
+    REBUILD_STATS_SQL,
+    attach_archive,
+    connection,
+    format_cents,
+    in_batch,
+)
+from .history import load_history, to_date
+from .resolver import vehicle_option
 
 # Create the Typer app
-app = typer.Typer()
+app = typer.Typer(add_completion=False)
+
+# Field names of the rows of logs_query and vehicles_query, for the machine readable
+# formats and the HTTP API (server.py). The trailing rowid of logs_query is left out.
+LOG_FIELDS = (
+    "year",
+    "make",
+    "model",
+    "trim",
+    "entry_timestamp",
+    "odometer",
+    "mpg",
+    "entry_type",
+    "services",
+    "id",
+    "vehicle_id",
+)
+VEHICLE_FIELDS = ("id", "name", "year", "make", "model", "trim", "mileage")
+
+
+class DisplayFormats(str, Enum):
+    """
+    Enum class representing the output formats of the display commands.
+
+    Attributes:
+    - table: Table for the terminal, printed once the whole page is read.
+    - plain: The table's values, one row per line, without box drawing.
+    - tsv: Tab separated raw values with a header row.
+    - json: JSON array of objects with the raw values.
+    """
+
+    table = "table"
+    plain = "plain"
+    tsv = "tsv"
+    json = "json"
+
+
+def tsv_value(value) -> str:
+    """Format a value for a TSV field, escaping the characters that end a field."""
+    if value is None:
+        return ""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def stream_rows(
+    rows: Iterable[tuple],
+    fields: tuple[str, ...],
+    output: DisplayFormats,
+    plain_row: Callable[[tuple], tuple],
+) -> tuple[int, tuple | None]:
+    """
+    Write rows to stdout as they are read, without building a table first.
+
+    Args:
+        rows (Iterable[tuple]): Rows, usually a cursor.
+        fields (tuple[str, ...]): Names of the leading values of each row.
+        output (DisplayFormats): plain, tsv or json.
+        plain_row (Callable): Formats a row for the plain output.
+
+    Returns:
+        tuple[int, tuple | None]: Number of rows written and the last row.
+    """
+    write = sys.stdout.write
+    count, row = 0, None
+    if output == DisplayFormats.tsv:
+        write("\t".join(fields) + "\n")
+    elif output == DisplayFormats.json:
+        write("[")
+
+    for count, row in enumerate(rows, 1):
+        if output == DisplayFormats.plain:
+            values = plain_row(row)
+            write("  ".join("N/A" if v is None else str(v) for v in values) + "\n")
+        elif output == DisplayFormats.tsv:
+            write("\t".join(tsv_value(value) for value in row[: len(fields)]) + "\n")
+        else:
+            separator = ",\n" if count > 1 else "\n"
+            write(separator + json.dumps(dict(zip(fields, row))))
+
+    if output == DisplayFormats.json:
+        write("\n]\n" if count else "]\n")
+    sys.stdout.flush()
+    return count, row
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Encode the sort key of the last row on a page into an opaque --after cursor.
+
+    Returns:
+        str: URL safe cursor string.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    Decode a cursor created by `encode_cursor` holding `size` values.
+
+    Raises:
+        typer.BadParameter: If the cursor is not valid.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, UnicodeDecodeError):
+        raise typer.BadParameter("Invalid cursor.", param_hint="--after")
+    if not isinstance(values, list) or len(values) != size:
+        raise typer.BadParameter("Invalid cursor.", param_hint="--after")
+    return values
+
+
+# Size of the cursors of `vv display logs` and `vv display vehicles`, also used by the
+# /logs and /vehicles routes of `vv serve`: the page number followed by the sort key of
+# the last row on the previous page.
+LOGS_CURSOR_SIZE = 3
+VEHICLES_CURSOR_SIZE = 5
+
+
+def logs_cursor(page: int, log: tuple) -> str:
+    """Return the cursor of the page after `page`, which ended with this logs row."""
+    return encode_cursor([page + 1, log[4], log[-1]])
+
+
+def vehicles_cursor(page: int, vehicle: tuple) -> str:
+    """Return the cursor of the page after `page`, which ended with this vehicle."""
+    return encode_cursor([page + 1, vehicle[2], vehicle[3], vehicle[4], vehicle[0]])
+
+
+def read_cursor(cursor: str, size: int) -> tuple[int, list]:
+    """
+    Decode a cursor from `logs_cursor` or `vehicles_cursor`.
+
+    Returns:
+        tuple[int, list]: The page number and the sort key of the last row on the
+            previous page, (1, []) without a cursor.
+
+    Raises:
+        typer.BadParameter: If the cursor is not valid.
+    """
+    if not cursor:
+        return 1, []
+    page, *last_row = decode_cursor(cursor, size)
+    if not isinstance(page, int):
+        raise typer.BadParameter("Invalid cursor.", param_hint="--after")
+    return page, last_row
+
+
+def logs_query(
+    page_size: int, vehicle_id: str = "", after: tuple | None = None
+) -> tuple[str, tuple]:
+    """
+    Build the query for one page of logs, newest first and the logs without a
+    timestamp last. Pages are read with a keyset on (EntryTimestamp, rowid) so every
+    page is an index seek, however deep it is.
+
+    The keyset comparison is never true for a NULL timestamp, so after a log with a
+    timestamp the page is merged from two seeks: the older logs, then the logs without
+    a timestamp. Both come in index order and the merge needs no sort.
+
+    Args:
+        page_size (int): Number of logs per page.
+        vehicle_id (str): Only return logs for this vehicle (All if blank).
+        after (tuple | None): (EntryTimestamp, rowid) of the last log on the previous
+            page.
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    # Prepare the SQL query with parameterized query
+    select = """
+        SELECT v.Year, v.Make, v.Model, v.trim, l.EntryTimestamp,
+        l.OdometerReading, l.MPG, l.EntryType, l.Services, l.ID, l.VehicleID,
+        l.rowid AS rowid
+        FROM logs l
+        LEFT JOIN vehicles v ON l.VehicleID = v.id
+    """
+
+    conditions = []
+    params = ()
+    if vehicle_id:
+        conditions.append("l.VehicleID = ?")
+        params += (vehicle_id,)
+
+    if after and after[0] is not None:
+        older = [*conditions, "(l.EntryTimestamp, l.rowid) < (?, ?)"]
+        untimed = [*conditions, "l.EntryTimestamp IS NULL"]
+        query = f"""
+            {select} WHERE {" AND ".join(older)}
+            UNION ALL
+            {select} WHERE {" AND ".join(untimed)}
+            ORDER BY EntryTimestamp DESC NULLS LAST, rowid DESC LIMIT ?
+        """
+        params += (*after, *params, page_size)
+        return query, params
+
+    if after:
+        # Already among the logs without a timestamp, the last part of the order
+        conditions.append("l.EntryTimestamp IS NULL AND l.rowid < ?")
+        params += (after[1],)
+    query = select
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY l.EntryTimestamp DESC NULLS LAST, l.rowid DESC LIMIT ?"
+    params += (page_size,)
+    return query, params
+
+
+def vehicles_query(
+    page_size: int, vehicle: str = "", after: tuple | None = None
+) -> tuple[str, tuple]:
+    """
+    Build the query for one page of vehicles, optionally only one vehicle.
+    Pages are read with a keyset on (Year DESC, Make, Model, id).
+
+    Args:
+        page_size (int): Number of vehicles per page.
+        vehicle (str): Only return the vehicle with this full ID (All if blank).
+        after (tuple | None): (Year, Make, Model, id) of the last vehicle on the
+            previous page.
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    query = "SELECT id, name, Year, Make, Model, trim, mileage FROM vehicles"
+    conditions = []
+    params = ()
+    if vehicle:
+        conditions.append("id = ?")
+        params += (vehicle,)
+    if after:
+        year, make, model, vehicle_id = after
+        conditions.append("(Year < ? OR (Year = ? AND (Make, Model, id) > (?, ?, ?)))")
+        params += (year, year, make, model, vehicle_id)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY Year DESC, Make, Model, id LIMIT ?"
+    params += (page_size,)
+    return query, params
+
+
+def vehicles_count_query(vehicle: str = "") -> tuple[str, tuple]:
+    """
+    Build the query counting vehicles, optionally only one vehicle by its full ID.
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    if vehicle:
+        return "SELECT COUNT(*) FROM vehicles WHERE id = ?", (vehicle,)
+    return "SELECT COUNT(*) FROM vehicles", ()
+
+
+def first_month(months: int, today: date | None = None) -> str:
+    """
+    Return the first month (YYYY-MM) of the trailing window of `months` months that
+    ends with the current month.
+    """
+    today = today or date.today()
+    index = today.year * 12 + today.month - months  # Months since year 0, 0 based
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def stats_query(
+    vehicle_id: str = "", months: int = 0, depot: bool = False
+) -> tuple[str, tuple]:
+    """
+    Build the query for the totals of each vehicle, in display order. Lifetime totals
+    are a single row per vehicle in vehicle_stats, trailing totals add up at most
+    `months` rows per vehicle from vehicle_monthly_stats.
+
+    Args:
+        vehicle_id (str): Only return this vehicle (All if blank).
+        months (int): Totals of the last `months` months, lifetime totals if 0.
+        depot (bool): Start each row with vehicles.depot and sort by it first, for
+            the merged tables of `vv fleet stats` (fleet.py).
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    select = "v.depot, " if depot else ""
+    if months:
+        query = f"""
+            SELECT {select}v.Year, v.Make, v.Model, v.trim, sum(s.fuel_ups),
+            sum(s.gallons), sum(s.fuel_cents), sum(s.service_cents), sum(s.mpg_sum),
+            sum(s.mpg_count), min(s.min_odometer), max(s.max_odometer)
+            FROM vehicles v
+            JOIN vehicle_monthly_stats s ON s.VehicleID = v.id AND s.month >= ?
+        """
+        params = (first_month(months),)
+    else:
+        query = f"""
+            SELECT {select}v.Year, v.Make, v.Model, v.trim, s.fuel_ups, s.gallons,
+            s.fuel_cents, s.service_cents, s.mpg_sum, s.mpg_count,
+            s.min_odometer, s.max_odometer
+            FROM vehicles v
+            JOIN vehicle_stats s ON s.VehicleID = v.id
+        """
+        params = ()
+    if vehicle_id:
+        query += " WHERE v.id = ?"
+        params += (vehicle_id,)
+    if months:
+        query += " GROUP BY v.id"
+    order = "v.depot, " if depot else ""
+    query += f" ORDER BY {order}v.Year DESC, v.Make, v.Model, v.id"
+    return query, params
+
+
+def due_query(
+    vehicle_id: str = "",
+    rate_days: int = 90,
+    include_never: bool = False,
+    today: date | None = None,
+) -> tuple[str, dict]:
+    """
+    Build the query forecasting when each service is next due, most urgent first, as
+    one set-based query:
+    - The latest completion of every vehicle and service type is read with one pass
+      over logs_service_due_idx, which only holds logs linked to a service type.
+    - The miles per day of every vehicle come from its logs of the last `rate_days`
+      days before its last entry (vehicle_stats.last_entry).
+    - A service is due at the last completion plus interval_days, or when the mileage
+      reaches the last completion plus interval_miles at that rate, whichever is first.
+
+    Args:
+        vehicle_id (str): Only forecast this vehicle (All if blank).
+        rate_days (int): Days of recent history the miles per day are taken from.
+        include_never (bool): Also list the services a vehicle has no record of.
+        today (date | None): Date the days left are counted from.
+
+    Returns:
+        tuple[str, dict]: The SQL query and its parameters.
+    """
+    query = """
+        WITH latest AS (
+            SELECT VehicleID, service_type_id, max(EntryTimestamp) AS last_done,
+                OdometerReading AS last_odometer  -- From the row holding the max()
+            FROM logs
+            WHERE service_type_id IS NOT NULL
+            GROUP BY VehicleID, service_type_id
+        ),
+        rates AS (
+            SELECT s.VehicleID, s.last_entry,
+                (max(l.OdometerReading) - min(l.OdometerReading)) / nullif(
+                    julianday(max(l.EntryTimestamp))
+                    - julianday(min(l.EntryTimestamp)),
+                    0
+                ) AS miles_per_day
+            FROM vehicle_stats s
+            JOIN logs l ON l.VehicleID = s.VehicleID AND l.EntryTimestamp >= strftime(
+                '%Y-%m-%dT%H:%M:%S', s.last_entry, '-' || :rate_days || ' days'
+            )
+            GROUP BY s.VehicleID
+        ),
+        due AS (
+            SELECT v.Year, v.Make, v.Model, v.trim, t.name AS service,
+                latest.last_done, latest.last_odometer,
+                latest.last_odometer + t.interval_miles AS due_miles,
+                julianday(latest.last_done) + t.interval_days AS due_by_days,
+                julianday(r.last_entry)
+                    + (latest.last_odometer + t.interval_miles - v.mileage)
+                    / nullif(r.miles_per_day, 0) AS due_by_miles
+            FROM vehicles v
+            CROSS JOIN service_types t
+            LEFT JOIN latest
+                ON latest.VehicleID = v.id AND latest.service_type_id = t.id
+            LEFT JOIN rates r ON r.VehicleID = v.id
+            WHERE (latest.VehicleID IS NOT NULL OR :include_never)
+                AND (v.id = :vehicle_id OR :vehicle_id = '')
+        ),
+        forecast AS (
+            -- The earlier of the two, or the one that is known
+            SELECT *, min(
+                coalesce(due_by_days, due_by_miles), coalesce(due_by_miles, due_by_days)
+            ) AS due_day
+            FROM due
+        )
+        SELECT Year, Make, Model, trim, service, last_done, last_odometer, due_miles,
+            date(due_day) AS due_date, due_day - julianday(:today) AS days_left
+        FROM forecast
+        ORDER BY days_left IS NULL, days_left, Year DESC, Make, Model, service
+    """
+    params = {
+        "vehicle_id": vehicle_id,
+        "rate_days": rate_days,
+        "include_never": include_never,
+        "today": (today or date.today()).isoformat(),
+    }
+    return query, params
+
+
+def service_history_query(
+    vehicle_id: str = "", service_type: str = "", limit: int = 20
+) -> tuple[str, tuple]:
+    """
+    Build the query for the latest service entries with their service type and the
+    parts they used, newest first. Entries are read newest first from the timestamp
+    indexes until the limit, or seeked in logs_service_due_idx for one service of
+    one vehicle. Their parts are found by the log_parts primary key.
+
+    Args:
+        vehicle_id (str): Only return this vehicle (All if blank).
+        service_type (str): Only return this service type, by name (All if blank).
+        limit (int): Number of entries to return.
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    query = """
+        SELECT v.Year, v.Make, v.Model, v.trim, l.EntryTimestamp, t.name,
+            l.OdometerReading, l.TotalCostCents,
+            (
+                SELECT group_concat(
+                    p.name || iif(lp.quantity = 1, '', printf(' x%g', lp.quantity)),
+                    ', '
+                )
+                FROM log_parts lp
+                JOIN parts p ON p.id = lp.part_id
+                WHERE lp.log_id = l.ID
+            ) AS parts,
+            (
+                SELECT sum(lp.quantity * lp.unit_cost_cents)
+                FROM log_parts lp
+                WHERE lp.log_id = l.ID
+            ) AS parts_cents
+        FROM logs l
+        JOIN service_types t ON t.id = l.service_type_id
+        LEFT JOIN vehicles v ON v.id = l.VehicleID
+        WHERE l.service_type_id IS NOT NULL
+    """
+    params = ()
+    if vehicle_id:
+        query += " AND l.VehicleID = ?"
+        params += (vehicle_id,)
+    if service_type:
+        query += (
+            " AND l.service_type_id = (SELECT id FROM service_types WHERE name = ?)"
+        )
+        params += (service_type,)
+    query += " ORDER BY l.EntryTimestamp DESC LIMIT ?"
+    params += (limit,)
+    return query, params
+
+
+def service_spend_query(vehicle_id: str = "") -> tuple[str, tuple]:
+    """
+    Build the query for the number of services, their cost and the cost of their
+    parts per service type, the largest spend first.
+
+    Args:
+        vehicle_id (str): Only count this vehicle (All if blank).
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    query = """
+        SELECT t.name, count(*), sum(l.TotalCostCents),
+            sum((
+                SELECT sum(lp.quantity * lp.unit_cost_cents)
+                FROM log_parts lp
+                WHERE lp.log_id = l.ID
+            )),
+            max(l.EntryTimestamp)
+        FROM logs l
+        JOIN service_types t ON t.id = l.service_type_id
+        WHERE l.service_type_id IS NOT NULL
+    """
+    params = ()
+    if vehicle_id:
+        query += " AND l.VehicleID = ?"
+        params += (vehicle_id,)
+    query += " GROUP BY l.service_type_id ORDER BY sum(l.TotalCostCents) DESC"
+    return query, params
+
+
+def log_display_row(log: tuple) -> tuple:
+    """Format a row of logs_query the way the logs table shows it."""
+    entry_time = datetime.fromisoformat(log[4]) if log[4] else None
+    return (
+        f"{log[0]} {log[1]} {log[2]} {log[3]}",
+        entry_time.strftime("%Y-%m-%d") if entry_time else "N/A",
+        entry_time.strftime("%I:%M %p") if entry_time else "N/A",
+        f"{float(log[5]):,.1f}" if log[5] is not None else "N/A",
+        f"{float(log[6]):,.1f}" if log[6] is not None else "N/A",
+        log[7],
+        log[8],
+    )
+
+
+STATS_HEADERS = (
+    "Vehicle",
+    "Fuel Ups",
+    "Gallons",
+    "Fuel Cost",
+    "Service Cost",
+    "Avg MPG",
+    "Odometer",
+    "Cost/Mile",
+)
+
+
+def stats_display_row(row: tuple) -> tuple:
+    """Format a row of stats_query the way the stats table shows it."""
+    year, make, model, trim, fuel_ups, gallons, fuel, service = row[:8]
+    mpg_sum, mpg_count, min_odometer, max_odometer = row[8:]
+    miles = (max_odometer or 0) - (min_odometer or 0)
+    return (
+        f"{year} {make} {model} {trim}",
+        f"{fuel_ups:,}",
+        f"{gallons:,.1f}",
+        format_cents(fuel),
+        format_cents(service),
+        f"{mpg_sum / mpg_count:,.1f}" if mpg_count else "N/A",
+        f"{max_odometer:,.1f}" if max_odometer is not None else "N/A",
+        f"${(fuel + service) / 100 / miles:,.2f}" if miles > 0 else "N/A",
+    )
+
+
+def vehicle_display_row(vehicle: tuple) -> tuple:
+    """Format a row of vehicles_query the way the vehicles table shows it."""
+    v = [str(x) for x in vehicle]
+    return (
+        v[0],
+        v[1] if v[1] != "None" else "",
+        f"{v[2]} {v[3]} {v[4]} {v[5]}",
+        f"{float(str(v[6]).replace(',', '')):,.1f}",
+    )
 
 
 @app.command()
 def logs(
-    page: Annotated[int, typer.Option(help="Page number to retrieve.")] = 1,
     page_size: Annotated[int, typer.Option(help="Number of records per page.")] = 10,
     vehicle_id: Annotated[
-        str, typer.Option(help="Filter by Vehicle ID (All if blank).")
+        str,
+        typer.Option(
+            help="Filter by Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
     ] = "",
+    after: Annotated[
+        str, typer.Option(help="Cursor printed at the end of the previous page.")
+    ] = "",
+    output: Annotated[
+        DisplayFormats, typer.Option("--format", help="Output format.")
+    ] = DisplayFormats.table,
 ):
     """
     View logs with optional filtering and pagination.
 
+    The plain, tsv and json formats print each log as it is read, and the cursor of
+    the next page on stderr.
+
     Examples:
 
         vv display logs
 
 
-        vv display logs --vehicle-id 6a9ab94e-0cea-481d-a9d4-23b3db142984
-    """
-    with sqlite3.connect(get_db_location()) as conn:
-        cursor = conn.cursor()
+        vv display logs --vehicle-id 6a9ab94e
 
-        # Calculate the OFFSET based on the page number and page size
-        offset = (page - 1) * page_size
 
-        # Prepare the SQL query with parameterized query
-        query = """
-            SELECT v.Year, v.Make, v.Model, v.trim, l.EntryDate, l.EntryTime,
-            l.OdometerReading, l.MPG, l.EntryType, l.Services
-            FROM logs l
-            LEFT JOIN vehicles v ON l.VehicleID = v.id
-        """
+        vv display logs --after WzIsICIyMDI0LTAxLTAxVDA4OjAwOjAwIiwgNDJd
 
-        params = ()
-        if vehicle_id:
-            query += " WHERE l.VehicleID = ?"
-            params = (vehicle_id,)
 
-        query += " ORDER BY l.EntryDate DESC, l.EntryTime DESC LIMIT ? OFFSET ?"
-        params += (page_size, offset)
+        vv display logs --format tsv --page-size 100000 | cut -f 5,6
+    """
+    # The cursor carries the page number along with the sort key of the last row.
+    page, last_row = read_cursor(after, LOGS_CURSOR_SIZE)
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(*logs_query(page_size, vehicle_id, last_row))
+        if output != DisplayFormats.table:
+            count, last = stream_rows(cursor, LOG_FIELDS, output, log_display_row)
+            if count == page_size:
+                next_cursor = logs_cursor(page, last)
+                typer.echo(f"Next page: --after {next_cursor}", err=True)
+            return
 
-        cursor.execute(query, params)
         if log_entries := cursor.fetchall():
-            print(f"Page {page}:")
+            # No page total, counting the logs would read all of them for every page
+            typer.echo(f"Page {page}:")
             console = Console()
             table = Table(
                 "Vehicle",
@@ -68,31 +626,39 @@ def logs(
                 "Services",
             )
             for log in log_entries:
-                table.add_row(
-                    f"{log[0]} {log[1]} {log[2]} {log[3]}",
-                    log[4],
-                    log[5],
-                    f"{float(log[6]):,.1f}" if log[6] is not None else "N/A",
-                    f"{float(log[7]):,.1f}" if log[7] is not None else "N/A",
-                    log[8],
-                    log[9],
-                )
+                table.add_row(*log_display_row(log))
             console.print(table)
+
+            if len(log_entries) == page_size:
+                next_cursor = logs_cursor(page, log_entries[-1])
+                typer.echo(f"Next page: --after {next_cursor}")
         else:
             typer.echo("No logs found on this page.")
 
 
 @app.command()
 def vehicles(
-    page: Annotated[int, typer.Option(help="Page number to retrieve.")] = 1,
     page_size: Annotated[int, typer.Option(help="Number of records per page.")] = 10,
     vehicle: Annotated[
-        str, typer.Option(help="Filter by Vehicle ID or Name (All if blank).")
+        str,
+        typer.Option(
+            help="Filter by Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
+    ] = "",
+    after: Annotated[
+        str, typer.Option(help="Cursor printed at the end of the previous page.")
     ] = "",
+    output: Annotated[
+        DisplayFormats, typer.Option("--format", help="Output format.")
+    ] = DisplayFormats.table,
 ):
     """
     View vehicles with optional filtering and pagination.
 
+    The plain, tsv and json formats print each vehicle as it is read, and the cursor
+    of the next page on stderr.
+
     Examples:
 
         vv display vehicles
@@ -100,38 +666,283 @@ def vehicles(
         vv display vehicles --vehicle 6a9ab94e-0cea-481d-a9d4-23b3db142984
 
         vv display vehicles --vehicle "My Vehicle"
+
+        vv display vehicles --format json
     """
-    with sqlite3.connect(get_db_location()) as conn:
+    page, last_row = read_cursor(after, VEHICLES_CURSOR_SIZE)
+    with connection() as conn:
         cursor = conn.cursor()
+        cursor.execute(*vehicles_query(page_size, vehicle, last_row))
+        if output != DisplayFormats.table:
+            count, last = stream_rows(
+                cursor, VEHICLE_FIELDS, output, vehicle_display_row
+            )
+            if count == page_size:
+                next_cursor = vehicles_cursor(page, last)
+                typer.echo(f"Next page: --after {next_cursor}", err=True)
+            return
 
-        # Calculate the OFFSET based on the page number and page size
-        query = "SELECT id, name, Year, Make, Model, trim, mileage FROM vehicles"
-        params = ()
-        if vehicle:
-            query += " WHERE name = ? or id = ?"
-            params = (vehicle, vehicle)
-
-        query += " ORDER BY Year DESC, Make, Model LIMIT ? OFFSET ?"
-        params += (page_size, (page - 1) * page_size)
-
-        cursor.execute(query, params)
         if vehicle_entries := cursor.fetchall():
-            typer.echo(f"Page {page} of {len(vehicle_entries) // page_size + 1}:")
+            cursor.execute(*vehicles_count_query(vehicle))
+            pages = math.ceil(cursor.fetchone()[0] / page_size)
+            typer.echo(f"Page {page} of {pages}:")
             console = Console()
             table = Table("ID", "Name", "Vehicle Description", "Mileage")
             for vehicle in vehicle_entries:
-                v = [str(x) for x in vehicle]
-                table.add_row(
-                    v[0],
-                    v[1] if v[1] != "None" else "",
-                    f"{v[2]} {v[3]} {v[4]} {v[5]}",
-                    f"{float(str(v[6]).replace(',', '')):,.1f}",
-                )
+                table.add_row(*vehicle_display_row(vehicle))
 
             console.print(table)
+
+            if page < pages:
+                next_cursor = vehicles_cursor(page, vehicle_entries[-1])
+                typer.echo(f"Next page: --after {next_cursor}")
         else:
             typer.echo("No vehicles found on this page.")
 
 
+@app.command()
+def stats(
+    vehicle_id: Annotated[
+        str,
+        typer.Option(
+            help="Filter by Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
+    ] = "",
+    months: Annotated[
+        int, typer.Option(help="Totals of the last N months (Lifetime if 0).", min=0)
+    ] = 0,
+    rebuild: Annotated[
+        bool, typer.Option(help="Regenerate the totals from the logs first.")
+    ] = False,
+):
+    """
+    View fuel and service totals, average MPG and cost per mile for each vehicle.
+
+    The totals are kept up to date as logs are added, so they are read without going
+    through the logs. Use --rebuild if they ever get out of step with the logs.
+
+    Examples:
+
+        vv display stats
+
+        vv display stats --months 12
+
+        vv display stats --rebuild
+    """
+    # The archived logs cannot be attached inside the transaction of `vv shell`
+    # `begin`, a rebuild without them would lose their totals
+    if rebuild and in_batch():
+        typer.echo(
+            "Error: commit or rollback before running stats --rebuild.", err=True
+        )
+        raise typer.Exit(code=1)
+
+    with connection() as conn:
+        if rebuild:
+            attach_archive(conn)
+            for statement in REBUILD_STATS_SQL.split(";"):
+                conn.execute(statement)
+
+        rows = conn.execute(*stats_query(vehicle_id, months)).fetchall()
+        if not rows:
+            typer.echo("No stats found.")
+            return
+
+        table = Table(*STATS_HEADERS)
+        for row in rows:
+            table.add_row(*stats_display_row(row))
+        if months:
+            typer.echo(f"Since {first_month(months)}:")
+        Console().print(table)
+
+
+@app.command()
+def due(
+    vehicle_id: Annotated[
+        str,
+        typer.Option(
+            help="Filter by Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
+    ] = "",
+    rate_days: Annotated[
+        int,
+        typer.Option(help="Days of recent history used for miles per day.", min=1),
+    ] = 90,
+    include_never: Annotated[
+        bool, typer.Option(help="Also list services with no record for a vehicle.")
+    ] = False,
+):
+    """
+    View when each service is next due, most urgent first.
+
+    A service is due after the interval_days or interval_miles of its service type,
+    whichever comes first. The due date by mileage is projected from the miles per
+    day the vehicle was driven recently.
+
+    Examples:
+
+        vv display due
+
+        vv display due --vehicle-id 6a9ab94e --rate-days 30
+    """
+    with connection() as conn:
+        rows = conn.execute(*due_query(vehicle_id, rate_days, include_never)).fetchall()
+
+    if not rows:
+        typer.echo("No services found.")
+        return
+
+    table = Table(
+        "Vehicle",
+        "Service",
+        "Last Done",
+        "Last Odometer",
+        "Due Date",
+        "Due Mileage",
+        "Days Left",
+    )
+    for row in rows:
+        year, make, model, trim, service, last_done, last_odometer = row[:7]
+        due_miles, due_date, days_left = row[7:]
+        if days_left is None:
+            status = "N/A"
+        elif days_left < 0:
+            status = f"Overdue {-days_left:,.0f}"
+        else:
+            status = f"{days_left:,.0f}"
+        table.add_row(
+            f"{year} {make} {model} {trim}",
+            service,
+            last_done[:10] if last_done else "Never",
+            f"{last_odometer:,.1f}" if last_odometer is not None else "N/A",
+            due_date or "N/A",
+            f"{due_miles:,.1f}" if due_miles is not None else "N/A",
+            status,
+        )
+    Console().print(table)
+
+
+@app.command()
+def trend(
+    vehicle_id: Annotated[
+        str,
+        typer.Option(help="Vehicle ID, ID prefix or name.", callback=vehicle_option),
+    ],
+    window: Annotated[
+        int, typer.Option(help="Fuel ups in the rolling MPG average.", min=1)
+    ] = 5,
+    last: Annotated[int, typer.Option(help="Number of fuel ups to show.", min=1)] = 10,
+    rate_days: Annotated[
+        int,
+        typer.Option(help="Days of recent history used for miles per day.", min=1),
+    ] = 90,
+):
+    """
+    View the MPG trend of a vehicle's most recent fuel ups, its lifetime cost per mile
+    and the miles it was driven per day recently.
+
+    The vehicle's history is read once into memory, inside `vv shell` it is reused
+    until the logs change.
+
+    Example:
+        vv display trend --vehicle-id 6a9ab94e --window 10
+    """
+    with connection() as conn:
+        history = load_history(conn, vehicle_id)
+
+    if not (points := history.mpg_trend(window)[-last:]):
+        typer.echo("No fuel ups with an MPG found.")
+        return
+
+    table = Table("EntryDate", "Odometer", "Gallons", "MPG", f"MPG ({window} Avg)")
+    for index, mpg, rolling in points:
+        entry_date = to_date(history.days[index])
+        table.add_row(
+            entry_date.isoformat() if entry_date else "N/A",
+            f"{history.odometer[index]:,.1f}",
+            f"{history.gallons[index]:,.3f}",
+            f"{mpg:,.1f}",
+            f"{rolling:,.1f}",
+        )
+    Console().print(table)
+
+    cost = history.cost_per_mile()
+    rate = history.miles_per_day(rate_days)
+    typer.echo(
+        f"Cost per mile: {f'${cost:,.2f}' if cost is not None else 'N/A'}, "
+        f"miles per day (last {rate_days} days): "
+        f"{f'{rate:,.1f}' if rate is not None else 'N/A'}"
+    )
+
+
+@app.command(name="service-history")
+def service_history(
+    vehicle_id: Annotated[
+        str,
+        typer.Option(
+            help="Filter by Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
+    ] = "",
+    service_type: Annotated[
+        ServiceTypes, typer.Option(help="Only show this type of service.")
+    ] = None,
+    limit: Annotated[
+        int, typer.Option(help="Number of service entries to show.", min=1)
+    ] = 20,
+):
+    """
+    View the latest service entries with the parts they used, and the spend on each
+    type of service.
+
+    Examples:
+
+        vv display service-history
+
+        vv display service-history --vehicle-id 6a9ab94e --service-type "Oil Change"
+    """
+    service_name = service_type.value if service_type else ""
+    with connection() as conn:
+        rows = conn.execute(
+            *service_history_query(vehicle_id, service_name, limit)
+        ).fetchall()
+        spend = conn.execute(*service_spend_query(vehicle_id)).fetchall()
+
+    if not rows:
+        typer.echo("No services found.")
+        return
+
+    table = Table(
+        "Vehicle", "Date", "Service", "Odometer", "Cost", "Parts", "Parts Cost"
+    )
+    for year, make, model, trim, timestamp, name, odometer, cost, parts, parts_cost in (
+        rows
+    ):
+        table.add_row(
+            " ".join(str(part) for part in (year, make, model, trim) if part),
+            timestamp[:10] if timestamp else "N/A",
+            name,
+            f"{odometer:,.1f}" if odometer is not None else "N/A",
+            format_cents(cost),
+            parts or "",
+            format_cents(parts_cost) if parts_cost is not None else "",
+        )
+    console = Console()
+    console.print(table)
+
+    table = Table("Service", "Times", "Total Cost", "Parts Cost", "Last Done")
+    for name, count, cost, parts_cost, last_done in spend:
+        table.add_row(
+            name,
+            f"{count:,}",
+            format_cents(cost),
+            format_cents(parts_cost) if parts_cost is not None else "",
+            last_done[:10] if last_done else "N/A",
+        )
+    console.print(table)
+
+
 if __name__ == "__main__":
     app()
@@ -6,74 +6,105 @@ from typing import Annotated
 
 import typer
 
-from .database_utilities import get_db_location
+from .database_utilities import connection
+from .resolver import forget_vehicles, vehicle_option
 
 # Create the Typer app
-app = typer.Typer()
+app = typer.Typer(add_completion=False)
+
+
+def vehicle_update_query(vehicle_id: str, **values) -> tuple[str, list]:
+    """
+    Build the UPDATE statement for a vehicle by its full ID (see resolver.py), setting
+    only the values that are not None. A blank name clears the name.
+
+    Returns:
+        tuple[str, list]: The SQL query and its parameters.
+    """
+    values = {field: value for field, value in values.items() if value is not None}
+    if not values:
+        raise ValueError("No values to update.")
+    # NULL like a vehicle added without a name, names are unique but NULLs are not
+    if values.get("name") == "":
+        values["name"] = None
+
+    # Join the SET clause into a comma-separated string
+    set_clause = ", ".join(f"{field} = ?" for field in values)
+
+    # Prepare the SQL query with parameterized query
+    query = f"UPDATE vehicles SET {set_clause} WHERE id = ?"
+    params = [*values.values(), vehicle_id]
+    return query, params
+
+
+def update_vehicle(conn: sqlite3.Connection, vehicle_id: str, **values) -> int:
+    """
+    Update a vehicle by its full ID, setting only the values that are not None.
+    The caller commits.
+
+    Returns:
+        int: Number of vehicles updated, 0 or 1.
+    """
+    query, params = vehicle_update_query(vehicle_id, **values)
+    updated = conn.execute(query, params).rowcount
+    # A new name changes what the vehicle's name resolves to
+    forget_vehicles()
+    return updated
 
 
 @app.command()
 def vehicle(
-    vehicle: Annotated[str, typer.Option(help="ID or Name of the vehicle")] = None,
+    vehicle: Annotated[
+        str,
+        typer.Option(
+            help="ID, ID prefix or Name of the vehicle",
+            callback=vehicle_option,
+        ),
+    ] = None,
     confirm: Annotated[bool, typer.Option(help="Confirm the update")] = True,
     year: Annotated[int, typer.Option(help="Year of vehicle")] = None,
     make: Annotated[str, typer.Option(help="Make of vehicle")] = None,
     model: Annotated[str, typer.Option(help="Model of vehicle")] = None,
     color: Annotated[str, typer.Option(help="Color of vehicle")] = None,
     mileage: Annotated[float, typer.Option(help="Odometer reading")] = None,
-    name: Annotated[str, typer.Option(help="Short name of vehicle")] = None,
+    name: Annotated[
+        str, typer.Option(help="Short name of vehicle (Cleared if blank)")
+    ] = None,
     trim: Annotated[str, typer.Option(help="Trim level vehicle")] = None,
     engine: Annotated[str, typer.Option(help="Engine of vehicle")] = None,
 ):
     """
     Edit a vehicle record in the database, based on the vehicle ID or name.
     Only values that are passed in will be updated.
+
+    Example:
+        vv edit vehicle --vehicle 6a9ab94e --name "Daily Driver" --mileage 51200
     """
-    with sqlite3.connect(get_db_location()) as conn:
-        cursor = conn.cursor()
-
-        set_clause = [
-            f"{field} = ?"
-            for field, value in [
-                ("year", year),
-                ("make", make),
-                ("model", model),
-                ("color", color),
-                ("mileage", mileage),
-                ("name", name),
-                ("trim", trim),
-                ("engine", engine),
-            ]
-            if value is not None
-        ]
-        # Join the SET clause into a comma-separated string
-        set_clause = ", ".join(set_clause)
-
-        # Prepare the SQL query with parameterized query
-        query = f"UPDATE vehicles SET {set_clause} WHERE id = ? or name = ?"
-
-        params = [
-            field
-            for field in [
-                year,
-                make,
-                model,
-                color,
-                mileage,
-                name,
-                trim,
-                engine,
-            ]
-            if field
-        ]
-
-        params += [vehicle, vehicle]
+    if not vehicle:
+        raise typer.BadParameter("Pass the vehicle to edit.", param_hint="--vehicle")
+    values = dict(
+        year=year,
+        make=make,
+        model=model,
+        color=color,
+        mileage=mileage,
+        name=name,
+        trim=trim,
+        engine=engine,
+    )
+    if all(value is None for value in values.values()):
+        raise typer.BadParameter("Pass at least one value to update.")
 
+    with connection() as conn:
         if confirm:
             typer.confirm(f"Update vehicle {vehicle}?", abort=True)
 
-        cursor.execute(query, params)
-        conn.commit()
+        try:
+            update_vehicle(conn, vehicle, **values)
+        except sqlite3.IntegrityError:
+            raise typer.BadParameter(
+                f"Another vehicle is named {name}.", param_hint="--name"
+            )
 
 
 if __name__ == "__main__":
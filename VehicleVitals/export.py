@@ -0,0 +1,289 @@
+"""
+This module contains the functions to export log entries for analytics and backups.
+
+Rows are streamed from a single query in batches of `fetchmany`, so memory use does not
+depend on the number of logs. The columns are the logs columns read by `vv import`,
+followed by the vehicle of each entry.
+"""
+import csv
+import sqlite3
+import sys
+import time
+from collections.abc import Iterator
+from datetime import date, timedelta
+from enum import Enum
+from pathlib import Path
+from typing import IO, Annotated
+
+import typer
+
+from .database_utilities import attach_archive, connection
+from .import_records import LOG_COLUMNS
+from .resolver import vehicle_option
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+VEHICLE_COLUMNS = {
+    "Year": "v.Year",
+    "Make": "v.Make",
+    "Model": "v.Model",
+    "Trim": "v.trim",
+    "VehicleName": "v.name",
+}
+
+EXPORT_COLUMNS = LOG_COLUMNS + tuple(VEHICLE_COLUMNS)
+
+# Columns that are not text, for the Parquet schema.
+NUMERIC_COLUMNS = {
+    "MPG": "float64",
+    "OdometerReading": "float64",
+    "CostPerGallonMills": "int64",
+    "GallonsFilled": "float64",
+    "TotalCostCents": "int64",
+    "Year": "int64",
+}
+
+# Rows per Parquet row group, a few fetchmany batches are gathered into each one.
+ROW_GROUP_SIZE = 131072
+
+
+class ExportFormats(str, Enum):
+    """
+    Enum class representing the supported export file formats.
+
+    Attributes:
+    - csv: Comma separated values with a header row.
+    - jsonl: One JSON object per line.
+    - parquet: Compressed columnar Parquet file (requires the parquet extra).
+    """
+
+    csv = "csv"
+    jsonl = "jsonl"
+    parquet = "parquet"
+
+
+def export_query(
+    vehicle_id: str = "",
+    since: date | None = None,
+    until: date | None = None,
+    as_json: bool = False,
+) -> tuple[str, tuple]:
+    """
+    Build the query streaming the logs with their vehicle, archived ones included
+    (all_logs, the connection needs `attach_archive`). Without filters it is a
+    single scan of logs in storage order, the filters are answered from the
+    (VehicleID, EntryTimestamp) and EntryTimestamp indexes.
+
+    Args:
+        vehicle_id (str): Only export this vehicle (All if blank).
+        since (date | None): First day to export.
+        until (date | None): Last day to export, included.
+        as_json (bool): Return each row as one JSON object built by SQLite, which is
+            faster than building it in Python.
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    columns = {column: f"l.{column}" for column in LOG_COLUMNS} | VEHICLE_COLUMNS
+    if as_json:
+        pairs = ", ".join(f"'{name}', {expr}" for name, expr in columns.items())
+        select = f"json_object({pairs})"
+    else:
+        select = ", ".join(columns.values())
+
+    query = f"""
+        SELECT {select} FROM all_logs l LEFT JOIN vehicles v ON v.id = l.VehicleID
+    """
+    conditions = []
+    params = ()
+    if vehicle_id:
+        conditions.append("l.VehicleID = ?")
+        params += (vehicle_id,)
+    if since:
+        conditions.append("l.EntryTimestamp >= ?")
+        params += (since.isoformat(),)
+    if until:
+        conditions.append("l.EntryTimestamp < ?")
+        params += ((until + timedelta(days=1)).isoformat(),)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, params
+
+
+def fetch_batches(
+    conn: sqlite3.Connection, query: str, params: tuple, batch_size: int
+) -> Iterator[list[tuple]]:
+    """Yield the rows of a query in lists of up to `batch_size` rows."""
+    cursor = conn.execute(query, params)
+    cursor.arraysize = batch_size
+    while rows := cursor.fetchmany():
+        yield rows
+
+
+def write_csv(batches: Iterator[list[tuple]], handle: IO[str]) -> int:
+    writer = csv.writer(handle)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for rows in batches:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_jsonl(batches: Iterator[list[tuple]], handle: IO[str]) -> int:
+    count = 0
+    for rows in batches:
+        handle.write("\n".join([row[0] for row in rows]))
+        handle.write("\n")
+        count += len(rows)
+    return count
+
+
+def write_parquet(batches: Iterator[list[tuple]], destination: Path) -> int:
+    """
+    Write the rows as a zstd compressed Parquet file, one row group per
+    ROW_GROUP_SIZE rows.
+
+    Raises:
+        typer.BadParameter: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise typer.BadParameter(
+            "Parquet export requires pyarrow, install it with: "
+            "pip install 'VehicleVitals[parquet]'",
+            param_hint="--format",
+        )
+
+    schema = pa.schema(
+        (column, getattr(pa, NUMERIC_COLUMNS.get(column, "string"))())
+        for column in EXPORT_COLUMNS
+    )
+
+    def to_batch(rows: list[tuple]):
+        columns = zip(*rows)
+        return pa.record_batch(
+            [pa.array(values, kind) for values, kind in zip(columns, schema.types)],
+            schema=schema,
+        )
+
+    count = 0
+    pending = []
+    with pq.ParquetWriter(destination, schema, compression="zstd") as writer:
+        for rows in batches:
+            pending.append(to_batch(rows))
+            count += len(rows)
+            if sum(batch.num_rows for batch in pending) >= ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_batches(pending, schema))
+                pending.clear()
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema))
+    return count
+
+
+def parse_day(value: str, param_hint: str) -> date | None:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise typer.BadParameter(
+            "Expected a date as YYYY-MM-DD.", param_hint=param_hint
+        )
+
+
+@app.command(name="export")
+def export_logs(
+    destination: Annotated[
+        Path, typer.Argument(help="File to write ('-' for stdout).")
+    ] = Path("-"),
+    file_format: Annotated[
+        ExportFormats,
+        typer.Option(
+            "--format", help="File format (Detected from the extension if blank)."
+        ),
+    ] = None,
+    vehicle_id: Annotated[
+        str,
+        typer.Option(
+            help="Only export this Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
+    ] = "",
+    since: Annotated[
+        str, typer.Option(help="First day to export, YYYY-MM-DD (All if blank).")
+    ] = "",
+    until: Annotated[
+        str, typer.Option(help="Last day to export, YYYY-MM-DD (All if blank).")
+    ] = "",
+    batch_size: Annotated[
+        int, typer.Option(help="Number of rows fetched per batch.", min=1)
+    ] = 10000,
+):
+    """
+    Export log entries with their vehicle to CSV, JSON Lines or Parquet.
+
+    Logs moved to the archive database by `vv db maintain` are exported too. CSV and
+    JSON Lines exports can be read back with vv import. Parquet needs the optional
+    pyarrow package, the parquet extra.
+
+    Examples:
+
+        vv export logs.csv
+
+        vv export logs.parquet --since 2024-01-01 --until 2024-12-31
+
+        vv export --format jsonl --vehicle-id 6a9ab94e | gzip > logs.jsonl.gz
+    """
+    to_stdout = str(destination) == "-"
+    if file_format is None:
+        suffix = destination.suffix.lower()
+        if to_stdout or suffix == ".csv":
+            file_format = ExportFormats.csv
+        elif suffix in (".jsonl", ".ndjson"):
+            file_format = ExportFormats.jsonl
+        elif suffix == ".parquet":
+            file_format = ExportFormats.parquet
+        else:
+            raise typer.BadParameter(
+                "Unable to detect the file format, use --format.", param_hint="--format"
+            )
+    if file_format == ExportFormats.parquet and to_stdout:
+        raise typer.BadParameter(
+            "Parquet can only be written to a file.", param_hint="DESTINATION"
+        )
+
+    query, params = export_query(
+        vehicle_id,
+        parse_day(since, "--since"),
+        parse_day(until, "--until"),
+        as_json=file_format == ExportFormats.jsonl,
+    )
+
+    start = time.perf_counter()
+    with connection() as conn:
+        attach_archive(conn)
+        batches = fetch_batches(conn, query, params, batch_size)
+        if file_format == ExportFormats.parquet:
+            count = write_parquet(batches, destination)
+        else:
+            write = write_csv if file_format == ExportFormats.csv else write_jsonl
+            if to_stdout:
+                count = write(batches, sys.stdout)
+            else:
+                with open(destination, "w", newline="", buffering=1 << 20) as handle:
+                    count = write(batches, handle)
+
+    elapsed = time.perf_counter() - start
+    typer.echo(
+        f"Exported {count:,} log entries in {elapsed:.2f}s "
+        f"({count / elapsed if elapsed else 0:,.0f} rows/sec).",
+        err=True,
+    )
+
+
+if __name__ == "__main__":
+    app()
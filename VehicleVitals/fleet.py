@@ -0,0 +1,534 @@
+"""
+This module contains the functions to query many VehicleVitals databases as one fleet.
+
+The databases of the fleet, for example one per depot, are listed in the environment
+variable VEHICLE_VITALS_FLEET (or .env), separated by os.pathsep (":" on Linux and
+macOS, ";" on Windows). Glob patterns are expanded, e.g. "/srv/depots/*.db". Each
+database is a shard of the fleet, opened read only and named after its file.
+
+Fleet-wide stats and reports never go through the logs of every shard. They read the
+per-vehicle totals each shard already keeps (vehicles, vehicle_stats and
+vehicle_monthly_stats) into one in-memory database and run the usual queries on it,
+so merging the partial aggregates is the same SQL as for a single database. Vehicle
+IDs are uuid4s, so the vehicles of different shards do not collide. A few shards are
+read through ATTACH, larger fleets and exports are read in a process pool, one shard
+per process.
+"""
+import glob
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from dotenv import load_dotenv
+from rich.console import Console
+from rich.table import Table
+
+from .database_utilities import (
+    SCHEMA_VERSION,
+    attach_archive,
+    connect,
+    format_cents,
+)
+from .display import STATS_HEADERS, first_month, stats_display_row, stats_query
+from .export import (
+    ExportFormats,
+    export_query,
+    fetch_batches,
+    parse_day,
+    write_csv,
+    write_jsonl,
+)
+from .report import (
+    Buckets,
+    OutputFormats,
+    report_query,
+    vehicle_names,
+    write_report,
+)
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+FLEET_ENV = "VEHICLE_VITALS_FLEET"
+
+# Fleets up to this many shards are merged through ATTACH on one connection, larger
+# ones in a process pool. SQLite attaches at most 10 databases by default.
+ATTACH_LIMIT = 8
+
+# Tables of per-vehicle totals merged for fleet-wide stats and reports.
+MERGED_TABLES = ("vehicles", "vehicle_stats", "vehicle_monthly_stats")
+
+SHARD_SUMMARY_QUERIES = (
+    ("SELECT count(*) FROM vehicles", ()),
+    ("SELECT count(*), max(EntryTimestamp) FROM logs", ()),
+)
+
+
+class ShardError(ValueError):
+    """A database of the fleet that cannot be read."""
+
+
+def get_fleet_locations() -> list[Path]:
+    """
+    Return the databases of the fleet from VEHICLE_VITALS_FLEET, in the order they
+    are listed, each once.
+
+    Raises:
+        ShardError: If the fleet is not configured or a listed path matches nothing.
+    """
+    env_file = Path(".") / ".env"
+    if env_file.is_file():
+        load_dotenv(dotenv_path=env_file)
+    if not (fleet := os.getenv(FLEET_ENV)):
+        raise ShardError(
+            f"No fleet configured, set {FLEET_ENV} to the database paths separated "
+            f"by {os.pathsep!r}."
+        )
+
+    locations = []
+    for entry in filter(None, (part.strip() for part in fleet.split(os.pathsep))):
+        entry = os.path.expanduser(entry)
+        matches = sorted(glob.glob(entry)) if glob.has_magic(entry) else [entry]
+        if not matches:
+            raise ShardError(f"{entry} does not match any database.")
+        for match in matches:
+            path = Path(match).resolve()
+            if path not in locations:
+                locations.append(path)
+    return locations
+
+
+def quoted(columns) -> str:
+    """Join column names as quoted SQL identifiers."""
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def depot_name(path: Path, paths: list[Path]) -> str:
+    """Name a shard after its file, with its directory if another shard shares it."""
+    if sum(other.stem == path.stem for other in paths) > 1:
+        return f"{path.parent.name}/{path.stem}"
+    return path.stem
+
+
+def open_shard(path: Path | str) -> sqlite3.Connection:
+    """
+    Open a shard read only, checking that it is at the current schema version.
+
+    Raises:
+        ShardError: If the shard cannot be opened or needs `vv db migrate`.
+    """
+    try:
+        conn = connect(path, read_only=True)
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+    except sqlite3.Error as error:
+        raise ShardError(f"{path}: {error}")
+    if version != SCHEMA_VERSION:
+        conn.close()
+        raise ShardError(
+            f"{path} is at schema version {version}, run vv db migrate with "
+            f"VEHICLE_VITALS_DATABASE_LOCATION={path} first."
+        )
+    return conn
+
+
+def read_shard(path: str, queries: tuple[tuple[str, tuple], ...]) -> list[tuple]:
+    """
+    Run queries on one shard, in a worker process of the pool.
+
+    Returns:
+        list[tuple]: The column names and rows of each query, in order.
+    """
+    conn = open_shard(path)
+    try:
+        results = []
+        for query, params in queries:
+            cursor = conn.execute(query, params)
+            columns = tuple(column[0] for column in cursor.description)
+            results.append((columns, cursor.fetchall()))
+        return results
+    finally:
+        conn.close()
+
+
+def map_shards(function: Callable, paths: list[Path], *args, jobs: int = 0) -> list:
+    """
+    Call `function(path, *args)` for every shard, in a process pool of up to `jobs`
+    processes (one per CPU if 0) when there is more than one shard.
+
+    Returns:
+        list: The results in the order of the shards.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(paths))
+    arguments = [list(map(str, paths)), *(repeat(arg) for arg in args)]
+    if jobs <= 1:
+        return list(map(function, *arguments))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(function, *arguments))
+
+
+def merge_shards(paths: list[Path], jobs: int = 0) -> sqlite3.Connection:
+    """
+    Copy the per-vehicle totals (MERGED_TABLES) of every shard into one in-memory
+    database, with the name of its shard in vehicles.depot.
+
+    Args:
+        paths (list[Path]): Databases of the fleet.
+        jobs (int): Processes reading the shards when there are more than
+            ATTACH_LIMIT of them (one per CPU if 0).
+
+    Returns:
+        sqlite3.Connection: The in-memory database, the caller closes it.
+
+    Raises:
+        ShardError: If a shard cannot be read, or a vehicle is in more than one.
+    """
+    merged = sqlite3.connect("file::memory:", uri=True)
+    depots = [depot_name(path, paths) for path in paths]
+    # Columns are always named: a migrated database has the columns added by a
+    # migration last, a new one has them where the table definition puts them.
+    if len(paths) <= ATTACH_LIMIT:
+        for number, path in enumerate(paths):
+            open_shard(path).close()
+            merged.execute(
+                f"ATTACH DATABASE ? AS shard{number}", (f"file:{path}?mode=ro",)
+            )
+        for table in MERGED_TABLES:
+            merged.execute(
+                f"CREATE TABLE {table} AS SELECT * FROM shard0.{table} WHERE 0"
+            )
+            columns = quoted(
+                row[1] for row in merged.execute(f"PRAGMA table_info({table})")
+            )
+            depot = ", depot" if table == "vehicles" else ""
+            if depot:
+                merged.execute("ALTER TABLE vehicles ADD COLUMN depot TEXT")
+            for number, name in enumerate(depots):
+                merged.execute(
+                    f"INSERT INTO {table} ({columns}{depot}) "
+                    f"SELECT {columns}{', ?' if depot else ''} "
+                    f"FROM shard{number}.{table}",
+                    (name,) if depot else (),
+                )
+        merged.commit()
+        for number in range(len(paths)):
+            merged.execute(f"DETACH DATABASE shard{number}")
+    else:
+        queries = tuple((f"SELECT * FROM {table}", ()) for table in MERGED_TABLES)
+        shards = map_shards(read_shard, paths, queries, jobs=jobs)
+        for table, (columns, _) in zip(MERGED_TABLES, shards[0]):
+            depot = ", depot" if table == "vehicles" else ""
+            merged.execute(f"CREATE TABLE {table} ({quoted(columns)}{depot})")
+        for name, results in zip(depots, shards):
+            for table, (columns, rows) in zip(MERGED_TABLES, results):
+                if table == "vehicles":
+                    columns += ("depot",)
+                    rows = [(*row, name) for row in rows]
+                merged.executemany(
+                    f"INSERT INTO {table} ({quoted(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    rows,
+                )
+        merged.commit()
+
+    (shared,) = merged.execute(
+        "SELECT count(*) - count(DISTINCT id) FROM vehicles"
+    ).fetchone()
+    if shared:
+        merged.close()
+        raise ShardError(
+            f"{shared} vehicles are in more than one database of the fleet, is a "
+            "database listed twice under different names?"
+        )
+    merged.executescript(
+        """
+        CREATE INDEX vehicle_stats_idx ON vehicle_stats (VehicleID);
+        CREATE INDEX vehicle_monthly_stats_idx
+            ON vehicle_monthly_stats (VehicleID, month);
+        """
+    )
+    return merged
+
+
+def export_shard(
+    path: str, directory: str, query: str, params: tuple, as_json: bool, batch_size: int
+) -> tuple[str, int]:
+    """
+    Export the logs of one shard to a file of its own in `directory`, in a worker
+    process of the pool.
+
+    Returns:
+        tuple[str, int]: The file written and the number of logs in it.
+    """
+    conn = open_shard(path)
+    try:
+        attach_archive(conn)
+        handle, part = tempfile.mkstemp(dir=directory)
+        with open(handle, "w", newline="", buffering=1 << 20) as output:
+            write = write_jsonl if as_json else write_csv
+            count = write(fetch_batches(conn, query, params, batch_size), output)
+        return part, count
+    finally:
+        conn.close()
+
+
+def fail(error: Exception):
+    typer.echo(f"Error: {error}", err=True)
+    raise typer.Exit(code=1)
+
+
+def fleet_paths() -> list[Path]:
+    try:
+        return get_fleet_locations()
+    except ShardError as error:
+        fail(error)
+
+
+def merged_fleet(jobs: int) -> sqlite3.Connection:
+    try:
+        return merge_shards(fleet_paths(), jobs)
+    except ShardError as error:
+        fail(error)
+
+
+JobsOption = Annotated[
+    int,
+    typer.Option(help="Processes reading the databases (One per CPU if 0).", min=0),
+]
+
+
+@app.callback()
+def callback():
+    """
+    Query every database listed in VEHICLE_VITALS_FLEET as one fleet.
+    """
+
+
+@app.command(name="list")
+def list_shards(jobs: JobsOption = 0):
+    """
+    List the databases of the fleet with their number of vehicles and logs.
+
+    Example:
+        VEHICLE_VITALS_FLEET="depots/*.db" vv fleet list
+    """
+    paths = fleet_paths()
+    try:
+        summaries = map_shards(read_shard, paths, SHARD_SUMMARY_QUERIES, jobs=jobs)
+    except ShardError as error:
+        fail(error)
+
+    table = Table("Depot", "Database", "Vehicles", "Logs", "Last Entry")
+    for path, ((_, vehicles), (_, logs)) in zip(paths, summaries):
+        ((vehicle_count,),), ((log_count, last_entry),) = vehicles, logs
+        table.add_row(
+            depot_name(path, paths),
+            str(path),
+            f"{vehicle_count:,}",
+            f"{log_count:,}",
+            last_entry[:10] if last_entry else "N/A",
+        )
+    Console().print(table)
+
+
+@app.command()
+def stats(
+    months: Annotated[
+        int, typer.Option(help="Totals of the last N months (Lifetime if 0).", min=0)
+    ] = 0,
+    jobs: JobsOption = 0,
+):
+    """
+    View the totals of every vehicle of the fleet by depot, and of the whole fleet.
+
+    Examples:
+
+        vv fleet stats
+
+        vv fleet stats --months 12
+    """
+    merged = merged_fleet(jobs)
+    try:
+        rows = merged.execute(*stats_query(months=months, depot=True)).fetchall()
+    finally:
+        merged.close()
+    if not rows:
+        typer.echo("No stats found.")
+        return
+
+    table = Table("Depot", *STATS_HEADERS)
+    for depot, *row in rows:
+        table.add_row(depot, *stats_display_row(row))
+
+    # The fleet row adds up the vehicles, its miles are the sum of their distances.
+    fuel_ups, gallons, fuel, service, mpg_sum, mpg_count = (
+        sum(row[column] or 0 for row in rows) for column in range(5, 11)
+    )
+    miles = sum((row[12] or 0) - (row[11] or 0) for row in rows)
+    table.add_row(
+        "Fleet",
+        f"{len(rows):,} vehicles",
+        f"{fuel_ups:,}",
+        f"{gallons:,.1f}",
+        format_cents(fuel),
+        format_cents(service),
+        f"{mpg_sum / mpg_count:,.1f}" if mpg_count else "N/A",
+        "",
+        f"${(fuel + service) / 100 / miles:,.2f}" if miles > 0 else "N/A",
+    )
+    if months:
+        typer.echo(f"Since {first_month(months)}:")
+    Console().print(table)
+
+
+@app.command()
+def report(
+    bucket: Annotated[
+        Buckets, typer.Option(help="Period to group the report by.")
+    ] = Buckets.month,
+    by_vehicle: Annotated[
+        bool, typer.Option(help="Report each vehicle separately instead of the fleet.")
+    ] = False,
+    window: Annotated[
+        int, typer.Option(help="Number of periods in the MPG trend average.", min=1)
+    ] = 3,
+    since: Annotated[
+        str, typer.Option(help="First month to report on, YYYY-MM (All if blank).")
+    ] = "",
+    until: Annotated[
+        str, typer.Option(help="Last month to report on, YYYY-MM (All if blank).")
+    ] = "",
+    output: Annotated[
+        OutputFormats, typer.Option("--format", help="Output format.")
+    ] = OutputFormats.table,
+    jobs: JobsOption = 0,
+):
+    """
+    Report costs, miles and the MPG trend of the whole fleet by month, quarter or
+    year, like vv report does for one database.
+
+    Examples:
+
+        vv fleet report --bucket quarter
+
+        vv fleet report --by-vehicle --since 2024-01 --format csv > fleet.csv
+    """
+    merged = merged_fleet(jobs)
+    try:
+        query, params = report_query(bucket, "", by_vehicle, window, since, until)
+        rows = merged.execute(query, params).fetchall()
+        names = {}
+        if output == OutputFormats.table:
+            depots = dict(merged.execute("SELECT id, depot FROM vehicles"))
+            names = {
+                vehicle_id: f"{depots[vehicle_id]}: {name}"
+                for vehicle_id, name in vehicle_names(merged).items()
+            }
+    finally:
+        merged.close()
+    write_report(rows, names, output)
+
+
+@app.command(name="export")
+def export_logs(
+    destination: Annotated[
+        Path, typer.Argument(help="File to write ('-' for stdout).")
+    ] = Path("-"),
+    file_format: Annotated[
+        ExportFormats,
+        typer.Option(
+            "--format", help="csv or jsonl (Detected from the extension if blank)."
+        ),
+    ] = None,
+    since: Annotated[
+        str, typer.Option(help="First day to export, YYYY-MM-DD (All if blank).")
+    ] = "",
+    until: Annotated[
+        str, typer.Option(help="Last day to export, YYYY-MM-DD (All if blank).")
+    ] = "",
+    batch_size: Annotated[
+        int, typer.Option(help="Number of rows fetched per batch.", min=1)
+    ] = 10000,
+    jobs: JobsOption = 0,
+):
+    """
+    Export the logs of every database of the fleet to one CSV or JSON Lines file.
+
+    Each database is exported by its own process, the parts are joined in the order
+    of VEHICLE_VITALS_FLEET.
+
+    Example:
+        vv fleet export fleet.csv --since 2024-01-01
+    """
+    to_stdout = str(destination) == "-"
+    if file_format is None:
+        suffix = destination.suffix.lower()
+        if to_stdout or suffix == ".csv":
+            file_format = ExportFormats.csv
+        elif suffix in (".jsonl", ".ndjson"):
+            file_format = ExportFormats.jsonl
+        else:
+            raise typer.BadParameter(
+                "Unable to detect the file format, use --format.", param_hint="--format"
+            )
+    if file_format == ExportFormats.parquet:
+        raise typer.BadParameter(
+            "The fleet is exported as csv or jsonl.", param_hint="--format"
+        )
+
+    as_json = file_format == ExportFormats.jsonl
+    query, params = export_query(
+        since=parse_day(since, "--since"),
+        until=parse_day(until, "--until"),
+        as_json=as_json,
+    )
+    paths = fleet_paths()
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            parts = map_shards(
+                export_shard,
+                paths,
+                directory,
+                query,
+                params,
+                as_json,
+                batch_size,
+                jobs=jobs,
+            )
+        except ShardError as error:
+            fail(error)
+
+        output = sys.stdout
+        if not to_stdout:
+            output = open(destination, "w", newline="", buffering=1 << 20)
+        try:
+            for number, (part, _) in enumerate(parts):
+                with open(part, newline="") as handle:
+                    if number and not as_json:
+                        handle.readline()  # The header of every part after the first
+                    shutil.copyfileobj(handle, output)
+        finally:
+            if not to_stdout:
+                output.close()
+
+    count = sum(count for _, count in parts)
+    elapsed = time.perf_counter() - start
+    typer.echo(
+        f"Exported {count:,} log entries from {len(paths)} databases in "
+        f"{elapsed:.2f}s ({count / elapsed if elapsed else 0:,.0f} rows/sec).",
+        err=True,
+    )
+
+
+if __name__ == "__main__":
+    app()
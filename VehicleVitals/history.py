@@ -0,0 +1,249 @@
+"""
+This module contains the functions to load the log history of a vehicle as columns.
+
+Analytics that walk a vehicle's whole history (MPG trends, cost per mile, miles per
+day) read it as a VehicleHistory: one compact `array` per column instead of a tuple
+per log, so the history of a vehicle with thousands of logs is a handful of objects.
+Missing values are NaN.
+
+Histories are kept in a small LRU cache, so `vv shell` and `vv serve` read a vehicle's
+logs once and reuse them until the database changes. A connection's PRAGMA
+data_version changes when another connection commits, and its total_changes when it
+writes itself; either clears the cache.
+
+NumPy is not required. When it is installed, VehicleHistory.to_numpy returns the
+columns as NumPy arrays sharing the memory of the cached arrays.
+"""
+import math
+import sqlite3
+import threading
+import weakref
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import date, datetime
+
+# Vehicles whose history is kept in memory, the least recently used is dropped first.
+HISTORY_CACHE_SIZE = 32
+
+# Every log of a vehicle in order, read from logs_vehicle_timestamp_idx without a sort.
+HISTORY_QUERY = """
+    SELECT EntryTimestamp, EntryType, OdometerReading, GallonsFilled, TotalCostCents,
+        MPG
+    FROM logs
+    WHERE VehicleID = ?
+    ORDER BY EntryTimestamp, rowid
+"""
+
+# Days from 0001-01-01 to 1970-01-01, timestamps are stored as days since 1970.
+EPOCH_ORDINAL = 719163
+
+NAN = math.nan
+
+
+@dataclass(frozen=True)
+class VehicleHistory:
+    """
+    Every log of one vehicle, oldest first, as parallel columns. The arrays are shared
+    with the cache and must not be modified.
+
+    Attributes:
+    - vehicle_id: ID of the vehicle.
+    - days: Entry time in days since 1970-01-01 (local time), NaN if unknown.
+    - odometer: Odometer reading, NaN if unknown.
+    - gallons: Gallons filled, NaN for logs that are not fuel ups.
+    - cost_cents: Total cost in cents, 0 if unknown.
+    - mpg: MPG of the fuel up, NaN where it has none.
+    - fuel_up: 1 for fuel ups (EntryType Gas), 0 for other logs.
+    """
+
+    vehicle_id: str
+    days: array
+    odometer: array
+    gallons: array
+    cost_cents: array
+    mpg: array
+    fuel_up: array
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def distance(self) -> float:
+        """Miles between the lowest and the highest odometer reading."""
+        readings = [value for value in self.odometer if not math.isnan(value)]
+        return max(readings) - min(readings) if readings else 0.0
+
+    def cost_per_mile(self) -> float | None:
+        """Fuel and service cost in dollars per mile driven, None without a distance."""
+        miles = self.distance()
+        return sum(self.cost_cents) / 100 / miles if miles > 0 else None
+
+    def miles_per_day(self, days: float = 90) -> float | None:
+        """
+        Miles driven per day over the last `days` days of history, None if they do
+        not span any time or distance.
+        """
+        points = [
+            (day, odometer)
+            for day, odometer in zip(self.days, self.odometer)
+            if not math.isnan(day) and not math.isnan(odometer)
+        ]
+        if not points:
+            return None
+        since = points[-1][0] - days
+        recent = [point for point in points if point[0] >= since]
+        elapsed = recent[-1][0] - recent[0][0]
+        miles = max(odometer for _, odometer in recent) - min(
+            odometer for _, odometer in recent
+        )
+        return miles / elapsed if elapsed > 0 else None
+
+    def mpg_trend(self, window: int = 5) -> list[tuple[int, float, float]]:
+        """
+        Return the MPG of every fuel up that has one with the average of the last
+        `window` of them, as (log index, MPG, rolling MPG) in order.
+        """
+        trend = []
+        recent = deque()
+        total = 0.0
+        for index, mpg in enumerate(self.mpg):
+            if math.isnan(mpg):
+                continue
+            recent.append(mpg)
+            total += mpg
+            if len(recent) > window:
+                total -= recent.popleft()
+            trend.append((index, mpg, total / len(recent)))
+        return trend
+
+    def to_numpy(self) -> dict:
+        """
+        Return the columns as NumPy arrays by name, without copying them.
+
+        Raises:
+            ImportError: If NumPy is not installed.
+        """
+        import numpy
+
+        columns = ("days", "odometer", "gallons", "cost_cents", "mpg", "fuel_up")
+        arrays = {}
+        for name in columns:
+            column = getattr(self, name)
+            values = numpy.frombuffer(column, dtype=column.typecode)
+            # Read only like the cached arrays they share memory with
+            values.flags.writeable = False
+            arrays[name] = values
+        return arrays
+
+
+def to_days(timestamp: str | None) -> float:
+    """Turn an EntryTimestamp into days since 1970-01-01, NaN if it is not set."""
+    if not timestamp:
+        return NAN
+    moment = datetime.fromisoformat(timestamp)
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second
+    return moment.toordinal() - EPOCH_ORDINAL + seconds / 86400
+
+
+def to_date(day: float) -> date | None:
+    """Turn days since 1970-01-01 back into the date, None for NaN."""
+    return None if math.isnan(day) else date.fromordinal(int(day) + EPOCH_ORDINAL)
+
+
+def read_history(conn: sqlite3.Connection, vehicle_id: str) -> VehicleHistory:
+    """
+    Read the history of a vehicle from the database, without the cache.
+
+    Args:
+        conn (sqlite3.Connection): Connection to query.
+        vehicle_id (str): Full ID of the vehicle.
+
+    Returns:
+        VehicleHistory: The vehicle's logs, empty if it has none.
+    """
+    days, odometer, gallons = array("d"), array("d"), array("d")
+    cost_cents, mpg, fuel_up = array("q"), array("d"), array("B")
+    for timestamp, entry_type, reading, filled, cost, value in conn.execute(
+        HISTORY_QUERY, (vehicle_id,)
+    ):
+        days.append(to_days(timestamp))
+        odometer.append(NAN if reading is None else reading)
+        gallons.append(NAN if filled is None else filled)
+        cost_cents.append(cost or 0)
+        mpg.append(NAN if value is None else value)
+        fuel_up.append(entry_type == "Gas")
+    return VehicleHistory(vehicle_id, days, odometer, gallons, cost_cents, mpg, fuel_up)
+
+
+class HistoryCache:
+    """
+    LRU cache of vehicle histories shared by every connection of the process (the
+    shared connection, and the readers of `vv serve`).
+
+    The (data_version, total_changes) of each connection is remembered, a change in
+    either means a commit from another connection or a write through this one, which
+    may have changed any history. The whole cache is cleared then, and when a
+    connection is seen for the first time: telling which vehicles changed would cost
+    a query, and reloading a history is a single index range scan. A rollback undoes
+    changes without a trace in either counter, `forget_histories` is called instead.
+    """
+
+    def __init__(self, size: int = HISTORY_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.histories: OrderedDict[str, VehicleHistory] = OrderedDict()
+        # Weak keys, the cache does not keep the connections of `vv serve` open
+        self.versions = weakref.WeakKeyDictionary()
+        # Bumped by clear, a history read while it ran is not cached.
+        self.generation = 0
+
+    def clear(self):
+        with self.lock:
+            self.histories.clear()
+            self.generation += 1
+
+    def load(self, conn: sqlite3.Connection, vehicle_id: str) -> VehicleHistory:
+        """Return the history of a vehicle, read from the database on a miss."""
+        (data_version,) = conn.execute("PRAGMA data_version").fetchone()
+        version = (data_version, conn.total_changes)
+        with self.lock:
+            # A connection seen for the first time may not have seen the commits the
+            # cached histories predate
+            if self.versions.get(conn) != version:
+                self.histories.clear()
+                self.generation += 1
+            self.versions[conn] = version
+            if history := self.histories.get(vehicle_id):
+                self.histories.move_to_end(vehicle_id)
+                return history
+            generation = self.generation
+
+        history = read_history(conn, vehicle_id)
+        with self.lock:
+            if generation == self.generation:
+                self.histories[vehicle_id] = history
+                while len(self.histories) > self.size:
+                    self.histories.popitem(last=False)
+        return history
+
+
+_cache = HistoryCache()
+
+
+def load_history(conn: sqlite3.Connection, vehicle_id: str) -> VehicleHistory:
+    """
+    Return the history of a vehicle, from the cache while the database is unchanged.
+
+    Args:
+        conn (sqlite3.Connection): Connection to query on a cache miss.
+        vehicle_id (str): Full ID of the vehicle.
+
+    Returns:
+        VehicleHistory: The vehicle's logs, empty if it has none.
+    """
+    return _cache.load(conn, vehicle_id)
+
+
+def forget_histories():
+    """Clear the cache of vehicle histories."""
+    _cache.clear()
@@ -0,0 +1,315 @@
+"""
+This module contains the functions to bulk import historical log entries.
+"""
+import csv
+import json
+import sqlite3
+import sys
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Annotated
+from uuid import uuid4
+
+import typer
+
+from .database_utilities import (
+    connection,
+    natural_key,
+    to_cents,
+    to_mills,
+    to_timestamp,
+)
+from .mpg import recompute_window
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+# Columns of the logs table, in the order they are inserted.
+LOG_COLUMNS = (
+    "ID",
+    "VehicleID",
+    "EntryType",
+    "MPG",
+    "EntryTimestamp",
+    "OdometerReading",
+    "IsFillUp",
+    "CostPerGallonMills",
+    "GallonsFilled",
+    "TotalCostCents",
+    "OctaneRating",
+    "GasBrand",
+    "Location",
+    "EntryTags",
+    "PaymentType",
+    "TirePressure",
+    "Notes",
+    "Services",
+)
+
+# Columns of the export format that are converted rather than copied.
+EXPORT_COLUMNS = LOG_COLUMNS + (
+    "EntryDate",
+    "EntryTime",
+    "CostPerGallon",
+    "TotalCost",
+)
+
+# Rows already in the database (same natural key) are skipped, so importing the same
+# file again adds nothing.
+INSERT_LOG_SQL = f"""
+    INSERT INTO logs ({", ".join(LOG_COLUMNS)}, NaturalKey)
+    VALUES ({", ".join("?" for _ in LOG_COLUMNS)}, ?)
+    ON CONFLICT (NaturalKey) DO NOTHING
+"""
+
+
+class ImportFormats(str, Enum):
+    """
+    Enum class representing the supported import file formats.
+
+    Attributes:
+    - csv: Comma separated values with a header row.
+    - jsonl: One JSON object per line.
+    """
+
+    csv = "csv"
+    jsonl = "jsonl"
+
+
+def read_records(source: Path, file_format: ImportFormats) -> Iterator[dict]:
+    """
+    Stream records from a CSV or JSON Lines file one at a time.
+
+    Args:
+        source (Path): File to read, or "-" for standard input.
+        file_format (ImportFormats): Format of the file.
+
+    Yields:
+        dict: One record per row, keyed by column name.
+
+    Raises:
+        ValueError: If a row or line cannot be parsed, with its line number.
+    """
+    handle = sys.stdin if str(source) == "-" else open(source, newline="")
+    try:
+        if file_format == ImportFormats.csv:
+            reader = csv.DictReader(handle)
+            try:
+                yield from reader
+            except csv.Error as error:
+                raise ValueError(f"Line {reader.line_num}: {error}") from None
+        else:
+            for line_number, line in enumerate(handle, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as error:
+                    raise ValueError(f"Line {line_number}: {error}") from None
+                if not isinstance(record, dict):
+                    raise ValueError(f"Line {line_number}: Not a JSON object")
+                yield record
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def parse_number(value) -> float | None:
+    """
+    Convert an exported value such as "$3.459", "1,234.5" or "" to a float.
+
+    Returns:
+        float | None: The number, or None for a blank value.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = value.strip().replace("$", "").replace(",", "")
+    return float(value) if value else None
+
+
+class ImportTracker:
+    """
+    Track the highest odometer reading and the earliest fuel up of each vehicle, so the
+    vehicle mileage and the MPG can be updated once after the whole input is inserted.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.vehicles: set[str] = set()
+        self.mileage: dict[str, float] = {}
+        self.first_fuel_up: dict[str, tuple[str, float]] = {}
+
+    def check_vehicle(self, vehicle_id: str):
+        """
+        Raise a ValueError for a vehicle that is not in the database, which the
+        foreign key would only report for a whole batch. Each vehicle is looked up once.
+        """
+        if vehicle_id in self.vehicles:
+            return
+        query = "SELECT 1 FROM vehicles WHERE id = ?"
+        if not self.conn.execute(query, (vehicle_id,)).fetchone():
+            raise ValueError(f"Unknown VehicleID {vehicle_id}")
+        self.vehicles.add(vehicle_id)
+
+    def record_odometer(self, vehicle_id: str, odometer: float | None):
+        if odometer is not None and odometer > self.mileage.get(vehicle_id, 0):
+            self.mileage[vehicle_id] = odometer
+
+    def record_fuel_up(self, vehicle_id: str, position: tuple[str, float]):
+        first = self.first_fuel_up.get(vehicle_id)
+        if first is None or position < first:
+            self.first_fuel_up[vehicle_id] = position
+
+
+def to_row(record: dict, tracker: ImportTracker) -> tuple:
+    """
+    Normalize an exported record into a row for the logs table, converting dates,
+    times and dollar amounts the same way as `add_record.fuel_up` and
+    `add_record.service`. The row ends with its natural key.
+    """
+    record = {
+        column: value if (value := record.get(column)) != "" else None
+        for column in EXPORT_COLUMNS
+    }
+    vehicle_id = record["VehicleID"]
+    if not vehicle_id:
+        raise ValueError("Missing VehicleID")
+    tracker.check_vehicle(vehicle_id)
+
+    if record["EntryTimestamp"]:
+        entry_timestamp = datetime.fromisoformat(record["EntryTimestamp"])
+        entry_timestamp = entry_timestamp.isoformat(timespec="seconds")
+    elif record["EntryDate"]:
+        entry_timestamp = to_timestamp(record["EntryDate"], record["EntryTime"])
+    else:
+        raise ValueError("Missing EntryDate")
+
+    odometer = parse_number(record["OdometerReading"])
+    gallons = parse_number(record["GallonsFilled"])
+    cost_per_gallon = parse_number(record["CostPerGallon"])
+    total_cost = parse_number(record["TotalCost"])
+    # `vv export` writes the stored mills and cents instead of dollar amounts
+    if cost_per_gallon is None and record["CostPerGallonMills"] is not None:
+        cost_per_gallon = parse_number(record["CostPerGallonMills"]) / 1000
+    if total_cost is None and record["TotalCostCents"] is not None:
+        total_cost = parse_number(record["TotalCostCents"]) / 100
+
+    if record["EntryType"] == "Gas":
+        if total_cost is None and cost_per_gallon is not None and gallons is not None:
+            total_cost = cost_per_gallon * gallons
+        record["IsFillUp"] = record["IsFillUp"] or "Full"
+        if odometer is not None:
+            tracker.record_fuel_up(vehicle_id, (entry_timestamp, odometer))
+
+    tracker.record_odometer(vehicle_id, odometer)
+
+    record.update(
+        ID=record["ID"] or str(uuid4()),
+        MPG=parse_number(record["MPG"]),
+        EntryTimestamp=entry_timestamp,
+        OdometerReading=odometer,
+        GallonsFilled=gallons,
+        CostPerGallonMills=(
+            None if cost_per_gallon is None else to_mills(cost_per_gallon)
+        ),
+        TotalCostCents=None if total_cost is None else to_cents(total_cost),
+    )
+    key = natural_key(
+        vehicle_id,
+        entry_timestamp,
+        odometer,
+        record["EntryType"],
+        record["TotalCostCents"],
+    )
+    return *(record[column] for column in LOG_COLUMNS), key
+
+
+@app.command(name="import")
+def import_logs(
+    source: Annotated[
+        Path, typer.Argument(help="CSV or JSON Lines file to import ('-' for stdin).")
+    ],
+    file_format: Annotated[
+        ImportFormats,
+        typer.Option(
+            "--format", help="File format (Detected from the extension if blank)."
+        ),
+    ] = None,
+    batch_size: Annotated[
+        int, typer.Option(help="Number of rows inserted per batch.", min=1)
+    ] = 5000,
+):
+    """
+    Import historical fuel and service log entries from a CSV or JSON Lines export.
+
+    Column names match the app export (VehicleID, EntryType, EntryDate, EntryTime,
+    OdometerReading, IsFillUp, CostPerGallon, GallonsFilled, TotalCost, ...),
+    an ISO-8601 EntryTimestamp may be given instead of EntryDate and EntryTime.
+    Rows may be in any order, the MPG of each vehicle is recalculated from its
+    earliest imported fuel up onwards. Entries already in the database are skipped,
+    so an interrupted import can simply be run again.
+
+    Example:
+        vv import fuelly-export.csv --batch-size 10000
+    """
+    if file_format is None:
+        if source.suffix.lower() == ".csv":
+            file_format = ImportFormats.csv
+        elif source.suffix.lower() in (".jsonl", ".ndjson"):
+            file_format = ImportFormats.jsonl
+        else:
+            raise typer.BadParameter(
+                "Unable to detect the file format, use --format.", param_hint="--format"
+            )
+
+    start = time.perf_counter()
+    read = imported = 0
+    with connection() as conn:
+        cursor = conn.cursor()
+        tracker = ImportTracker(conn)
+
+        batch = []
+        try:
+            # Records that cannot be read fail the same way as invalid ones
+            for record in read_records(source, file_format):
+                batch.append(to_row(record, tracker))
+
+                if len(batch) >= batch_size:
+                    cursor.executemany(INSERT_LOG_SQL, batch)
+                    read += len(batch)
+                    imported += cursor.rowcount
+                    batch.clear()
+        except ValueError as error:
+            # Every record before this one was converted
+            typer.echo(f"Record {read + len(batch) + 1}: {error}", err=True)
+            raise typer.Exit(code=1)
+
+        cursor.executemany(INSERT_LOG_SQL, batch)
+        read += len(batch)
+        imported += max(cursor.rowcount, 0)
+
+        for vehicle_id, position in tracker.first_fuel_up.items():
+            recompute_window(conn, vehicle_id, position, to_end=True)
+
+        # Only move the vehicle mileage forward, history may be older than the vehicle.
+        cursor.executemany(
+            "UPDATE vehicles SET mileage = max(mileage, ?) WHERE id = ?",
+            [(mileage, vehicle_id) for vehicle_id, mileage in tracker.mileage.items()],
+        )
+
+    elapsed = time.perf_counter() - start
+    typer.echo(
+        f"Imported {imported:,} log entries for {len(tracker.mileage):,} vehicles "
+        f"in {elapsed:.2f}s ({read / elapsed if elapsed else 0:,.0f} rows/sec)."
+    )
+    if skipped := read - imported:
+        typer.echo(f"Skipped {skipped:,} entries that were already recorded.")
+
+
+if __name__ == "__main__":
+    app()
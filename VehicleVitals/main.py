@@ -1,20 +1,206 @@
 """
 This is the main entry point for the application. It creates the Typer app and
 defines the commands that can be run from the command line.
+
+The subcommand modules are imported only when one of their commands is run, so
+`vv --help`, `vv --version` and every other command only pay for what they use.
 """
+import importlib
+import time
+from pathlib import Path
+from typing import Annotated
+
+import click
 import typer
+from typer.core import TyperCommand, TyperGroup
+
+from VehicleVitals.database_utilities import ensure_schema
+
+# When `vv` was loaded, the time until a command starts is reported as startup by
+# --trace.
+LOADED = time.perf_counter()
+
+# Subcommand name -> (module, Typer app attribute, help text)
+SUBCOMMANDS = {
+    "display": ("VehicleVitals.display", "app", "Display records from the database."),
+    "add": ("VehicleVitals.add_record", "app", "Add records to the database."),
+    "edit": ("VehicleVitals.edit", "app", "Edit records in the database."),
+    "import": (
+        "VehicleVitals.import_records",
+        "app",
+        "Bulk import log entries from a CSV or JSONL file.",
+    ),
+    "search": (
+        "VehicleVitals.search",
+        "app",
+        "Search the notes, locations and services of the logs.",
+    ),
+    "export": (
+        "VehicleVitals.export",
+        "app",
+        "Export log entries to CSV, JSONL or Parquet.",
+    ),
+    "report": (
+        "VehicleVitals.report",
+        "app",
+        "Report costs and MPG by month, quarter or year.",
+    ),
+    "recompute-mpg": (
+        "VehicleVitals.mpg",
+        "app",
+        "Recompute the MPG of every fuel up.",
+    ),
+    "shell": (
+        "VehicleVitals.shell",
+        "app",
+        "Run many commands in one process and transaction.",
+    ),
+    "serve": (
+        "VehicleVitals.server",
+        "app",
+        "Serve the database over a local HTTP/JSON API.",
+    ),
+    "fleet": (
+        "VehicleVitals.fleet",
+        "app",
+        "Query the databases listed in VEHICLE_VITALS_FLEET as one fleet.",
+    ),
+    "db": ("VehicleVitals.manage", "app", "Manage the database (upgrades)."),
+}
+
+# Subcommands that are a single command, e.g. `vv import FILE`. The others are groups
+# even with a single command of their own, e.g. `vv edit vehicle ...`.
+SINGLE_COMMANDS = {
+    "import",
+    "search",
+    "export",
+    "report",
+    "recompute-mpg",
+    "shell",
+    "serve",
+}
+
+
+class LazyGroup(TyperGroup):
+    """
+    Typer group that imports the module behind a subcommand the first time that
+    subcommand is resolved. While the top level help is rendered, placeholder
+    commands carrying the help text are returned so no module is imported.
+    """
+
+    listing_help = False
+    # Commands built so far, `vv shell` resolves the same subcommands many times.
+    loaded: dict[str, click.Command] = {}
+
+    def list_commands(self, ctx: typer.Context) -> list[str]:
+        return list(SUBCOMMANDS)
+
+    def get_command(self, ctx: typer.Context, cmd_name: str):
+        if cmd_name not in SUBCOMMANDS:
+            return None
+        module_name, attribute, help_text = SUBCOMMANDS[cmd_name]
+        if self.listing_help:
+            return TyperCommand(cmd_name, help=help_text)
+        if cmd_name in self.loaded:
+            return self.loaded[cmd_name]
+
+        module = importlib.import_module(module_name)
+        # get_command would turn a group of one command into that command
+        command = typer.main.get_group(getattr(module, attribute))
+        if cmd_name in SINGLE_COMMANDS:
+            (command,) = command.commands.values()
+        command.name = cmd_name
+        command.help = command.help or help_text
+        self.loaded[cmd_name] = command
+        return command
+
+    def format_help(self, ctx: typer.Context, formatter):
+        self.listing_help = True
+        try:
+            super().format_help(ctx, formatter)
+        finally:
+            self.listing_help = False
+
+
+app = typer.Typer(cls=LazyGroup)
+
+
+def version_callback(value: bool):
+    if value:
+        # importlib.metadata is slow to import, only load it when it is needed
+        from importlib.metadata import PackageNotFoundError, version
+
+        try:
+            typer.echo(f"VehicleVitals {version('VehicleVitals')}")
+        except PackageNotFoundError:
+            typer.echo("VehicleVitals (not installed)")
+        raise typer.Exit()
+
 
-import VehicleVitals.add_record as add_record
-import VehicleVitals.display as display
-import VehicleVitals.edit as edit
-from VehicleVitals.database_utilities import initialize_database
+@app.callback()
+def main(
+    ctx: typer.Context,
+    show_version: Annotated[
+        bool,
+        typer.Option(
+            "--version",
+            help="Show the version and exit.",
+            callback=version_callback,
+            is_eager=True,
+        ),
+    ] = False,
+    trace: Annotated[
+        bool,
+        typer.Option(
+            help="Print every SQL statement with its time and rows on stderr.",
+            envvar="VV_TRACE",
+        ),
+    ] = False,
+    trace_plans: Annotated[
+        bool,
+        typer.Option(
+            help="Trace with the query plan of each statement, flagging full scans.",
+            envvar="VV_TRACE_PLANS",
+        ),
+    ] = False,
+    trace_json: Annotated[
+        Path,
+        typer.Option(
+            help="Write the trace to this JSON file instead of stderr.",
+            envvar="VV_TRACE_JSON",
+            dir_okay=False,
+        ),
+    ] = None,
+    profile: Annotated[
+        Path,
+        typer.Option(
+            help="Write cProfile stats of the command to this file (python -m pstats).",
+            envvar="VV_PROFILE",
+            dir_okay=False,
+        ),
+    ] = None,
+):
+    """
+    A tool for monitoring the health and fuel consumption of your vehicles.
+    """
+    if trace or trace_plans or trace_json or profile:
+        # Only loaded when asked for, like the subcommand modules
+        from VehicleVitals.profiling import start_session
 
-initialize_database()  # Initialize the database (Create tables if they don't exist)
+        session = start_session(
+            LOADED,
+            trace=trace,
+            plans=trace_plans,
+            json_path=trace_json,
+            profile_path=profile,
+        )
+        if session is not None:
+            ctx.call_on_close(session.close)
 
-app = typer.Typer()
-app.add_typer(display.app, name="display", help="Display records from the database.")
-app.add_typer(add_record.app, name="add", help="Add records to the database.")
-app.add_typer(edit.app, name="edit", help="Edit records in the database.")
+    # Create or upgrade the tables only if the schema version is behind, the db commands
+    # manage upgrades themselves and the fleet commands read other databases.
+    if ctx.invoked_subcommand not in ("db", "fleet"):
+        ensure_schema()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,434 @@
+"""
+This module contains the functions to manage the database itself.
+"""
+import sqlite3
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from pathlib import Path
+from typing import Annotated, Any
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from .backup import (
+    DEFAULT_KEEP,
+    BackupError,
+    backup_database,
+    backup_directory,
+    backup_name,
+    prune_backups,
+)
+from .database_utilities import (
+    REBUILD_SEARCH_SQL,
+    SCHEMA_VERSION,
+    archive_location,
+    attach_archive,
+    connection,
+    format_cents,
+    get_connection,
+    get_db_location,
+    log_columns,
+)
+from .export import parse_day
+from .migrations import (
+    DEFAULT_BATCH_SIZE,
+    echo_progress,
+    get_schema_version,
+    migrate as run_migrations,
+    pending_migrations,
+)
+from .mpg import recompute_window
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+# Log entries without a natural key, read from logs_natural_key_idx in rowid order:
+# copies of an entry keyed before them (left so by the v0.10 migration) and entries
+# inserted without a key by other tools. The key they would have is computed, not
+# stored.
+UNKEYED_LOGS_QUERY = """
+    SELECT rowid, VehicleID, EntryTimestamp, OdometerReading, EntryType, TotalCostCents,
+        natural_key(
+            VehicleID, EntryTimestamp, OdometerReading, EntryType, TotalCostCents
+        )
+    FROM logs
+    WHERE NaturalKey IS NULL
+    ORDER BY rowid
+"""
+
+KEYED_LOG_QUERY = "SELECT 1 FROM logs WHERE NaturalKey = ?"
+
+# Store the natural key of the unkeyed logs about to be archived. A copy of an entry
+# keyed before it keeps a NULL key (see UNKEYED_LOGS_QUERY).
+KEY_ARCHIVED_LOGS_SQL = """
+    UPDATE OR IGNORE main.logs
+    SET NaturalKey = natural_key(
+        VehicleID, EntryTimestamp, OdometerReading, EntryType, TotalCostCents
+    )
+    WHERE NaturalKey IS NULL AND EntryTimestamp < ?
+"""
+
+UNKEYED_ARCHIVED_LOGS_QUERY = """
+    SELECT COUNT(*) FROM main.logs WHERE NaturalKey IS NULL AND EntryTimestamp < ?
+"""
+
+
+@app.callback()
+def callback():
+    """
+    Manage the database.
+    """
+
+
+@app.command()
+def migrate(
+    batch_size: Annotated[
+        int, typer.Option(help="Number of rows converted per transaction.", min=1)
+    ] = DEFAULT_BATCH_SIZE,
+    status: Annotated[
+        bool, typer.Option(help="Only show the schema version and pending migrations.")
+    ] = False,
+    snapshot: Annotated[
+        bool, typer.Option(help="Back up the database before upgrading it.")
+    ] = True,
+):
+    """
+    Upgrade the database schema to the version used by this release.
+
+    Large data conversions run in batches, each in its own transaction, so other
+    commands are not locked out for the whole upgrade. An interrupted upgrade resumes
+    where it stopped when the command is run again. The database is backed up to
+    backups/ next to it first, the last 7 of these snapshots are kept.
+
+    Example:
+        vv db migrate --batch-size 50000
+    """
+    conn = get_connection()
+    version = get_schema_version(conn)
+    pending = pending_migrations(conn)
+    typer.echo(
+        f"Schema version: {version if version is not None else 'new database'} "
+        f"(current: {SCHEMA_VERSION})"
+    )
+    for migration in pending:
+        typer.echo(f"Pending: {migration.name}")
+    if status:
+        return
+
+    if version == SCHEMA_VERSION:
+        typer.echo("The database is up to date.")
+        return
+
+    applied = run_migrations(
+        conn, batch_size=batch_size, progress=echo_progress, snapshot=snapshot
+    )
+    for migration in applied:
+        typer.echo(f"Applied {migration.name}.")
+    typer.echo(f"The database is at schema version {SCHEMA_VERSION}.")
+
+
+def require_current_schema():
+    """Exit unless the database is at SCHEMA_VERSION, `vv db` does not upgrade it."""
+    if get_schema_version(get_connection()) != SCHEMA_VERSION:
+        typer.echo("The database schema is out of date, run `vv db migrate` first.")
+        raise typer.Exit(code=1)
+
+
+def find_duplicates(
+    conn: sqlite3.Connection,
+) -> tuple[list[tuple], list[tuple[str, int]]]:
+    """
+    Find the log entries that copy another one, in one pass over the entries without
+    a natural key, each looked up in logs_natural_key_idx. The first copy of an entry
+    (lowest rowid) is the original. Nothing is written.
+
+    Returns:
+        tuple[list[tuple], list[tuple[str, int]]]: The duplicates as rows of
+            UNKEYED_LOGS_QUERY, and the (natural key, rowid) of the unkeyed entries
+            that are not duplicates.
+    """
+    duplicates, originals = [], []
+    seen = set()
+    for row in conn.execute(UNKEYED_LOGS_QUERY).fetchall():
+        key = row[-1]
+        if key in seen or conn.execute(KEYED_LOG_QUERY, (key,)).fetchone():
+            duplicates.append(row)
+        else:
+            seen.add(key)
+            originals.append((key, row[0]))
+    return duplicates, originals
+
+
+@app.command()
+def dedupe(
+    delete: Annotated[
+        bool, typer.Option(help="Delete the duplicates instead of only listing them.")
+    ] = False,
+):
+    """
+    Find log entries recorded more than once: the same vehicle, time, odometer
+    reading, entry type and amount. With --delete the copies are deleted, the first
+    entry is kept, and the MPG around deleted fuel ups is recalculated.
+
+    Entries are recorded once from schema version 10 on. The duplicates are the ones
+    recorded before, or inserted without a natural key by other tools. Listing them
+    does not change the database, --delete also stores the natural key of the
+    entries that are kept.
+
+    Example:
+        vv db dedupe --delete
+    """
+    require_current_schema()
+    with connection() as conn:
+        duplicates, originals = find_duplicates(conn)
+        if delete:
+            conn.executemany(
+                "UPDATE logs SET NaturalKey = ? WHERE rowid = ?", originals
+            )
+        if not duplicates:
+            typer.echo("No duplicate log entries found.")
+            return
+
+        per_vehicle = defaultdict(lambda: [0, 0, 0])
+        fuel_ups = defaultdict(list)
+        for _, vehicle_id, timestamp, odometer, entry_type, cents, _ in duplicates:
+            totals = per_vehicle[vehicle_id]
+            totals[0] += 1
+            totals[1] += entry_type == "Gas"
+            totals[2] += cents or 0
+            if entry_type == "Gas" and timestamp and odometer is not None:
+                fuel_ups[vehicle_id].append((timestamp, odometer))
+
+        names = dict(conn.execute("SELECT id, coalesce(name, id) FROM vehicles"))
+        table = Table("Vehicle", "Duplicates", "Fuel Ups", "Cost")
+        for vehicle_id, (count, gas, cents) in per_vehicle.items():
+            table.add_row(
+                names.get(vehicle_id, str(vehicle_id)),
+                f"{count:,}",
+                f"{gas:,}",
+                format_cents(cents),
+            )
+        Console().print(table)
+
+        if not delete:
+            typer.echo(
+                f"{len(duplicates):,} duplicate log entries, delete them with "
+                "`vv db dedupe --delete`."
+            )
+            return
+
+        conn.executemany(
+            "DELETE FROM logs WHERE rowid = ?", [(row[0],) for row in duplicates]
+        )
+        for vehicle_id, positions in fuel_ups.items():
+            recompute_window(conn, vehicle_id, *positions)
+    typer.echo(f"Deleted {len(duplicates):,} duplicate log entries.")
+
+
+def echo_pages(label: str, conn: sqlite3.Connection):
+    """Print the size of the database file in pages, free pages and MiB."""
+    (pages,) = conn.execute("PRAGMA page_count").fetchone()
+    (free,) = conn.execute("PRAGMA freelist_count").fetchone()
+    (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+    typer.echo(
+        f"{label}: {pages:,} pages, {free:,} free, {pages * page_size / 2**20:,.1f} MiB"
+    )
+
+
+def timed(label: str, work: Callable[[], Any]) -> Any:
+    """Run one maintenance step and print how long it took."""
+    start = time.perf_counter()
+    result = work()
+    typer.echo(f"{label} ({time.perf_counter() - start:.2f}s)")
+    return result
+
+
+def archive_logs(conn: sqlite3.Connection, cutoff: str) -> int:
+    """
+    Move the logs before `cutoff` to the archive database, see attach_archive.
+
+    A transaction spanning two databases is not atomic in WAL mode, so the logs are
+    copied in one transaction and deleted in a second one. If the second one does not
+    happen the next run copies nothing new (natural keys) and deletes them. Logs
+    without a natural key get theirs first, and the archive is refused while some are
+    left: duplicates, which would never match the copy made by an interrupted run.
+    The delete triggers leave the stats and parts of the moved logs alone while
+    archive_moves holds the cutoff.
+
+    Returns:
+        int: Number of logs moved.
+
+    Raises:
+        typer.Exit: If logs before the cutoff are duplicates without a natural key.
+    """
+    with conn:
+        conn.execute(KEY_ARCHIVED_LOGS_SQL, (cutoff,))
+    (unkeyed,) = conn.execute(UNKEYED_ARCHIVED_LOGS_QUERY, (cutoff,)).fetchone()
+    if unkeyed:
+        typer.echo(
+            f"{unkeyed:,} logs before {cutoff} are duplicates, delete them with "
+            "`vv db dedupe --delete` first."
+        )
+        raise typer.Exit(code=1)
+
+    attach_archive(conn, create=True)
+    columns = ", ".join(log_columns(conn))
+    with conn:
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO archive.logs ({columns})
+            SELECT {columns} FROM main.logs WHERE EntryTimestamp < ?
+            """,
+            (cutoff,),
+        )
+    with conn:
+        conn.execute("INSERT INTO archive_moves (cutoff) VALUES (?)", (cutoff,))
+        moved = conn.execute(
+            "DELETE FROM main.logs WHERE EntryTimestamp < ?", (cutoff,)
+        ).rowcount
+        conn.execute("DELETE FROM archive_moves")
+    # all_logs again, with the columns the archive may just have gained
+    attach_archive(conn)
+    return moved
+
+
+def vacuum(conn: sqlite3.Connection, full: bool) -> str:
+    """
+    Return the free pages to the file system: incrementally, or with a VACUUM that
+    rebuilds the file when asked to or to turn on incremental auto vacuum. VACUUM may
+    renumber the rowids of logs, the full-text index is rebuilt after it.
+    """
+    (mode,) = conn.execute("PRAGMA auto_vacuum").fetchone()
+    if full or mode != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        with conn:
+            conn.execute(REBUILD_SEARCH_SQL)
+        return "VACUUM, rebuilt the search index"
+    # Each result row of the pragma frees a page
+    conn.execute("PRAGMA incremental_vacuum").fetchall()
+    return "incremental vacuum"
+
+
+@app.command()
+def maintain(
+    archive_before: Annotated[
+        str,
+        typer.Option(
+            help="Move logs before this month (YYYY-MM-DD) to the archive database."
+        ),
+    ] = "",
+    full_vacuum: Annotated[
+        bool, typer.Option(help="Rebuild the whole file with VACUUM.")
+    ] = False,
+):
+    """
+    Check and tidy up the database: a quick integrity check, optionally moving older
+    logs to an archive database, returning free pages to the file system and
+    refreshing the query planner statistics (ANALYZE).
+
+    Archived logs stay in the stats, reports and exports. They are left out of
+    `vv display logs`, `vv search`, the MPG calculation and the vehicle history,
+    which only read the database itself. The archive is VehicleVitals-archive.db
+    next to the database, the cutoff is rounded down to the first of its month.
+
+    Examples:
+
+        vv db maintain
+
+        vv db maintain --archive-before 2015-01-01
+    """
+    day = parse_day(archive_before, "--archive-before")
+    require_current_schema()
+    conn = get_connection()
+    echo_pages("Before", conn)
+
+    problems = timed(
+        "Integrity check",
+        lambda: [row[0] for row in conn.execute("PRAGMA quick_check")],
+    )
+    if problems != ["ok"]:
+        for problem in problems:
+            typer.echo(f"  {problem}")
+        typer.echo("The database is damaged, restore it from a backup.")
+        raise typer.Exit(code=1)
+
+    if day:
+        cutoff = day.replace(day=1).isoformat()
+        moved = timed(
+            f"Archived logs before {cutoff} to "
+            f"{archive_location(get_db_location())}",
+            lambda: archive_logs(conn, cutoff),
+        )
+        typer.echo(f"  {moved:,} logs moved.")
+
+    done = timed("Vacuum", lambda: vacuum(conn, full_vacuum))
+    typer.echo(f"  {done}.")
+    timed("Checkpoint", lambda: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)"))
+    timed("ANALYZE", lambda: conn.executescript("ANALYZE; PRAGMA optimize;"))
+    echo_pages("After", conn)
+
+
+@app.command()
+def backup(
+    directory: Annotated[
+        Path,
+        typer.Option(help="Where to write the backup, backups/ next to the database."),
+    ] = None,
+    compress: Annotated[bool, typer.Option(help="gzip the backup.")] = False,
+    keep: Annotated[
+        int,
+        typer.Option(help="Number of backups to keep, older ones are deleted.", min=1),
+    ] = DEFAULT_KEEP,
+):
+    """
+    Back up the database while it is in use. The backup is copied a few MiB at a time,
+    so other commands and `vv serve` can keep writing while it runs, and it is the
+    database as it was when the backup started. Each backup is checked for damage
+    before it gets its final name, VehicleVitals-YYYYMMDD-HHMMSS.db(.gz).
+
+    To restore one, stop anything using the database, gunzip the backup if it is
+    compressed, copy it over the database and delete the database's -wal and -shm
+    files if they are left.
+
+    Examples:
+
+        vv db backup
+
+        vv db backup --compress --keep 30 --directory /mnt/backups
+    """
+    db_path = get_db_location()
+    if not db_path.exists():
+        typer.echo(f"There is no database at {db_path}.")
+        raise typer.Exit(code=1)
+    directory = directory or backup_directory(db_path)
+    directory.mkdir(parents=True, exist_ok=True)
+    destination = directory / backup_name(db_path, compress=compress)
+
+    def progress(status: int, remaining: int, total: int):
+        typer.echo(
+            f"\rCopied {total - remaining:,} / {total:,} pages",
+            nl=remaining == 0,
+            err=True,
+        )
+
+    start = time.perf_counter()
+    try:
+        pages = backup_database(db_path, destination, compress, progress)
+    except BackupError as error:
+        typer.echo(str(error))
+        raise typer.Exit(code=1)
+    size = destination.stat().st_size / 2**20
+    typer.echo(
+        f"Backed up {pages:,} pages to {destination} ({size:,.1f} MiB, "
+        f"{time.perf_counter() - start:.2f}s), integrity check ok."
+    )
+    deleted = prune_backups(directory, db_path, keep)
+    if deleted:
+        typer.echo(f"Deleted {len(deleted)} older backups.")
+
+
+if __name__ == "__main__":
+    app()
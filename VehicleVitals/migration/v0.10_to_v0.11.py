@@ -0,0 +1,6 @@
+sql = """-- Logs moved to the archive database by `vv db maintain` keep their totals and parts,
+-- the delete triggers are created again with a WHEN clause checking archive_moves.
+CREATE TABLE IF NOT EXISTS "archive_moves" ("cutoff" TEXT NOT NULL);
+DROP TRIGGER IF EXISTS "logs_stats_delete";
+DROP TRIGGER IF EXISTS "logs_parts_delete";
+"""
@@ -27,7 +27,7 @@ CREATE TABLE IF NOT EXISTS "service_type_parts" (
 );
 
 -- Create service types for distinct services
-INSERT INTO service_types (id, name, description, interval_days, interval_miles)
+INSERT OR IGNORE INTO service_types (id, name, description, interval_days, interval_miles)
 VALUES
     ('03EB0F23-65B6-446D-8AED-7BBE42367362', 'Engine Oil', 'Engine oil change', 30, 3000),
     ('1C53EFD2-EE43-4E93-AC48-B5A2BF37C909', 'Fuel Filter', 'Replace fuel filter', 90, 9000),
@@ -35,15 +35,25 @@ VALUES
     ('0768AC11-11CB-46C2-8008-6CEE22AF0330', 'Cabin Air Filter', 'Replace cabin air filter', 180, 18000),
     ('35F07643-0B2B-45B9-AD49-F4D289CDDBBD', 'Gas', 'Gas system check', 365, 36500);
 
+-- Look up service types by name with an index rather than a scan per log row
+CREATE INDEX IF NOT EXISTS "service_types_name_idx" ON "service_types" ("name");
+
 -- Add a new column to the logs table
 ALTER TABLE logs
 ADD COLUMN service_type_id TEXT;
+"""
 
--- Update the service_type_id in the logs table based on the service names
-UPDATE logs
-SET service_type_id = (
-    SELECT id
-    FROM service_types
-    WHERE name = logs.services
-);
-"""
\ No newline at end of file
+# Update the service_type_id in the logs table based on the service names,
+# run by the migration runner in chunks of rowids (:start, :end].
+backfills = [
+    (
+        "logs",
+        """
+        UPDATE logs
+        SET service_type_id = service_types.id
+        FROM service_types
+        WHERE service_types.name = logs.Services
+            AND logs.rowid > :start AND logs.rowid <= :end
+        """,
+    ),
+]
@@ -0,0 +1,45 @@
+sql = """-- Store money as integers and the entry date/time as one sortable ISO-8601 timestamp.
+ALTER TABLE logs ADD COLUMN EntryTimestamp TEXT;
+ALTER TABLE logs ADD COLUMN CostPerGallonMills INTEGER;
+ALTER TABLE logs ADD COLUMN TotalCostCents INTEGER;
+"""
+
+# Convert the existing rows, run by the migration runner in chunks of rowids (:start, :end].
+backfills = [
+    (
+        "logs",
+        """
+        UPDATE logs
+        -- EntryTime was written as "%I:%M %p" (e.g. "01:05 PM"), imports may use 24 hour time.
+        SET EntryTimestamp = EntryDate || 'T' || CASE
+                WHEN EntryTime IS NULL OR instr(EntryTime, ':') = 0 THEN '00:00:00'
+                ELSE printf(
+                    '%02d:%02d:00',
+                    CASE
+                        WHEN upper(EntryTime) LIKE '%PM'
+                            THEN CAST(substr(EntryTime, 1, instr(EntryTime, ':') - 1) AS INTEGER) % 12 + 12
+                        WHEN upper(EntryTime) LIKE '%AM'
+                            THEN CAST(substr(EntryTime, 1, instr(EntryTime, ':') - 1) AS INTEGER) % 12
+                        ELSE CAST(substr(EntryTime, 1, instr(EntryTime, ':') - 1) AS INTEGER)
+                    END,
+                    CAST(substr(EntryTime, instr(EntryTime, ':') + 1, 2) AS INTEGER)
+                )
+            END,
+            -- Costs were written as "$3.459" / "$30.00" strings, fuel prices keep a tenth of a cent.
+            CostPerGallonMills = CAST(round(
+                CAST(nullif(trim(replace(replace(CostPerGallon, '$', ''), ',', '')), '') AS REAL) * 1000
+            ) AS INTEGER),
+            TotalCostCents = CAST(round(
+                CAST(nullif(trim(replace(replace(TotalCost, '$', ''), ',', '')), '') AS REAL) * 100
+            ) AS INTEGER)
+        WHERE rowid > :start AND rowid <= :end
+        """,
+    ),
+]
+
+finalize_sql = """
+ALTER TABLE logs DROP COLUMN EntryDate;
+ALTER TABLE logs DROP COLUMN EntryTime;
+ALTER TABLE logs DROP COLUMN CostPerGallon;
+ALTER TABLE logs DROP COLUMN TotalCost;
+"""
@@ -0,0 +1,69 @@
+sql = """-- Per vehicle totals, kept current by triggers created with the rest of the schema.
+CREATE TABLE IF NOT EXISTS "vehicle_stats" (
+    "VehicleID"     TEXT NOT NULL,
+    "log_count"     INTEGER NOT NULL DEFAULT 0,
+    "fuel_ups"      INTEGER NOT NULL DEFAULT 0,
+    "gallons"       REAL NOT NULL DEFAULT 0,
+    "fuel_cents"    INTEGER NOT NULL DEFAULT 0,
+    "service_cents" INTEGER NOT NULL DEFAULT 0,
+    "mpg_sum"       REAL NOT NULL DEFAULT 0,
+    "mpg_count"     INTEGER NOT NULL DEFAULT 0,
+    "min_odometer"  REAL,
+    "max_odometer"  REAL,
+    "last_entry"    TEXT,
+    PRIMARY KEY("VehicleID")
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS "vehicle_monthly_stats" (
+    "VehicleID"     TEXT NOT NULL,
+    "month"         TEXT NOT NULL,
+    "log_count"     INTEGER NOT NULL DEFAULT 0,
+    "fuel_ups"      INTEGER NOT NULL DEFAULT 0,
+    "gallons"       REAL NOT NULL DEFAULT 0,
+    "fuel_cents"    INTEGER NOT NULL DEFAULT 0,
+    "service_cents" INTEGER NOT NULL DEFAULT 0,
+    "mpg_sum"       REAL NOT NULL DEFAULT 0,
+    "mpg_count"     INTEGER NOT NULL DEFAULT 0,
+    "min_odometer"  REAL,
+    "max_odometer"  REAL,
+    "last_entry"    TEXT,
+    PRIMARY KEY("VehicleID", "month")
+) WITHOUT ROWID;
+
+-- Fill them from the existing logs in one grouped pass.
+DELETE FROM vehicle_monthly_stats;
+DELETE FROM vehicle_stats;
+INSERT INTO vehicle_monthly_stats
+SELECT
+    VehicleID,
+    substr(EntryTimestamp, 1, 7),
+    count(*),
+    sum(EntryType IS 'Gas'),
+    sum(iif(EntryType IS 'Gas', coalesce(GallonsFilled, 0), 0)),
+    sum(iif(EntryType IS 'Gas', coalesce(TotalCostCents, 0), 0)),
+    sum(iif(EntryType IS 'Gas', 0, coalesce(TotalCostCents, 0))),
+    total(MPG),
+    count(MPG),
+    min(OdometerReading),
+    max(OdometerReading),
+    max(EntryTimestamp)
+FROM logs
+WHERE VehicleID IS NOT NULL AND EntryTimestamp IS NOT NULL
+GROUP BY VehicleID, substr(EntryTimestamp, 1, 7);
+
+INSERT INTO vehicle_stats
+SELECT
+    VehicleID,
+    sum(log_count),
+    sum(fuel_ups),
+    sum(gallons),
+    sum(fuel_cents),
+    sum(service_cents),
+    sum(mpg_sum),
+    sum(mpg_count),
+    min(min_odometer),
+    max(max_odometer),
+    max(last_entry)
+FROM vehicle_monthly_stats
+GROUP BY VehicleID;
+"""
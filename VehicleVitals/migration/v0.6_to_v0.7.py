@@ -0,0 +1,11 @@
+sql = """-- Full-text index of the free text columns of logs, kept current by triggers created
+-- with the rest of the schema.
+CREATE VIRTUAL TABLE IF NOT EXISTS "logs_fts" USING fts5(
+    Notes, Location, GasBrand, EntryTags, Services,
+    content='logs', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+-- Index the existing logs in one pass.
+INSERT INTO logs_fts (logs_fts) VALUES ('rebuild');
+"""
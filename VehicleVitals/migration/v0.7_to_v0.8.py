@@ -0,0 +1,12 @@
+sql = """-- Vehicle names identify a vehicle (resolver.py), so they have to be unique. A blank
+-- name is no name, of vehicles sharing a name the first added keeps it and the others
+-- get the start of their ID appended.
+UPDATE vehicles SET name = NULL WHERE trim(name) = '';
+UPDATE vehicles SET name = name || ' (' || substr(id, 1, 8) || ')'
+WHERE name IS NOT NULL AND rowid NOT IN (
+    SELECT min(rowid) FROM vehicles WHERE name IS NOT NULL GROUP BY name
+);
+
+DROP INDEX IF EXISTS "vehicles_name_idx";
+CREATE UNIQUE INDEX IF NOT EXISTS "vehicles_name_idx" ON "vehicles" ("name");
+"""
@@ -0,0 +1,45 @@
+sql = """-- Service entries are linked to their service type by ID. Every type `vv add service`
+-- records gets a service_types row, the ones seeded by v0.2 kept other names.
+INSERT INTO service_types (id, name, description, interval_days, interval_miles)
+SELECT * FROM (
+    VALUES
+    ('8282A7C0-0FA6-455C-9610-A0C5E96551EB', 'Oil Change', 'Change engine oil and filter', 180, 5000),
+    ('899939E4-3842-4CA2-A2E7-D878F9010329', 'Tire Rotation', 'Rotate the tires', 180, 7500),
+    ('AE82DC29-8CE2-4805-9BAE-212C259716E3', 'Air Filter', 'Replace air filter', 365, 15000),
+    ('057666FE-7A4D-4982-B79E-217E830918CC', 'Cabin Filter', 'Replace cabin air filter', 365, 15000),
+    ('6954A847-8C7B-43E4-B9B7-6AD988295654', 'Tire Replacement', 'Replace the tires', 1825, 50000),
+    ('735D2A66-ECF9-4980-A124-7059A27B6327', 'Car Wash', 'Wash the car', 30, NULL),
+    ('656060C1-8579-4245-9AEB-F9622EEB5E3D', 'Car Detailing', 'Detail the car', 180, NULL)
+) AS seed
+WHERE NOT EXISTS (SELECT 1 FROM service_types t WHERE t.name = seed.column2);
+
+-- The parts used by each service entry
+CREATE TABLE IF NOT EXISTS "log_parts" (
+    "log_id"          TEXT NOT NULL,
+    "part_id"         TEXT NOT NULL,
+    "quantity"        REAL NOT NULL DEFAULT 1,
+    "unit_cost_cents" INTEGER,
+    PRIMARY KEY("log_id", "part_id"),
+    FOREIGN KEY ("part_id") REFERENCES "parts" ("id")
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS "logs_id_idx" ON "logs" ("ID");
+CREATE INDEX IF NOT EXISTS "log_parts_part_idx" ON "log_parts" ("part_id");
+CREATE INDEX IF NOT EXISTS "parts_name_idx" ON "parts" ("name");
+"""
+
+# Link the service entries recorded before the types above existed, by the name in
+# Services, run by the migration runner in chunks of rowids (:start, :end].
+backfills = [
+    (
+        "logs",
+        """
+        UPDATE logs
+        SET service_type_id = service_types.id
+        FROM service_types
+        WHERE service_types.name = logs.Services
+            AND logs.service_type_id IS NULL AND logs.EntryType = 'Service'
+            AND logs.rowid > :start AND logs.rowid <= :end
+        """,
+    ),
+]
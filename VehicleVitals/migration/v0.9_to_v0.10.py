@@ -0,0 +1,20 @@
+sql = """-- Every log entry gets a natural key, a hash of what identifies it
+ALTER TABLE logs ADD COLUMN NaturalKey TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS "logs_natural_key_idx" ON "logs" ("NaturalKey");
+"""
+
+# Key the existing entries in rowid order, run by the migration runner in chunks of
+# rowids (:start, :end]. A copy of an entry keyed before it keeps a NULL key, and is
+# removed by `vv db dedupe --delete`.
+backfills = [
+    (
+        "logs",
+        """
+        UPDATE OR IGNORE logs
+        SET NaturalKey = natural_key(
+            VehicleID, EntryTimestamp, OdometerReading, EntryType, TotalCostCents
+        )
+        WHERE rowid > :start AND rowid <= :end AND NaturalKey IS NULL
+        """,
+    ),
+]
@@ -0,0 +1,254 @@
+"""
+This module contains the functions to upgrade the database schema.
+
+Migrations live in the migration directory as `v<from>_to_v<to>.py` scripts, the target
+version (v0.3 -> 3) is the schema version stored in PRAGMA user_version once the
+migration is done. A script defines:
+- sql: Schema changes, run in one transaction.
+- backfills (optional): (table, UPDATE statement) pairs, run in chunks of rowids passed
+  as :start and :end so a large table is never locked for the whole conversion.
+- finalize_sql (optional): Schema changes that need the backfilled data, run in one
+  transaction together with the user_version update.
+
+Progress is recorded in the migration_progress table in the same transaction as each
+step, so an interrupted migration resumes where it stopped. Before the first migration
+the database is backed up to backups/ next to it (backup.snapshot_before_migration).
+"""
+import importlib.util
+import re
+import sqlite3
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+
+import typer
+
+from .backup import snapshot_before_migration
+from .database_utilities import INIT_DATABASE_SQL, SCHEMA_VERSION
+
+MIGRATIONS_DIR = Path(__file__).parent / "migration"
+
+MIGRATION_PROGRESS_SQL = """
+CREATE TABLE IF NOT EXISTS "migration_progress" (
+    "version"    INTEGER NOT NULL,
+    "step"       INTEGER NOT NULL,  -- 0 = sql, 1.. = backfills
+    "last_rowid" INTEGER NOT NULL,
+    PRIMARY KEY ("version", "step")
+);
+"""
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+@dataclass
+class Migration:
+    """
+    A schema migration loaded from the migration directory.
+
+    Attributes:
+    - version: Schema version after the migration.
+    - name: Name of the script, e.g. "v0.2_to_v0.3".
+    - sql: Schema changes run before the backfills.
+    - backfills: (table, statement) pairs run in chunks of rowids.
+    - finalize_sql: Schema changes run after the backfills.
+    """
+
+    version: int
+    name: str
+    sql: str
+    backfills: list[tuple[str, str]] = field(default_factory=list)
+    finalize_sql: str = ""
+
+
+def load_migration(name: str) -> ModuleType:
+    """
+    Load a migration script from the migration directory. The file names contain dots
+    (e.g. v0.2_to_v0.3.py), so they are loaded by path rather than imported.
+    """
+    spec = importlib.util.spec_from_file_location(name, MIGRATIONS_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def discover_migrations() -> list[Migration]:
+    """
+    Find the migration scripts and return them ordered by target schema version.
+
+    Returns:
+        list[Migration]: Migrations, oldest first.
+    """
+    migrations = []
+    for path in MIGRATIONS_DIR.glob("v*_to_v*.py"):
+        match = re.fullmatch(r"v\d+\.\d+_to_v(\d+)\.(\d+)", path.stem)
+        if not match:
+            continue
+        module = load_migration(path.stem)
+        migrations.append(
+            Migration(
+                version=int(match[1]) * 100 + int(match[2]),
+                name=path.stem,
+                sql=module.sql,
+                backfills=getattr(module, "backfills", []),
+                finalize_sql=getattr(module, "finalize_sql", ""),
+            )
+        )
+    return sorted(migrations, key=lambda migration: migration.version)
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int | None:
+    """
+    Return the schema version of the database, None for a new (empty) database.
+    Databases created before PRAGMA user_version was used are recognized by their
+    logs columns.
+    """
+    (version,) = conn.execute("PRAGMA user_version").fetchone()
+    if version:
+        return version
+
+    columns = table_columns(conn, "logs")
+    if not columns:
+        return None
+    if "EntryTimestamp" in columns:
+        return 3
+    if "service_type_id" in columns:
+        return 2
+    return 1
+
+
+def pending_migrations(conn: sqlite3.Connection) -> list[Migration]:
+    """Return the migrations that have not been applied to the database yet."""
+    version = get_schema_version(conn)
+    if version is None:
+        return []
+    return [m for m in discover_migrations() if m.version > version]
+
+
+def run_script(conn: sqlite3.Connection, script: str):
+    """Run a multi statement script in a single transaction."""
+    try:
+        conn.executescript(f"BEGIN;\n{script}\nCOMMIT;")
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def apply_migration(
+    conn: sqlite3.Connection,
+    migration: Migration,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: Callable[[Migration, int, int, int], None] | None = None,
+):
+    """
+    Apply one migration, resuming from the progress recorded by an interrupted run.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        migration (Migration): Migration to apply.
+        batch_size (int): Number of rowids updated per backfill transaction.
+        progress (Callable | None): Called with (migration, step, rows done, rows total)
+            after every backfill chunk.
+    """
+    conn.executescript(MIGRATION_PROGRESS_SQL)
+    done = dict(
+        conn.execute(
+            "SELECT step, last_rowid FROM migration_progress WHERE version = ?",
+            (migration.version,),
+        ).fetchall()
+    )
+
+    if 0 not in done:
+        run_script(
+            conn,
+            f"""{migration.sql};
+            INSERT INTO migration_progress (version, step, last_rowid)
+            VALUES ({migration.version}, 0, 0);""",
+        )
+
+    for step, (table, statement) in enumerate(migration.backfills, 1):
+        last_rowid = done.get(step, 0)
+        (max_rowid,) = conn.execute(f"SELECT max(rowid) FROM {table}").fetchone()
+        while max_rowid and last_rowid < max_rowid:
+            end = last_rowid + batch_size
+            with conn:
+                conn.execute(statement, {"start": last_rowid, "end": end})
+                conn.execute(
+                    """
+                    INSERT INTO migration_progress (version, step, last_rowid)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (version, step)
+                    DO UPDATE SET last_rowid = excluded.last_rowid
+                    """,
+                    (migration.version, step, end),
+                )
+            last_rowid = end
+            if progress:
+                progress(migration, step, min(last_rowid, max_rowid), max_rowid)
+
+    run_script(
+        conn,
+        f"""{migration.finalize_sql};
+        DELETE FROM migration_progress WHERE version = {migration.version};
+        PRAGMA user_version = {migration.version};""",
+    )
+
+
+def echo_progress(migration: Migration, step: int, done: int, total: int):
+    """Report backfill progress on a single, updating line of stderr."""
+    typer.echo(
+        f"\r{migration.name} backfill {step}/{len(migration.backfills)}: "
+        f"{done:,} / {total:,} rows",
+        nl=done >= total,
+        err=True,
+    )
+
+
+def database_file(conn: sqlite3.Connection) -> Path | None:
+    """Return the file of the main database, None for an in-memory database."""
+    for _, name, file in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return Path(file) if file else None
+    return None
+
+
+def migrate(
+    conn: sqlite3.Connection,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: Callable[[Migration, int, int, int], None] | None = None,
+    snapshot: bool = True,
+) -> list[Migration]:
+    """
+    Bring the database up to SCHEMA_VERSION. A new database is created from
+    INIT_DATABASE_SQL, an existing one has its pending migrations applied in order and
+    then gets any tables and indexes added since its last migration.
+
+    Args:
+        snapshot (bool): Back up the database before applying its migrations. An
+            interrupted migration is resumed without another snapshot.
+
+    Returns:
+        list[Migration]: The migrations that were applied.
+    """
+    pending = pending_migrations(conn)
+    path = database_file(conn)
+    # The snapshot of an interrupted migration was taken when it started
+    resumed = table_columns(conn, "migration_progress") and conn.execute(
+        "SELECT 1 FROM migration_progress LIMIT 1"
+    ).fetchone()
+    if pending and snapshot and path and not resumed:
+        typer.echo("Backing up the database before upgrading it...", err=True)
+        typer.echo(f"Backed up to {snapshot_before_migration(path)}", err=True)
+
+    applied = []
+    for migration in pending:
+        apply_migration(conn, migration, batch_size, progress)
+        applied.append(migration)
+
+    run_script(conn, f"{INIT_DATABASE_SQL};\nPRAGMA user_version = {SCHEMA_VERSION};")
+    return applied
@@ -0,0 +1,212 @@
+"""
+This module contains the functions to calculate the MPG of fuel ups.
+
+Fuel ups of a vehicle are ordered by (EntryTimestamp, OdometerReading) and IsFillUp
+decides how each one counts:
+- Full: The tank was filled. MPG is the distance since the previous full tank divided
+  by every gallon pumped since then, partial fills included.
+- Partial: The tank was not filled. The gallons are carried into the next full fill up.
+- Reset: A fill up was missed before this one, so the distance since the previous full
+  tank says nothing about the fuel used. No MPG, the chain restarts here.
+Other values are treated as Partial. A fuel up only affects the MPG of the rows up to
+the next Full or Reset row, so a new or edited fuel up is recomputed within that window.
+"""
+import sqlite3
+import time
+from collections.abc import Iterable
+from typing import Annotated
+
+import typer
+
+from .database_utilities import connection
+from .resolver import vehicle_option
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+FULL = "Full"
+PARTIAL = "Partial"
+RESET = "Reset"
+
+# The last Full or Reset fuel up before a position, where the MPG chain starts.
+ANCHOR_BEFORE_QUERY = """
+    SELECT EntryTimestamp, OdometerReading
+    FROM logs
+    WHERE VehicleID = ? AND EntryType = 'Gas' AND IsFillUp IN ('Full', 'Reset')
+        AND (EntryTimestamp, OdometerReading) < (?, ?)
+    ORDER BY EntryTimestamp DESC, OdometerReading DESC
+    LIMIT 1
+"""
+
+# The first Full or Reset fuel up after a position, the last row whose MPG can change.
+ANCHOR_AFTER_QUERY = """
+    SELECT EntryTimestamp, OdometerReading
+    FROM logs
+    WHERE VehicleID = ? AND EntryType = 'Gas' AND IsFillUp IN ('Full', 'Reset')
+        AND (EntryTimestamp, OdometerReading) > (?, ?)
+    ORDER BY EntryTimestamp, OdometerReading
+    LIMIT 1
+"""
+
+# Vehicles with fuel ups, for a full pass. Reading each vehicle's history with its own
+# index range keeps the rows in order, a single ordered scan of all vehicles would need
+# a sort because EntryType sits between VehicleID and EntryTimestamp in the index.
+FUELED_VEHICLES_QUERY = """
+    SELECT DISTINCT VehicleID FROM logs WHERE EntryType = 'Gas'
+"""
+
+UPDATE_MPG_SQL = "UPDATE logs SET MPG = ? WHERE rowid = ?"
+
+
+def compute_mpg(
+    fuel_ups: Iterable[tuple[float | None, float | None, str | None]],
+) -> list[float | None]:
+    """
+    Calculate the MPG of a vehicle's fuel ups in a single pass. The first fuel up must
+    be the start of a chain (a Full or Reset fuel up, or the vehicle's first fuel up).
+
+    Args:
+        fuel_ups (Iterable): (OdometerReading, GallonsFilled, IsFillUp) in order.
+
+    Returns:
+        list[float | None]: The MPG of each fuel up, None where it has none.
+    """
+    results = []
+    anchor = None  # Odometer reading of the last full tank
+    gallons = 0.0  # Gallons pumped since then
+    for odometer, pumped, is_fill_up in fuel_ups:
+        mpg = None
+        if odometer is None:
+            pass
+        elif is_fill_up == RESET or (anchor is None and is_fill_up == FULL):
+            anchor, gallons = odometer, 0.0
+        elif anchor is not None:
+            gallons += pumped or 0.0
+            if is_fill_up == FULL:
+                if gallons > 0:
+                    mpg = (odometer - anchor) / gallons
+                anchor, gallons = odometer, 0.0
+        results.append(mpg)
+    return results
+
+
+def _changed(old: float | None, new: float | None) -> bool:
+    if old is None or new is None:
+        return old is not new
+    return abs(old - new) > 1e-9
+
+
+def window_query(lower: tuple | None, upper: tuple | None) -> str:
+    """Build the query for a vehicle's fuel ups between two (inclusive) positions."""
+    query = """
+        SELECT rowid, OdometerReading, GallonsFilled, IsFillUp, MPG
+        FROM logs
+        WHERE VehicleID = ? AND EntryType = 'Gas'
+    """
+    if lower:
+        query += " AND (EntryTimestamp, OdometerReading) >= (?, ?)"
+    if upper:
+        query += " AND (EntryTimestamp, OdometerReading) <= (?, ?)"
+    return query + " ORDER BY EntryTimestamp, OdometerReading"
+
+
+def recompute_window(
+    conn: sqlite3.Connection,
+    vehicle_id: str,
+    *positions: tuple[str, float],
+    to_end: bool = False,
+) -> int:
+    """
+    Recompute the MPG of the fuel ups affected by inserting, editing or deleting the
+    fuel ups at the given (EntryTimestamp, OdometerReading) positions: from the full
+    tank before the first position to the next Full or Reset fuel up after the last.
+    Pass the old and the new position of an edited fuel up.
+
+    Args:
+        conn (sqlite3.Connection): Database connection, the caller commits.
+        vehicle_id (str): Vehicle of the fuel ups.
+        positions (tuple[str, float]): Positions of the changed fuel ups.
+        to_end (bool): Recompute up to the vehicle's last fuel up, for batches.
+
+    Returns:
+        int: Number of fuel ups whose MPG changed.
+    """
+    first, last = min(positions), max(positions)
+    lower = conn.execute(ANCHOR_BEFORE_QUERY, (vehicle_id, *first)).fetchone()
+    upper = None
+    if not to_end:
+        upper = conn.execute(ANCHOR_AFTER_QUERY, (vehicle_id, *last)).fetchone()
+
+    params = (vehicle_id, *(lower or ()), *(upper or ()))
+    rows = conn.execute(window_query(lower, upper), params).fetchall()
+    # The full tank the window starts from keeps the MPG of its own, earlier window.
+    return _write_changes(conn, rows, start=1 if lower else 0)
+
+
+def _write_changes(conn: sqlite3.Connection, rows: list[tuple], start: int = 0) -> int:
+    """Compute the MPG of (rowid, odometer, gallons, is_fill_up, mpg) rows in order
+    and update the ones from `start` on that changed."""
+    mpgs = compute_mpg(row[1:4] for row in rows)
+    changes = [
+        (mpg, row[0])
+        for row, mpg in zip(rows[start:], mpgs[start:])
+        if _changed(row[4], mpg)
+    ]
+    conn.executemany(UPDATE_MPG_SQL, changes)
+    return len(changes)
+
+
+def recompute_all(conn: sqlite3.Connection, vehicle_id: str = "") -> tuple[int, int]:
+    """
+    Recompute the MPG of every fuel up, reading each vehicle's history in one ordered
+    query and writing only the values that changed.
+
+    Args:
+        conn (sqlite3.Connection): Database connection, the caller commits.
+        vehicle_id (str): Only recompute this vehicle (All if blank).
+
+    Returns:
+        tuple[int, int]: Number of fuel ups read and number of MPG values changed.
+    """
+    if vehicle_id:
+        vehicle_ids = [vehicle_id]
+    else:
+        vehicle_ids = [row[0] for row in conn.execute(FUELED_VEHICLES_QUERY)]
+
+    read = changed = 0
+    for vehicle_id in vehicle_ids:
+        rows = conn.execute(window_query(None, None), (vehicle_id,)).fetchall()
+        read += len(rows)
+        changed += _write_changes(conn, rows)
+    return read, changed
+
+
+@app.command(name="recompute-mpg")
+def recompute_mpg(
+    vehicle_id: Annotated[
+        str,
+        typer.Option(
+            help="Only recompute this Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
+    ] = "",
+):
+    """
+    Recompute the MPG of every fuel up from the full log history, for example after
+    importing or correcting old entries.
+
+    Example:
+        vv recompute-mpg --vehicle-id 6a9ab94e
+    """
+    start = time.perf_counter()
+    with connection() as conn:
+        read, changed = recompute_all(conn, vehicle_id)
+
+    typer.echo(
+        f"Recomputed {read:,} fuel ups in {time.perf_counter() - start:.2f}s, "
+        f"{changed:,} MPG values changed."
+    )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,350 @@
+"""
+This module contains the functions to trace and profile a `vv` command.
+
+`vv --trace` (or VV_TRACE=1) opens every connection as a TracedConnection. It records
+each SQL statement with how often it ran, its time and the rows it returned or
+changed. With --trace-plans each statement is also run through EXPLAIN QUERY PLAN,
+and full table scans are flagged. `--profile FILE` dumps cProfile stats for the
+whole command, to read with `python -m pstats FILE`.
+
+The summary is printed on stderr when the command ends, or written as JSON with
+--trace-json.
+"""
+import cProfile
+import json
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import typer
+
+from . import database_utilities
+
+# Statements shown in the summary on stderr, the slowest first.
+SUMMARY_STATEMENTS = 10
+
+# Statements EXPLAIN QUERY PLAN can describe.
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+@dataclass
+class StatementStats:
+    """
+    Totals of one SQL statement.
+
+    Attributes:
+    - sql: The statement, whitespace collapsed.
+    - calls: Times it ran (once per parameter set for executemany).
+    - total_ms: Time spent running it and fetching its rows.
+    - max_ms: Slowest single run.
+    - rows: Rows returned by queries, or changed by other statements.
+    - plan: EXPLAIN QUERY PLAN of its first run (--trace-plans).
+    - full_scan: The plan reads a whole table instead of an index.
+    """
+
+    sql: str
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    plan: list[str] = field(default_factory=list)
+    full_scan: bool = False
+
+
+def full_scan(plan: list[str]) -> bool:
+    """
+    Return True if a query plan scans a whole table rather than an index. Scans of
+    subqueries and CTEs, which SQLite builds in memory, do not count.
+    """
+    subqueries = {
+        detail.split(" ", 1)[1]
+        for detail in plan
+        if detail.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+    }
+    for detail in plan:
+        if not detail.startswith("SCAN ") or "USING" in detail:
+            continue
+        name = detail.split()[1]
+        if name in subqueries or name.startswith("(") or name == "CONSTANT":
+            continue
+        if "VIRTUAL TABLE" not in detail:
+            return True
+    return False
+
+
+class Tracer:
+    """Statement totals of every traced connection, shared by threads (vv serve)."""
+
+    def __init__(self, plans: bool = False):
+        self.plans = plans
+        self.lock = threading.Lock()
+        self.statements: dict[str, StatementStats] = {}
+
+    def stats(self, sql: str) -> StatementStats:
+        key = " ".join(sql.split())
+        with self.lock:
+            if key not in self.statements:
+                self.statements[key] = StatementStats(key)
+            return self.statements[key]
+
+    def record(self, stats: StatementStats, seconds: float, rows: int = 0, calls=1):
+        elapsed = seconds * 1000
+        with self.lock:
+            stats.calls += calls
+            stats.total_ms += elapsed
+            stats.max_ms = max(stats.max_ms, elapsed)
+            stats.rows += max(rows, 0)
+
+    def explain(self, conn: sqlite3.Connection, stats: StatementStats, sql, params):
+        """Capture the query plan of a statement the first time it runs."""
+        if not self.plans or stats.plan:
+            return
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return
+        try:
+            cursor = sqlite3.Connection.execute(
+                conn, f"EXPLAIN QUERY PLAN {sql}", params
+            )
+            plan = [row[3] for row in cursor]
+        except sqlite3.Error:
+            return
+        with self.lock:
+            stats.plan = plan
+            stats.full_scan = full_scan(plan)
+
+
+# Tracer of the latest session, its connections keep recording to it once it ended.
+_tracer: Tracer | None = None
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that adds its run and fetch time and its rows to the tracer."""
+
+    stats: StatementStats | None = None
+
+    def _run(self, method, sql: str, params, explain_params, calls: int = 1):
+        self.stats = _tracer.stats(sql)
+        if explain_params is not None:
+            _tracer.explain(self.connection, self.stats, sql, explain_params)
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            rows = self.rowcount if self.description is None else 0
+            _tracer.record(self.stats, time.perf_counter() - start, rows, calls)
+
+    def execute(self, sql: str, parameters=()):
+        return self._run(super().execute, sql, parameters, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        first = seq_of_parameters[0] if seq_of_parameters else None
+        return self._run(
+            super().executemany, sql, seq_of_parameters, first, len(seq_of_parameters)
+        )
+
+    def executescript(self, sql_script: str):
+        self.stats = _tracer.stats(sql_script)
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _tracer.record(self.stats, time.perf_counter() - start)
+
+    def _fetched(self, start: float, rows: int):
+        if self.stats is not None:
+            _tracer.record(self.stats, time.perf_counter() - start, rows, calls=0)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size: int | None = None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0)
+            raise
+        self._fetched(start, 1)
+        return row
+
+
+class TracedConnection(database_utilities.Connection):
+    """
+    Connection whose statements, commits and rollbacks are recorded by the tracer.
+    The statements run by triggers count towards the statement that fired them.
+    """
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str):
+        return self.cursor().executescript(sql_script)
+
+    def _timed(self, name: str, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            _tracer.record(_tracer.stats(name), time.perf_counter() - start)
+
+    def commit(self):
+        return self._timed("COMMIT", super().commit)
+
+    def rollback(self):
+        return self._timed("ROLLBACK", super().rollback)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        name = "COMMIT" if exc_type is None else "ROLLBACK"
+        return self._timed(name, super().__exit__, exc_type, exc_value, traceback)
+
+
+class Session:
+    """
+    Tracing and profiling of one command, from the main callback until its context
+    closes. Commands run by `vv shell` while a session is open belong to it.
+    """
+
+    def __init__(
+        self,
+        loaded: float,
+        trace: bool = False,
+        plans: bool = False,
+        json_path: Path | None = None,
+        profile_path: Path | None = None,
+    ):
+        global _tracer
+        self.loaded = loaded
+        self.started = time.perf_counter()
+        self.json_path = json_path
+        self.profile_path = profile_path
+        self.tracer = None
+        if trace or plans or json_path:
+            self.tracer = _tracer = Tracer(plans=plans)
+            database_utilities.connection_class = TracedConnection
+            # Reopen a shared connection opened before tracing started
+            if not database_utilities.in_batch():
+                database_utilities.close_connection()
+        self.profiler = None
+        if profile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def close(self):
+        global _session
+        _session = None
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            typer.echo(f"Profile written to {self.profile_path}", err=True)
+        if self.tracer is None:
+            return
+        # Connections opened from now on are not traced, the open ones keep recording
+        # to this tracer.
+        database_utilities.connection_class = database_utilities.Connection
+
+        report = self.report()
+        if self.json_path:
+            self.json_path.write_text(json.dumps(report, indent=2) + "\n")
+            typer.echo(f"Trace written to {self.json_path}", err=True)
+        else:
+            print_report(report)
+
+    def report(self) -> dict:
+        """The trace as a JSON serializable dict, the slowest statements first."""
+        now = time.perf_counter()
+        with self.tracer.lock:
+            statements = sorted(
+                (asdict(stats) for stats in self.tracer.statements.values()),
+                key=lambda stats: stats["total_ms"],
+                reverse=True,
+            )
+        for stats in statements:
+            stats["total_ms"] = round(stats["total_ms"], 3)
+            stats["max_ms"] = round(stats["max_ms"], 3)
+        sql_ms = sum(stats["total_ms"] for stats in statements)
+        command_ms = (now - self.started) * 1000
+        return {
+            "command": sys.argv[1:],
+            "total_ms": round((now - self.loaded) * 1000, 3),
+            "startup_ms": round((self.started - self.loaded) * 1000, 3),
+            "command_ms": round(command_ms, 3),
+            "sql_ms": round(sql_ms, 3),
+            "other_ms": round(command_ms - sql_ms, 3),
+            "full_scans": sum(stats["full_scan"] for stats in statements),
+            "statements": statements,
+        }
+
+
+_session: Session | None = None
+
+
+def start_session(loaded: float, **options) -> Session | None:
+    """
+    Start tracing and profiling a command, see Session for the options.
+
+    Args:
+        loaded (float): time.perf_counter() when `vv` was loaded, the time until the
+            session starts is reported as startup.
+
+    Returns:
+        Session | None: The new session, None if one is already open.
+    """
+    global _session
+    if _session is not None:
+        return None
+    _session = Session(loaded, **options)
+    return _session
+
+
+def print_report(report: dict):
+    """Print the summary of a trace on stderr."""
+
+    def echo(text: str = ""):
+        typer.echo(text, err=True)
+
+    statements = report["statements"]
+    echo()
+    echo(
+        f"vv trace: {report['total_ms']:.1f} ms, startup and imports "
+        f"{report['startup_ms']:.1f} ms, SQL {report['sql_ms']:.1f} ms in "
+        f"{sum(s['calls'] for s in statements):,} statements, other Python "
+        f"(output, rendering) {report['other_ms']:.1f} ms"
+    )
+    for stats in statements[:SUMMARY_STATEMENTS]:
+        flag = "  FULL SCAN" if stats["full_scan"] else ""
+        sql = stats["sql"] if len(stats["sql"]) <= 100 else stats["sql"][:97] + "..."
+        echo(
+            f"{stats['total_ms']:9.2f} ms {stats['calls']:6,}x "
+            f"{stats['rows']:8,} rows  {sql}{flag}"
+        )
+        for detail in stats["plan"]:
+            echo(f"{'':34}{detail}")
+    if len(statements) > SUMMARY_STATEMENTS:
+        echo(f"... {len(statements) - SUMMARY_STATEMENTS} more, see --trace-json")
+    if report["full_scans"]:
+        echo(f"{report['full_scans']} statements scan a whole table.")
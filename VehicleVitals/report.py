@@ -0,0 +1,265 @@
+"""
+This module contains the functions to report on fuel and service costs over time.
+
+Reports are read from the monthly totals in vehicle_monthly_stats, so their cost depends
+on the number of vehicles and months rather than on the number of log entries.
+"""
+import csv
+import json
+import sqlite3
+import sys
+from enum import Enum
+from typing import Annotated
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from .database_utilities import connection, format_cents
+from .resolver import vehicle_option
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+
+class Buckets(str, Enum):
+    """
+    Enum class representing the periods a report is grouped by.
+
+    Attributes:
+    - month: Calendar months (2024-03).
+    - quarter: Calendar quarters (2024-Q1).
+    - year: Calendar years (2024).
+    """
+
+    month = "month"
+    quarter = "quarter"
+    year = "year"
+
+
+class OutputFormats(str, Enum):
+    """
+    Enum class representing the report output formats.
+
+    Attributes:
+    - table: Table for the terminal.
+    - json: JSON array of objects, amounts in cents.
+    - csv: Comma separated values with a header row, amounts in cents.
+    """
+
+    table = "table"
+    json = "json"
+    csv = "csv"
+
+
+# SQL expression of the period of a vehicle_monthly_stats.month (YYYY-MM).
+BUCKET_SQL = {
+    Buckets.month: "month",
+    Buckets.quarter: (
+        "substr(month, 1, 4) || '-Q' || ((CAST(substr(month, 6, 2) AS INTEGER) + 2) / 3)"
+    ),
+    Buckets.year: "substr(month, 1, 4)",
+}
+
+REPORT_COLUMNS = (
+    "vehicle",
+    "period",
+    "fuel_cents",
+    "service_cents",
+    "gallons",
+    "miles",
+    "cost_per_mile",
+    "mpg",
+    "mpg_rolling",
+)
+
+
+def report_query(
+    bucket: Buckets = Buckets.month,
+    vehicle_id: str = "",
+    by_vehicle: bool = False,
+    window: int = 3,
+    since: str = "",
+    until: str = "",
+) -> tuple[str, tuple]:
+    """
+    Build the report query. The monthly totals are grouped into periods per vehicle,
+    the miles of a period are the distance from the highest odometer reading of the
+    vehicle's previous period (LAG), then the vehicles are added up unless the report
+    is by vehicle. The MPG trend is the average MPG of the last `window` periods.
+
+    Args:
+        bucket (Buckets): Period to group by.
+        vehicle_id (str): Only report on this vehicle (All if blank).
+        by_vehicle (bool): One row per vehicle and period instead of per period.
+        window (int): Number of periods in the rolling MPG average.
+        since (str): First month (YYYY-MM) to report on (All if blank).
+        until (str): Last month (YYYY-MM) to report on (All if blank).
+
+    Returns:
+        tuple[str, tuple]: The SQL query and its parameters.
+    """
+    params = ()
+    vehicle_filter = ""
+    if vehicle_id:
+        vehicle_filter = "WHERE VehicleID = ?"
+        params += (vehicle_id,)
+
+    # Periods are filtered last, so LAG and the rolling average see earlier periods.
+    period_filter = []
+    if since:
+        period_filter.append("last_month >= ?")
+        params += (since,)
+    if until:
+        period_filter.append("first_month <= ?")
+        params += (until,)
+
+    group = "VehicleID" if by_vehicle or vehicle_id else "'Fleet'"
+    query = f"""
+        WITH periods AS (
+            SELECT VehicleID, {BUCKET_SQL[bucket]} AS period,
+                min(month) AS first_month, max(month) AS last_month,
+                sum(fuel_cents) AS fuel_cents, sum(service_cents) AS service_cents,
+                sum(gallons) AS gallons, sum(mpg_sum) AS mpg_sum,
+                sum(mpg_count) AS mpg_count, min(min_odometer) AS min_odometer,
+                max(max_odometer) AS max_odometer
+            FROM vehicle_monthly_stats
+            {vehicle_filter}
+            GROUP BY VehicleID, period
+        ),
+        vehicle_periods AS (
+            SELECT *, max_odometer - coalesce(
+                lag(max_odometer) OVER (PARTITION BY VehicleID ORDER BY period),
+                min_odometer
+            ) AS miles
+            FROM periods
+        ),
+        report AS (
+            SELECT {group} AS vehicle, period,
+                min(first_month) AS first_month, max(last_month) AS last_month,
+                sum(fuel_cents) AS fuel_cents, sum(service_cents) AS service_cents,
+                sum(gallons) AS gallons, sum(miles) AS miles,
+                sum(mpg_sum) AS mpg_sum, sum(mpg_count) AS mpg_count
+            FROM vehicle_periods
+            GROUP BY vehicle, period
+        ),
+        trend AS (
+            SELECT vehicle, period, first_month, last_month, fuel_cents, service_cents,
+                gallons, miles,
+                (fuel_cents + service_cents) / 100.0 / nullif(miles, 0)
+                    AS cost_per_mile,
+                mpg_sum / nullif(mpg_count, 0) AS mpg,
+                sum(mpg_sum) OVER recent / nullif(sum(mpg_count) OVER recent, 0)
+                    AS mpg_rolling
+            FROM report
+            WINDOW recent AS (
+                PARTITION BY vehicle ORDER BY period
+                ROWS BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW
+            )
+        )
+        SELECT {", ".join(REPORT_COLUMNS)}
+        FROM trend
+        {"WHERE " + " AND ".join(period_filter) if period_filter else ""}
+        ORDER BY vehicle, period
+    """
+    return query, params
+
+
+def vehicle_names(conn: sqlite3.Connection) -> dict[str, str]:
+    """Return the display name (Year Make Model trim) of every vehicle by ID."""
+    return {
+        row[0]: " ".join(str(part) for part in row[1:] if part)
+        for row in conn.execute("SELECT id, Year, Make, Model, trim FROM vehicles")
+    }
+
+
+def print_table(rows: list[tuple], names: dict[str, str]):
+    table = Table(
+        "Vehicle",
+        "Period",
+        "Fuel Cost",
+        "Service Cost",
+        "Gallons",
+        "Miles",
+        "Cost/Mile",
+        "MPG",
+        "MPG Trend",
+    )
+    for vehicle, period, fuel, service, gallons, miles, cost, mpg, trend in rows:
+        table.add_row(
+            names.get(vehicle, vehicle),
+            period,
+            format_cents(fuel),
+            format_cents(service),
+            f"{gallons:,.1f}",
+            f"{miles:,.0f}" if miles is not None else "N/A",
+            f"${cost:,.2f}" if cost is not None else "N/A",
+            f"{mpg:,.1f}" if mpg is not None else "N/A",
+            f"{trend:,.1f}" if trend is not None else "N/A",
+        )
+    Console().print(table)
+
+
+def write_report(rows: list[tuple], names: dict[str, str], output: OutputFormats):
+    """Print the rows of report_query in the chosen output format."""
+    if output == OutputFormats.json:
+        typer.echo(json.dumps([dict(zip(REPORT_COLUMNS, row)) for row in rows]))
+    elif output == OutputFormats.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(REPORT_COLUMNS)
+        writer.writerows(rows)
+    elif rows:
+        print_table(rows, names)
+    else:
+        typer.echo("No logs found for this report.")
+
+
+@app.command()
+def report(
+    bucket: Annotated[
+        Buckets, typer.Option(help="Period to group the report by.")
+    ] = Buckets.month,
+    vehicle_id: Annotated[
+        str,
+        typer.Option(
+            help="Only report on this Vehicle ID or Name (All if blank).",
+            callback=vehicle_option,
+        ),
+    ] = "",
+    by_vehicle: Annotated[
+        bool, typer.Option(help="Report each vehicle separately instead of the fleet.")
+    ] = False,
+    window: Annotated[
+        int, typer.Option(help="Number of periods in the MPG trend average.", min=1)
+    ] = 3,
+    since: Annotated[
+        str, typer.Option(help="First month to report on, YYYY-MM (All if blank).")
+    ] = "",
+    until: Annotated[
+        str, typer.Option(help="Last month to report on, YYYY-MM (All if blank).")
+    ] = "",
+    output: Annotated[
+        OutputFormats, typer.Option("--format", help="Output format.")
+    ] = OutputFormats.table,
+):
+    """
+    Report fuel cost, service cost, gallons, miles, cost per mile and the MPG trend
+    by month, quarter or year, for the whole fleet or each vehicle.
+
+    Examples:
+
+        vv report --bucket year
+
+        vv report --by-vehicle --bucket quarter --since 2023-01
+
+        vv report --vehicle-id 6a9ab94e --format csv > report.csv
+    """
+    query, params = report_query(bucket, vehicle_id, by_vehicle, window, since, until)
+    with connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+        names = vehicle_names(conn) if output == OutputFormats.table else {}
+    write_report(rows, names, output)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,169 @@
+"""
+This module contains the functions to find the vehicle a command refers to.
+
+Every command that takes a vehicle accepts its full ID, a unique start of the ID (the
+README shows the first 8 to 12 characters) or its name. Each is answered from an
+index: the primary key for IDs and ID prefixes (a range of keys) and the unique
+vehicles_name_idx for names.
+
+Resolved vehicles are cached in the process, so `vv shell` and `vv serve` look up a
+vehicle once. The cache is cleared when this process adds or edits a vehicle, and when
+another process commits to the database (PRAGMA data_version).
+"""
+import sqlite3
+import threading
+import weakref
+
+import typer
+
+from .database_utilities import get_connection
+
+# Shorter prefixes are too likely to be a typo of a name to be matched as an ID.
+MIN_PREFIX_LENGTH = 4
+
+# Vehicles listed in the error for an ambiguous prefix.
+MAX_MATCHES_SHOWN = 5
+
+VEHICLE_BY_ID_QUERY = "SELECT id FROM vehicles WHERE id = ?"
+VEHICLE_BY_NAME_QUERY = "SELECT id FROM vehicles WHERE name = ?"
+VEHICLES_BY_PREFIX_QUERY = """
+    SELECT id FROM vehicles WHERE id >= ? AND id < ? ORDER BY id LIMIT ?
+"""
+
+
+class VehicleLookupError(ValueError):
+    """A vehicle reference that does not resolve to exactly one vehicle."""
+
+
+class UnknownVehicleError(VehicleLookupError):
+    """No vehicle has this ID, ID prefix or name."""
+
+
+class AmbiguousVehicleError(VehicleLookupError):
+    """An ID prefix shared by several vehicles."""
+
+    def __init__(self, prefix: str, matches: list[str]):
+        shown = ", ".join(matches[:MAX_MATCHES_SHOWN])
+        more = ", ..." if len(matches) > MAX_MATCHES_SHOWN else ""
+        super().__init__(
+            f"Vehicle ID prefix {prefix} matches more than one vehicle ({shown}{more}),"
+            " use more characters."
+        )
+        self.matches = matches
+
+
+def prefix_range(prefix: str) -> tuple[str, str]:
+    """
+    Return the bounds of the IDs starting with `prefix`, lower included and upper
+    excluded, e.g. "6ce1" -> ("6ce1", "6ce2").
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def find_vehicle(conn: sqlite3.Connection, vehicle: str) -> str:
+    """
+    Look up a vehicle by full ID, then by name, then by ID prefix, without the cache.
+
+    Args:
+        conn (sqlite3.Connection): Connection to query.
+        vehicle (str): ID, ID prefix or name of the vehicle.
+
+    Returns:
+        str: Full ID of the vehicle.
+
+    Raises:
+        UnknownVehicleError: If no vehicle matches.
+        AmbiguousVehicleError: If the prefix matches several vehicles.
+    """
+    for query in (VEHICLE_BY_ID_QUERY, VEHICLE_BY_NAME_QUERY):
+        if row := conn.execute(query, (vehicle,)).fetchone():
+            return row[0]
+
+    # IDs are lower case uuid4 strings
+    prefix = vehicle.lower()
+    if len(prefix) >= MIN_PREFIX_LENGTH:
+        params = (*prefix_range(prefix), MAX_MATCHES_SHOWN + 1)
+        matches = [row[0] for row in conn.execute(VEHICLES_BY_PREFIX_QUERY, params)]
+        if len(matches) == 1:
+            return matches[0]
+        if matches:
+            raise AmbiguousVehicleError(vehicle, matches)
+    raise UnknownVehicleError(f"No vehicle has the ID or name {vehicle}.")
+
+
+class VehicleResolver:
+    """
+    Cache of resolved vehicles shared by every connection of the process (the shared
+    connection, and the writer and readers of `vv serve`).
+
+    The data_version of each connection is remembered: it changes when another
+    connection commits, which may have added or renamed vehicles. The cache is also
+    cleared when a connection is seen for the first time, it may not have seen the
+    commits the cached vehicles predate. Changes made through a connection itself do
+    not change its data_version, insert_vehicle and update_vehicle call `clear`
+    instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vehicles: dict[str, str] = {}
+        # Weak keys, the cache does not keep the connections of `vv serve` open
+        self.versions = weakref.WeakKeyDictionary()
+        # Bumped by clear, a lookup that raced with it is not cached.
+        self.generation = 0
+
+    def clear(self):
+        with self.lock:
+            self.vehicles.clear()
+            self.generation += 1
+
+    def resolve(self, conn: sqlite3.Connection, vehicle: str) -> str:
+        """Return the full ID of a vehicle, see `find_vehicle`."""
+        vehicle = vehicle.strip()
+        (version,) = conn.execute("PRAGMA data_version").fetchone()
+        with self.lock:
+            if self.versions.get(conn) != version:
+                self.vehicles.clear()
+                self.generation += 1
+            self.versions[conn] = version
+            if vehicle_id := self.vehicles.get(vehicle):
+                return vehicle_id
+            generation = self.generation
+
+        vehicle_id = find_vehicle(conn, vehicle)
+        with self.lock:
+            if generation == self.generation:
+                self.vehicles[vehicle] = vehicle_id
+        return vehicle_id
+
+
+_resolver = VehicleResolver()
+
+
+def resolve_vehicle(conn: sqlite3.Connection, vehicle: str) -> str:
+    """
+    Return the full ID of the vehicle with this ID, ID prefix or name.
+
+    Raises:
+        UnknownVehicleError: If no vehicle matches.
+        AmbiguousVehicleError: If the prefix matches several vehicles.
+    """
+    return _resolver.resolve(conn, vehicle)
+
+
+def forget_vehicles():
+    """Clear the cache of resolved vehicles, after vehicles were added or changed."""
+    _resolver.clear()
+
+
+def vehicle_option(value: str | None) -> str | None:
+    """
+    Typer callback turning a vehicle option into the full vehicle ID, a blank value
+    (all vehicles) is passed through.
+    """
+    if not value:
+        return value
+    try:
+        return resolve_vehicle(get_connection(), value)
+    except VehicleLookupError as error:
+        raise typer.BadParameter(str(error))
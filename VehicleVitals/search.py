@@ -0,0 +1,156 @@
+"""
+This module contains the functions to search the free text of log entries.
+
+Notes, locations, gas brands, tags and services are indexed in the logs_fts FTS5 table
+(database_utilities.SEARCH_INDEX_SQL), so a search reads the index rather than every
+log.
+"""
+import math
+import sqlite3
+from typing import Annotated
+
+import typer
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+from .database_utilities import REBUILD_SEARCH_SQL, connection
+from .resolver import vehicle_option
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+# Control characters the snippet marks matches with, replaced by rich markup once the
+# text itself is escaped.
+MATCH_START, MATCH_END = "\x02", "\x03"
+
+
+def literal_query(text: str) -> str:
+    """
+    Quote every word of a search as an FTS5 string, for searches that are not valid
+    FTS5 query syntax (e.g. "5W-30" or "Portland, OR").
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def search_query(
+    vehicle_id: str = "", page_size: int = 10, page: int = 1
+) -> tuple[str, str]:
+    """
+    Build the query for one page of search results, best match first, and the query
+    counting all the results. Both take the FTS5 query as their first parameter and
+    the vehicle ID as the second when one is given.
+
+    Args:
+        vehicle_id (str): Only return logs of this vehicle (All if blank).
+        page_size (int): Number of results per page.
+        page (int): Page number, from 1.
+
+    Returns:
+        tuple[str, str]: The results query and the count query.
+    """
+    vehicle_filter = " AND l.VehicleID = ?" if vehicle_id else ""
+    query = f"""
+        SELECT v.Year, v.Make, v.Model, v.trim, l.EntryTimestamp, l.EntryType,
+            snippet(logs_fts, -1, '{MATCH_START}', '{MATCH_END}', '…', 12)
+        FROM logs_fts
+        JOIN logs l ON l.rowid = logs_fts.rowid
+        LEFT JOIN vehicles v ON v.id = l.VehicleID
+        WHERE logs_fts MATCH ?{vehicle_filter}
+        ORDER BY logs_fts.rank
+        LIMIT {int(page_size)} OFFSET {(int(page) - 1) * int(page_size)}
+    """
+    count_query = f"""
+        SELECT count(*)
+        FROM logs_fts
+        JOIN logs l ON l.rowid = logs_fts.rowid
+        WHERE logs_fts MATCH ?{vehicle_filter}
+    """
+    return query, count_query
+
+
+def highlight(snippet: str) -> str:
+    """Turn the match markers of a snippet into rich markup, escaping the rest."""
+    return (
+        escape(snippet)
+        .replace(MATCH_START, "[bold yellow]")
+        .replace(MATCH_END, "[/bold yellow]")
+    )
+
+
+@app.command()
+def search(
+    text: Annotated[
+        str, typer.Argument(help="Words or FTS5 query to search for.")
+    ] = "",
+    vehicle_id: Annotated[
+        str,
+        typer.Option(
+            help="Only search the logs of this Vehicle ID or Name.",
+            callback=vehicle_option,
+        ),
+    ] = "",
+    page_size: Annotated[
+        int, typer.Option(help="Number of results per page.", min=1)
+    ] = 10,
+    page: Annotated[int, typer.Option(help="Page of results to show.", min=1)] = 1,
+    rebuild: Annotated[
+        bool, typer.Option(help="Rebuild the search index from the logs first.")
+    ] = False,
+):
+    """
+    Search the notes, locations, gas brands, tags and services of the logs, best
+    match first.
+
+    Words match any of those columns, and FTS5 query syntax is supported: "brake
+    noise" for a phrase, brak* for a prefix, OR and NOT, and Notes:brake to search
+    one column. Use --rebuild if the index gets out of step with the logs.
+
+    Examples:
+
+        vv search "brake noise"
+
+        vv search 'Location:portland AND GasBrand:costco' --page 2
+
+        vv search --rebuild
+    """
+    with connection() as conn:
+        if rebuild:
+            conn.execute(REBUILD_SEARCH_SQL)
+            typer.echo("Rebuilt the search index.")
+        if not text:
+            if not rebuild:
+                raise typer.BadParameter("Nothing to search for.", param_hint="TEXT")
+            return
+
+        query, count_query = search_query(vehicle_id, page_size, page)
+        params = (vehicle_id,) if vehicle_id else ()
+        try:
+            results = conn.execute(query, (text, *params)).fetchall()
+        except sqlite3.OperationalError as error:
+            if "fts5" not in str(error):
+                raise
+            # Not FTS5 syntax, search for the words as typed
+            text = literal_query(text)
+            results = conn.execute(query, (text, *params)).fetchall()
+
+        if not results:
+            typer.echo("No matching logs found.")
+            return
+
+        (total,) = conn.execute(count_query, (text, *params)).fetchone()
+
+    typer.echo(f"Page {page} of {math.ceil(total / page_size)} ({total:,} matches):")
+    table = Table("Vehicle", "EntryDate", "EntryType", "Match")
+    for year, make, model, trim, timestamp, entry_type, snippet in results:
+        table.add_row(
+            escape(" ".join(str(part) for part in (year, make, model, trim) if part)),
+            timestamp[:10] if timestamp else "N/A",
+            entry_type,
+            highlight(snippet),
+        )
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    app()
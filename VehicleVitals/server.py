@@ -0,0 +1,608 @@
+"""
+This module contains the functions to serve the database over a local HTTP/JSON API.
+
+Writes go through a single writer thread that commits every write waiting in its
+queue in one transaction (group commit), each write in its own savepoint so a failing
+request does not undo the others. Reads run on a pool of read only connections, which
+WAL lets run alongside the writer.
+
+Routes:
+    GET   /vehicles                 ?vehicle=&page_size=&after=
+    POST  /vehicles                 {"year", "make", "model", "color", "mileage", ...}
+    PATCH /vehicles/{vehicle}       {"mileage", "name", ...}
+    GET   /logs                     ?vehicle_id=&page_size=&after=
+    GET   /trend                    ?vehicle_id=&window=&last=&rate_days=
+    POST  /fuel-ups                 {"vehicle_id", "odometer", "gallons", ...}
+    POST  /services                 {"vehicle_id", "odometer", "service_type", ...}
+    GET   /metrics                  Request latency and group commit counters.
+
+A vehicle is given by its ID, a unique start of its ID or its name (resolver.py).
+Posting a fuel up or service that is already recorded answers 200 with the ID of the
+recorded entry instead of 201, so clients can retry a request safely.
+"""
+import asyncio
+import json
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from typing import Annotated, Any
+from urllib.parse import parse_qs, urlsplit
+
+import typer
+
+from .add_record import (
+    FuelTypes,
+    ServiceTypes,
+    fill_up_status,
+    insert_fuel_up,
+    insert_service,
+    insert_vehicle,
+)
+from .database_utilities import connect, to_timestamp
+from .display import (
+    LOG_FIELDS,
+    LOGS_CURSOR_SIZE,
+    VEHICLE_FIELDS,
+    VEHICLES_CURSOR_SIZE,
+    logs_cursor,
+    logs_query,
+    read_cursor,
+    vehicles_cursor,
+    vehicles_query,
+)
+from .edit import update_vehicle
+from .history import load_history, to_date
+from .resolver import UnknownVehicleError, forget_vehicles, resolve_vehicle
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+HOST = "127.0.0.1"
+MAX_BODY_BYTES = 1024 * 1024
+MAX_PAGE_SIZE = 1000
+
+
+class HTTPError(Exception):
+    """An error response with its status code."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Writer:
+    """
+    Serialize every write on one connection owned by a background thread. The thread
+    takes all the writes queued while the previous transaction committed, up to
+    max_batch, and commits them together.
+    """
+
+    def __init__(self, max_batch: int = 256):
+        self.max_batch = max_batch
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="vv-writer", daemon=True)
+        self.ready = threading.Event()
+        # Why the thread could not open its connection, raised again by start()
+        self.error: Exception | None = None
+        self.commits = 0
+        self.writes = 0
+
+    def start(self):
+        """
+        Start the thread once its connection is open.
+
+        Raises:
+            Exception: The error of opening the connection, e.g. sqlite3.Error.
+        """
+        self.thread.start()
+        # The writer creates the WAL files the read only connections need.
+        self.ready.wait()
+        if self.error is not None:
+            self.thread.join()
+            raise self.error
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def submit(self, work: Callable[[sqlite3.Connection], Any]) -> asyncio.Future:
+        """Queue a write, the future resolves with its result once it is committed."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.put((work, loop, future))
+        return future
+
+    def run(self):
+        try:
+            conn = connect()
+        except Exception as error:
+            self.error = error
+            return
+        finally:
+            self.ready.set()
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [item for item in batch if item is not None]
+            if batch:
+                self.commit(conn, batch)
+        conn.close()
+
+    def commit(self, conn: sqlite3.Connection, batch: list):
+        """
+        Run a batch of writes in one transaction and resolve their futures. A batch
+        that cannot start or commit, e.g. while another process holds the write lock
+        past the busy timeout, fails every write in it and the thread carries on.
+        """
+        try:
+            results = []
+            conn.execute("BEGIN IMMEDIATE")
+            for work, _, _ in batch:
+                conn.execute("SAVEPOINT request")
+                try:
+                    results.append((work(conn), None))
+                    conn.execute("RELEASE request")
+                except Exception as error:
+                    conn.execute("ROLLBACK TO request")
+                    conn.execute("RELEASE request")
+                    results.append((None, error))
+            conn.commit()
+        except Exception as error:
+            typer.echo(f"A batch of {len(batch)} writes failed: {error}", err=True)
+            if conn.in_transaction:
+                conn.rollback()
+            # The batch may have added or renamed vehicles that are now rolled back
+            forget_vehicles()
+            results = [(None, error)] * len(batch)
+        self.commits += 1
+        self.writes += len(batch)
+
+        for (_, loop, future), (result, error) in zip(batch, results):
+            loop.call_soon_threadsafe(resolve, future, result, error)
+
+
+def resolve(future: asyncio.Future, result: Any, error: Exception | None):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class ReadPool:
+    """
+    Run queries on a fixed set of read only connections, each used by one thread of
+    the executor at a time.
+    """
+
+    def __init__(self, size: int = 4):
+        self.connections: queue.SimpleQueue = queue.SimpleQueue()
+        for _ in range(size):
+            self.connections.put(connect(read_only=True, check_same_thread=False))
+        self.size = size
+        self.executor = ThreadPoolExecutor(size, thread_name_prefix="vv-reader")
+
+    def _run(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self.connections.get()
+        try:
+            return work(conn)
+        finally:
+            self.connections.put(conn)
+
+    async def run(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._run, work)
+
+    def close(self):
+        self.executor.shutdown()
+        for _ in range(self.size):
+            self.connections.get().close()
+
+
+class LatencyMetrics:
+    """Count requests per route and keep their most recent latencies."""
+
+    def __init__(self, samples: int = 4096):
+        self.requests: dict[str, int] = defaultdict(int)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=samples))
+
+    def record(self, route: str, seconds: float, status: int):
+        self.requests[route] += 1
+        if status >= 400:
+            self.errors[route] += 1
+        self.latencies[route].append(seconds)
+
+    def summary(self) -> dict:
+        routes = {}
+        for route, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+
+            def percentile(fraction: float) -> float:
+                index = min(len(ordered) - 1, int(fraction * len(ordered)))
+                return round(ordered[index] * 1000, 3)
+
+            routes[route] = {
+                "requests": self.requests[route],
+                "errors": self.errors[route],
+                "p50_ms": percentile(0.5),
+                "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return routes
+
+
+def field(body: dict, name: str, kind: type, default: Any = ...) -> Any:
+    """
+    Read a field of a request body, converted to `kind`.
+
+    Raises:
+        HTTPError: 400 if the field is missing or cannot be converted.
+    """
+    value = body.get(name)
+    if value is None:
+        if default is ...:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Missing field: {name}")
+        return default
+    try:
+        if kind is bool:
+            if not isinstance(value, bool):
+                raise ValueError
+            return value
+        return kind(value)
+    except (TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid value for {name}: {value!r}")
+
+
+def entry_timestamp(body: dict) -> str:
+    now = datetime.now()
+    try:
+        return to_timestamp(
+            field(body, "entry_date", str, now.strftime("%Y-%m-%d")),
+            field(body, "entry_time", str, now.strftime("%H:%M")),
+        )
+    except ValueError as error:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, str(error))
+
+
+def page_size(query: dict) -> int:
+    size = field(query, "page_size", int, 10)
+    if not 0 < size <= MAX_PAGE_SIZE:
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST, f"page_size must be between 1 and {MAX_PAGE_SIZE}"
+        )
+    return size
+
+
+def cursor(query: dict, size: int) -> tuple[int, list]:
+    """Page number and sort key of the `after` cursor, the same as the CLI's."""
+    try:
+        return read_cursor(query.get("after", ""), size)
+    except typer.BadParameter:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid cursor.")
+
+
+class Server:
+    """The HTTP/JSON API, see the module docstring for the routes."""
+
+    def __init__(self, readers: int = 4, max_batch: int = 256):
+        self.writer = Writer(max_batch)
+        self.writer.start()
+        self.readers = ReadPool(readers)
+        self.metrics = LatencyMetrics()
+        self.started = time.time()
+        self.routes = {
+            ("GET", "vehicles"): self.get_vehicles,
+            ("POST", "vehicles"): self.post_vehicle,
+            ("PATCH", "vehicles"): self.patch_vehicle,
+            ("GET", "logs"): self.get_logs,
+            ("GET", "trend"): self.get_trend,
+            ("POST", "fuel-ups"): self.post_fuel_up,
+            ("POST", "services"): self.post_service,
+            ("GET", "metrics"): self.get_metrics,
+        }
+
+    def close(self):
+        self.writer.stop()
+        self.readers.close()
+
+    async def start(self, port: int = 8765) -> asyncio.Server:
+        return await asyncio.start_server(self.handle, HOST, port)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve the requests of one connection, kept alive unless asked otherwise."""
+        try:
+            while request_line := await reader.readline():
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, payload, route = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {}, ""
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    start = time.perf_counter()
+                    status, payload, route = await self.respond(method, target, body)
+                    self.metrics.record(route, time.perf_counter() - start, status)
+                    keep_alive = version == "HTTP/1.1" and (
+                        headers.get("connection", "").lower() != "close"
+                    )
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    "\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(
+        self, method: str, target: str, body: bytes
+    ) -> tuple[HTTPStatus, Any, str]:
+        """
+        Route a request to its handler.
+
+        Returns:
+            tuple[HTTPStatus, Any, str]: Status, JSON payload and the route for metrics.
+        """
+        url = urlsplit(target)
+        resource, _, key = url.path.strip("/").partition("/")
+        route = f"{method} /{resource}" + ("/{key}" if key else "")
+        handler = self.routes.get((method, resource))
+        if handler is None:
+            if any(resource == name for _, name in self.routes):
+                status = HTTPStatus.METHOD_NOT_ALLOWED
+            else:
+                status = HTTPStatus.NOT_FOUND
+            return status, {"error": status.phrase}, route
+
+        try:
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid JSON body.")
+            if not isinstance(data, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected a JSON object.")
+            status, payload = await handler(key=key, query=query, body=data)
+        except HTTPError as error:
+            status, payload = error.status, {"error": str(error)}
+        except UnknownVehicleError as error:
+            status, payload = HTTPStatus.NOT_FOUND, {"error": str(error)}
+        except sqlite3.IntegrityError as error:
+            status, payload = HTTPStatus.CONFLICT, {"error": str(error)}
+        except ValueError as error:
+            status, payload = HTTPStatus.BAD_REQUEST, {"error": str(error)}
+        except Exception as error:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)}
+        return status, payload, route
+
+    async def get_vehicles(self, query: dict, **_) -> tuple[HTTPStatus, Any]:
+        size = page_size(query)
+        vehicle = query.get("vehicle", "")
+        page, after = cursor(query, VEHICLES_CURSOR_SIZE)
+
+        def read(conn: sqlite3.Connection) -> list[tuple]:
+            vehicle_id = resolve_vehicle(conn, vehicle) if vehicle else ""
+            return conn.execute(*vehicles_query(size, vehicle_id, after)).fetchall()
+
+        rows = await self.readers.run(read)
+        vehicles = [dict(zip(VEHICLE_FIELDS, row)) for row in rows]
+        after = None
+        if len(rows) == size:
+            after = vehicles_cursor(page, rows[-1])
+        return HTTPStatus.OK, {"vehicles": vehicles, "after": after}
+
+    async def get_logs(self, query: dict, **_) -> tuple[HTTPStatus, Any]:
+        size = page_size(query)
+        vehicle = query.get("vehicle_id", "")
+        page, after = cursor(query, LOGS_CURSOR_SIZE)
+
+        def read(conn: sqlite3.Connection) -> list[tuple]:
+            vehicle_id = resolve_vehicle(conn, vehicle) if vehicle else ""
+            return conn.execute(*logs_query(size, vehicle_id, after)).fetchall()
+
+        rows = await self.readers.run(read)
+        logs = [dict(zip(LOG_FIELDS, row)) for row in rows]
+        after = None
+        if len(rows) == size:
+            after = logs_cursor(page, rows[-1])
+        return HTTPStatus.OK, {"logs": logs, "after": after}
+
+    async def get_trend(self, query: dict, **_) -> tuple[HTTPStatus, Any]:
+        vehicle = field(query, "vehicle_id", str)
+        window = field(query, "window", int, 5)
+        last = field(query, "last", int, 10)
+        rate_days = field(query, "rate_days", int, 90)
+        if min(window, last, rate_days) < 1:
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST, "window, last and rate_days must be positive"
+            )
+
+        def read(conn: sqlite3.Connection) -> dict:
+            # The history is cached between requests, only a miss reads the logs
+            history = load_history(conn, resolve_vehicle(conn, vehicle))
+            fuel_ups = []
+            for index, mpg, rolling in history.mpg_trend(window)[-last:]:
+                entry_date = to_date(history.days[index])
+                gallons = history.gallons[index]
+                fuel_ups.append(
+                    {
+                        "entry_date": entry_date.isoformat() if entry_date else None,
+                        "odometer": history.odometer[index],
+                        # NaN is not valid JSON
+                        "gallons": None if math.isnan(gallons) else gallons,
+                        "mpg": mpg,
+                        "mpg_rolling": rolling,
+                    }
+                )
+            return {
+                "vehicle_id": history.vehicle_id,
+                "fuel_ups": fuel_ups,
+                "cost_per_mile": history.cost_per_mile(),
+                "miles_per_day": history.miles_per_day(rate_days),
+            }
+
+        return HTTPStatus.OK, await self.readers.run(read)
+
+    async def post_vehicle(self, body: dict, **_) -> tuple[HTTPStatus, Any]:
+        values = (
+            field(body, "year", int),
+            field(body, "make", str),
+            field(body, "model", str),
+            field(body, "color", str),
+            field(body, "mileage", float),
+            field(body, "name", str, None),
+            field(body, "trim", str, None),
+            field(body, "engine", str, None),
+        )
+        vehicle_id = await self.writer.submit(
+            lambda conn: insert_vehicle(conn, *values)
+        )
+        return HTTPStatus.CREATED, {"id": vehicle_id}
+
+    async def patch_vehicle(self, key: str, body: dict, **_) -> tuple[HTTPStatus, Any]:
+        if not key:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "PATCH /vehicles/{vehicle}")
+        kinds = dict(
+            year=int,
+            make=str,
+            model=str,
+            color=str,
+            mileage=float,
+            name=str,
+            trim=str,
+            engine=str,
+        )
+        values = {name: field(body, name, kind, None) for name, kind in kinds.items()}
+        updated = await self.writer.submit(
+            lambda conn: update_vehicle(conn, resolve_vehicle(conn, key), **values)
+        )
+        if not updated:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Vehicle not found: {key}")
+        return HTTPStatus.OK, {"updated": updated}
+
+    async def post_fuel_up(self, body: dict, **_) -> tuple[HTTPStatus, Any]:
+        vehicle = field(body, "vehicle_id", str)
+        values = dict(
+            odometer=field(body, "odometer", float),
+            gallons=field(body, "gallons", float),
+            cost_per_gallon=field(body, "cost_per_gallon", float),
+            entry_timestamp=entry_timestamp(body),
+            is_fill_up=fill_up_status(
+                field(body, "filled_up", bool, True),
+                field(body, "missed_last_fill_up", bool, False),
+            ),
+            fuel_type=field(body, "fuel_type", FuelTypes, FuelTypes.premium),
+            location=field(body, "location", str, "Home"),
+        )
+        log_id, added = await self.writer.submit(
+            lambda conn: insert_fuel_up(
+                conn, **values, vehicle_id=resolve_vehicle(conn, vehicle)
+            )
+        )
+        # A retried request gets the entry it recorded the first time
+        return HTTPStatus.CREATED if added else HTTPStatus.OK, {"id": log_id}
+
+    async def post_service(self, body: dict, **_) -> tuple[HTTPStatus, Any]:
+        vehicle = field(body, "vehicle_id", str)
+        values = dict(
+            odometer=field(body, "odometer", float),
+            service_type=field(body, "service_type", ServiceTypes),
+            cost=field(body, "cost", float),
+            entry_timestamp=entry_timestamp(body),
+            location=field(body, "location", str, None),
+        )
+        log_id, added = await self.writer.submit(
+            lambda conn: insert_service(
+                conn, **values, vehicle_id=resolve_vehicle(conn, vehicle)
+            )
+        )
+        # A retried request gets the entry it recorded the first time
+        return HTTPStatus.CREATED if added else HTTPStatus.OK, {"id": log_id}
+
+    async def get_metrics(self, **_) -> tuple[HTTPStatus, Any]:
+        writer = self.writer
+        return HTTPStatus.OK, {
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "routes": self.metrics.summary(),
+            "writes": writer.writes,
+            "commits": writer.commits,
+            "writes_per_commit": round(writer.writes / writer.commits, 2)
+            if writer.commits
+            else None,
+        }
+
+
+async def serve_forever(port: int, readers: int, max_batch: int):
+    server = Server(readers, max_batch)
+    try:
+        listener = await server.start(port)
+        typer.echo(f"Serving on http://{HOST}:{port} (Ctrl+C to stop)")
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+@app.command()
+def serve(
+    port: Annotated[
+        int, typer.Option(help="Port to listen on (localhost only).")
+    ] = 8765,
+    readers: Annotated[
+        int, typer.Option(help="Number of read only connections.", min=1)
+    ] = 4,
+    max_batch: Annotated[
+        int, typer.Option(help="Most writes committed in one transaction.", min=1)
+    ] = 256,
+):
+    """
+    Serve the database over a JSON API on localhost, for kiosks and dashboards that
+    read and write concurrently. Request latencies are reported at /metrics.
+
+    Example:
+        vv serve --port 8765
+
+        curl -X POST localhost:8765/fuel-ups -d '{"vehicle_id": "...", "odometer":
+        1000, "gallons": 10.0, "cost_per_gallon": 2.50}'
+    """
+    try:
+        asyncio.run(serve_forever(port, readers, max_batch))
+    except KeyboardInterrupt:
+        typer.echo("Stopped.")
+    except sqlite3.Error as error:
+        typer.echo(f"Error: {error}", err=True)
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
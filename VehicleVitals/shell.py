@@ -0,0 +1,208 @@
+"""
+This module contains the functions to run many commands in one process.
+
+`vv shell` imports the command modules and opens the database once, so every command
+after the first only pays for its own queries instead of Python startup, imports and
+a new connection.
+"""
+import shlex
+import sys
+import time
+from collections.abc import Iterable
+from typing import Annotated
+
+import click
+import typer
+
+from .database_utilities import begin_batch, end_batch, in_batch
+from .history import forget_histories
+from .resolver import forget_vehicles
+
+# Create the Typer app
+app = typer.Typer(add_completion=False)
+
+PROMPT = "vv> "
+
+SHELL_HELP = """\
+Run any vv command without the leading "vv", e.g. add fuel-up --vehicle-id ...
+    begin       Group the following commands into one transaction.
+    commit      Commit the commands since begin.
+    rollback    Undo the commands since begin.
+    help        Show this help, "--help" after a command shows the command's help.
+    exit        Leave the shell, an open transaction is committed.
+Lines starting with # are comments.\
+"""
+
+# Commands that cannot run inside the shell, or not inside an open transaction.
+NOT_IN_SHELL = {"shell"}
+NOT_IN_BATCH = {"db"}
+
+
+class Shell:
+    """
+    Dispatch command lines to the main `vv` command within this process, keeping
+    track of the transaction opened by `begin`.
+    """
+
+    def __init__(self, timing: bool = False):
+        # main imports this module lazily, so it is loaded by the time a shell runs
+        from .main import app as main_app
+
+        self.command = typer.main.get_command(main_app)
+        self.timing = timing
+
+    def run_line(self, line: str) -> int:
+        """
+        Run one line of input.
+
+        Returns:
+            int: Exit code of the command, 0 for success.
+        """
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as error:
+            typer.echo(f"Error: {error}", err=True)
+            return 2
+        if not args:
+            return 0
+
+        keyword = args[0].lower()
+        if keyword in ("exit", "quit"):
+            raise EOFError
+        if keyword == "help":
+            typer.echo(SHELL_HELP)
+            return 0
+        if keyword == "begin":
+            begin_batch()
+            return 0
+        if keyword in ("commit", "rollback"):
+            if not in_batch():
+                typer.echo(f"Error: {keyword} without begin.", err=True)
+                return 1
+            end_batch(commit=keyword == "commit")
+            if keyword == "rollback":
+                # Vehicles and logs added or changed since begin are gone again
+                forget_vehicles()
+                forget_histories()
+            return 0
+        if keyword in NOT_IN_SHELL:
+            typer.echo(f"Error: {keyword} cannot run inside the shell.", err=True)
+            return 1
+        if keyword in NOT_IN_BATCH and in_batch():
+            typer.echo(f"Error: commit or rollback before running {keyword}.", err=True)
+            return 1
+
+        start = time.perf_counter()
+        code = self.dispatch(args)
+        if self.timing:
+            elapsed = (time.perf_counter() - start) * 1000
+            typer.echo(f"({elapsed:.2f} ms)", err=True)
+        return code
+
+    def dispatch(self, args: list[str]) -> int:
+        try:
+            result = self.command.main(args, prog_name="vv", standalone_mode=False)
+        except click.ClickException as error:
+            error.show()
+            return error.exit_code
+        except click.Abort:
+            typer.echo("Aborted!", err=True)
+            return 1
+        except Exception as error:
+            typer.echo(f"Error: {error}", err=True)
+            return 1
+        return result if isinstance(result, int) else 0
+
+    def run(self, lines: Iterable[str], stop_on_error: bool = False) -> int:
+        """
+        Run lines until they run out or `exit`, then commit an open transaction.
+        With stop_on_error the first failing command rolls back the open transaction
+        and ends the run.
+
+        Returns:
+            int: Exit code of the last failing command, 0 if every command succeeded.
+        """
+        status = 0
+        try:
+            for line in lines:
+                code = self.run_line(line)
+                if code:
+                    status = code
+                    if stop_on_error:
+                        end_batch(commit=False)
+                        forget_vehicles()
+                        forget_histories()
+                        return status
+        except EOFError:
+            pass
+        end_batch(commit=True)
+        return status
+
+
+def prompt_lines() -> Iterable[str]:
+    """Yield lines typed at the prompt, with line editing and history if available."""
+    try:
+        import readline  # noqa: F401, enables history and editing for input()
+    except ImportError:
+        pass
+    while True:
+        try:
+            yield input(PROMPT)
+        except KeyboardInterrupt:
+            typer.echo()
+        except EOFError:
+            typer.echo()
+            return
+
+
+@app.command()
+def shell(
+    batch: Annotated[
+        bool,
+        typer.Option(help="Run all commands in one transaction, like begin."),
+    ] = False,
+    timing: Annotated[
+        bool, typer.Option(help="Show how long each command took.")
+    ] = False,
+    stop_on_error: Annotated[
+        bool,
+        typer.Option(
+            help="Stop at the first failing command and undo the open transaction "
+            "(Default when commands are piped in)."
+        ),
+    ] = None,
+):
+    """
+    Run vv commands one after another in a single process. Commands are typed at the
+    prompt, or read one per line from standard input when it is not a terminal.
+
+    Use begin and commit (or --batch) to write many records in one transaction, a
+    failing command inside a transaction is undone on its own. Pass --no-confirm to
+    commands that ask for confirmation when reading commands from standard input.
+
+    Examples:
+
+        vv shell
+
+        vv shell --batch < fuel-ups.txt
+    """
+    interactive = sys.stdin.isatty()
+    if stop_on_error is None:
+        stop_on_error = not interactive
+
+    runner = Shell(timing=timing)
+    if batch:
+        begin_batch()
+    if interactive:
+        typer.echo('VehicleVitals shell, type "help" for help and "exit" to leave.')
+        lines = prompt_lines()
+    else:
+        lines = sys.stdin
+
+    status = runner.run(lines, stop_on_error=stop_on_error)
+    if status and not interactive:
+        raise typer.Exit(code=status)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,90 @@
+"""
+Compare the tuned connection from `database_utilities.connect` with a default
+`sqlite3.connect` connection.
+
+Each variant gets its own temporary database and runs the same work:
+- single row inserts, each committed in its own transaction (like `vv add fuel-up`),
+- a read of the newest logs while another connection holds an open write transaction.
+
+Usage:
+    python -m benchmarks.connection --inserts 2000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from VehicleVitals.database_utilities import (
+    close_connection,
+    connect,
+    get_db_location,
+    initialize_database,
+)
+
+INSERT_SQL = """
+    INSERT INTO logs (ID, VehicleID, EntryType, EntryTimestamp, OdometerReading)
+    VALUES (?, NULL, 'Gas', ?, ?)
+"""
+
+READ_SQL = "SELECT * FROM logs ORDER BY EntryTimestamp DESC LIMIT 10"
+
+
+def default_connect(path: Path) -> sqlite3.Connection:
+    return sqlite3.connect(path, timeout=0.1)
+
+
+def run(name: str, open_connection, path: Path, inserts: int):
+    conn = open_connection(path)
+    start = time.perf_counter()
+    for number in range(inserts):
+        with conn:
+            conn.execute(INSERT_SQL, (str(number), f"2024-01-01T00:{number % 60:02d}", 1))
+    elapsed = time.perf_counter() - start
+    print(f"{name:8} {inserts / elapsed:10,.0f} commits/sec")
+
+    # A second connection reads while the first one is in a write transaction.
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(INSERT_SQL, ("pending", "2024-01-01T00:00", 1))
+    reader = open_connection(path)
+    try:
+        start = time.perf_counter()
+        reader.execute(READ_SQL).fetchall()
+        status = f"{(time.perf_counter() - start) * 1000:.2f} ms"
+    except sqlite3.OperationalError as error:
+        status = f"blocked ({error})"
+    print(f"{name:8} read during a write: {status}")
+    conn.rollback()
+    reader.close()
+    conn.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--inserts", type=int, default=2000)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, open_connection in (("default", default_connect), ("tuned", connect)):
+            os.environ["VEHICLE_VITALS_DATABASE_LOCATION"] = str(
+                Path(directory) / f"{name}.db"
+            )
+            get_db_location.cache_clear()
+            initialize_database()
+            close_connection()
+            # initialize_database switched the file to WAL, start the default from the
+            # rollback journal SQLite uses out of the box.
+            if name == "default":
+                with sqlite3.connect(get_db_location()) as conn:
+                    conn.execute("PRAGMA journal_mode = DELETE")
+                conn.close()
+            run(name, open_connection, get_db_location(), options.inserts)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
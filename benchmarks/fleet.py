@@ -0,0 +1,288 @@
+"""
+Generate a synthetic fleet of vehicles and their logs for benchmarks.
+
+The same seed always generates the same fleet. Each vehicle has its own tank size,
+fuel economy and daily mileage. It fills up when 60 to 85% of the tank is used, with
+some partial and unrecorded fill ups. It gets its services at their usual intervals,
+with the odd note for the search index. Rows are written straight to the logs table in
+large batches, then the MPG is computed once with mpg.recompute_all.
+
+Usage:
+    python -m benchmarks.fleet fleet.db --vehicles 20 --logs 5000 --seed 1
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from VehicleVitals.add_record import FuelTypes, octane_rating
+from VehicleVitals.database_utilities import connect, natural_key, to_cents, to_mills
+from VehicleVitals.migrations import migrate
+from VehicleVitals.mpg import recompute_all
+
+START = datetime(2005, 1, 1, 7, 30)
+
+MODELS = (
+    ("Honda", "Fit", 11.0, 36),
+    ("Toyota", "Camry", 15.8, 32),
+    ("Ford", "F-150", 26.0, 20),
+    ("Subaru", "Outback", 18.5, 28),
+    ("Mazda", "3", 13.2, 31),
+    ("Chevrolet", "Tahoe", 24.0, 17),
+)
+
+GAS_BRANDS = ("Costco", "Shell", "Chevron", "Arco", "76", "Safeway", "Fred Meyer")
+LOCATIONS = ("Home", "Work", "Portland, OR", "Salem, OR", "Bend, OR", "Seattle, WA")
+COLORS = ("Red", "Blue", "Silver", "Black", "White")
+NOTES = (
+    "Brake noise when stopping",
+    "Check engine light came on",
+    "Tire pressure low on the front left",
+    "Road trip",
+    "Wipers streaking",
+    "Windshield chip from gravel",
+    "Squeaky belt on cold mornings",
+)
+
+# Service name -> (interval in miles, typical cost in dollars)
+SERVICES = {
+    "Oil Change": (5000, 65),
+    "Tire Rotation": (7500, 30),
+    "Air Filter": (15000, 25),
+    "Cabin Filter": (20000, 35),
+    "Tire Replacement": (45000, 800),
+}
+
+LOG_INSERT_SQL = """
+    INSERT INTO logs (
+        ID, VehicleID, EntryType, EntryTimestamp, OdometerReading, IsFillUp,
+        CostPerGallonMills, GallonsFilled, TotalCostCents, OctaneRating, GasBrand,
+        Location, Notes, Services, service_type_id, NaturalKey
+    )
+    VALUES (
+        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+        (SELECT id FROM service_types WHERE name = ?), ?
+    )
+"""
+
+
+@dataclass
+class VehicleState:
+    """
+    A generated vehicle and where its history stands.
+
+    Attributes:
+    - id: Vehicle ID.
+    - tank_gallons: Tank size.
+    - mpg: Average fuel economy.
+    - miles_per_day: Average daily mileage.
+    - odometer: Odometer reading of the last log.
+    - moment: Time of the last log.
+    - price: Fuel price of the last fill up, it drifts from one fill up to the next.
+    - next_service: Odometer reading at which each service is due next.
+    """
+
+    id: str
+    tank_gallons: float
+    mpg: float
+    miles_per_day: float
+    odometer: float
+    moment: datetime
+    price: float
+    next_service: dict[str, float] = field(default_factory=dict)
+
+
+class Fleet:
+    """
+    Seeded generator of vehicles and their logs, which can keep extending the
+    history of the same vehicles (`grow`).
+    """
+
+    def __init__(self, seed: int = 1):
+        self.rng = random.Random(seed)
+        self.vehicles: list[VehicleState] = []
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def add_vehicles(self, conn: sqlite3.Connection, count: int):
+        rng = self.rng
+        rows = []
+        for number in range(len(self.vehicles), len(self.vehicles) + count):
+            make, model, tank, mpg = rng.choice(MODELS)
+            odometer = rng.uniform(0, 40000)
+            state = VehicleState(
+                id=self.new_id(),
+                tank_gallons=tank,
+                mpg=mpg * rng.uniform(0.9, 1.1),
+                # Work vehicles, so thousands of logs still span a few decades at most
+                miles_per_day=rng.uniform(100, 300),
+                odometer=odometer,
+                moment=START + timedelta(days=rng.uniform(0, 30)),
+                price=rng.uniform(2.8, 3.6),
+                next_service={
+                    name: odometer + rng.uniform(0, interval)
+                    for name, (interval, _) in SERVICES.items()
+                },
+            )
+            self.vehicles.append(state)
+            rows.append(
+                (
+                    state.id,
+                    f"car-{number}",
+                    rng.randint(2005, 2024),
+                    make,
+                    model,
+                    rng.choice(COLORS),
+                    odometer,
+                )
+            )
+        conn.executemany(
+            "INSERT INTO vehicles (id, name, Year, Make, Model, Color, mileage) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def next_fuel_up(self, state: VehicleState) -> dict:
+        """
+        Drive a vehicle to its next fill up and return that fuel up, in the argument
+        names of add_record.insert_fuel_up (cost_per_gallon in dollars).
+        """
+        rng = self.rng
+        miles = state.tank_gallons * state.mpg * rng.uniform(0.6, 0.85)
+        state.odometer = round(state.odometer + miles, 1)
+        state.moment += timedelta(days=miles / state.miles_per_day)
+        state.price = min(max(state.price + rng.gauss(0, 0.05), 2.5), 6.5)
+
+        roll = rng.random()
+        is_fill_up = "Partial" if roll < 0.08 else "Reset" if roll < 0.1 else "Full"
+        gallons = miles / (state.mpg * rng.gauss(1, 0.04))
+        if is_fill_up == "Partial":
+            gallons *= rng.uniform(0.3, 0.7)
+        return dict(
+            vehicle_id=state.id,
+            odometer=state.odometer,
+            gallons=round(gallons, 3),
+            cost_per_gallon=round(state.price, 3),
+            entry_timestamp=state.moment.isoformat(timespec="seconds"),
+            is_fill_up=is_fill_up,
+            fuel_type=FuelTypes.regular,
+            location=rng.choice(LOCATIONS),
+        )
+
+    def vehicle_logs(self, state: VehicleState, count: int) -> list[tuple]:
+        """Generate the next `count` logs rows of a vehicle."""
+        rng = self.rng
+        rows = []
+        while len(rows) < count:
+            fuel_up = self.next_fuel_up(state)
+            cost_cents = to_cents(fuel_up["cost_per_gallon"] * fuel_up["gallons"])
+            rows.append(
+                (
+                    self.new_id(),
+                    state.id,
+                    "Gas",
+                    fuel_up["entry_timestamp"],
+                    fuel_up["odometer"],
+                    fuel_up["is_fill_up"],
+                    to_mills(fuel_up["cost_per_gallon"]),
+                    fuel_up["gallons"],
+                    cost_cents,
+                    octane_rating(fuel_up["fuel_type"]),
+                    rng.choice(GAS_BRANDS),
+                    fuel_up["location"],
+                    rng.choice(NOTES) if rng.random() < 0.05 else None,
+                    None,
+                    None,
+                    natural_key(
+                        state.id,
+                        fuel_up["entry_timestamp"],
+                        fuel_up["odometer"],
+                        "Gas",
+                        cost_cents,
+                    ),
+                )
+            )
+            for name, (interval, cost) in SERVICES.items():
+                if state.odometer < state.next_service[name] or len(rows) >= count:
+                    continue
+                state.next_service[name] = state.odometer + interval
+                moment = state.moment + timedelta(hours=rng.uniform(1, 30))
+                timestamp = moment.isoformat(timespec="seconds")
+                cost_cents = to_cents(cost * rng.uniform(0.8, 1.3))
+                rows.append(
+                    (
+                        self.new_id(),
+                        state.id,
+                        "Service",
+                        timestamp,
+                        state.odometer,
+                        None,
+                        None,
+                        None,
+                        cost_cents,
+                        None,
+                        None,
+                        rng.choice(LOCATIONS),
+                        rng.choice(NOTES) if rng.random() < 0.2 else None,
+                        name,
+                        name,
+                        natural_key(
+                            state.id, timestamp, state.odometer, "Service", cost_cents
+                        ),
+                    )
+                )
+        return rows
+
+    def grow(self, conn: sqlite3.Connection, logs_per_vehicle: int) -> int:
+        """
+        Add `logs_per_vehicle` logs to every vehicle, then recompute the MPG and
+        mileage of the fleet. The caller commits.
+
+        Returns:
+            int: Number of logs added.
+        """
+        added = 0
+        for state in self.vehicles:
+            rows = self.vehicle_logs(state, logs_per_vehicle)
+            conn.executemany(LOG_INSERT_SQL, rows)
+            added += len(rows)
+        recompute_all(conn)
+        conn.executemany(
+            "UPDATE vehicles SET mileage = max(mileage, ?) WHERE id = ?",
+            [(state.odometer, state.id) for state in self.vehicles],
+        )
+        return added
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("database", type=Path)
+    parser.add_argument("--vehicles", type=int, default=20)
+    parser.add_argument("--logs", type=int, default=5000, help="Logs per vehicle.")
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+
+    if options.database.exists():
+        parser.error(f"{options.database} already exists.")
+    conn = connect(options.database)
+    migrate(conn)
+    start = time.perf_counter()
+    fleet = Fleet(options.seed)
+    with conn:
+        fleet.add_vehicles(conn, options.vehicles)
+        added = fleet.grow(conn, options.logs)
+    conn.close()
+    elapsed = time.perf_counter() - start
+    print(f"{options.vehicles} vehicles, {added:,} logs in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Exercise `vv serve` end to end against a temporary database, without any external
+service: the server runs in this process on a free localhost port and concurrent
+clients send a mix of fuel ups and log page reads over keep-alive connections.
+
+Prints the request throughput, the latency percentiles from /metrics and how many
+writes were committed per transaction (group commit), and fails if any request
+did not succeed or the logs do not hold every fuel up sent.
+
+Usage:
+    python -m benchmarks.server --clients 32 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from VehicleVitals.database_utilities import (
+    close_connection,
+    get_connection,
+    initialize_database,
+)
+from VehicleVitals.server import HOST, Server
+
+
+async def request(reader, writer, method: str, path: str, body: dict | None = None):
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {HOST}\r\n"
+        f"Content-Length: {len(data)}\r\n\r\n".encode()
+        + data
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(port: int, number: int, requests: int, vehicle_id: str) -> list[int]:
+    reader, writer = await asyncio.open_connection(HOST, port)
+    statuses = []
+    for count in range(requests):
+        if count % 2:
+            status, _ = await request(
+                reader, writer, "GET", f"/logs?vehicle_id={vehicle_id}&page_size=20"
+            )
+        else:
+            minute = number * requests + count
+            status, _ = await request(
+                reader,
+                writer,
+                "POST",
+                "/fuel-ups",
+                {
+                    "vehicle_id": vehicle_id,
+                    "odometer": 1000 + minute * 10,
+                    "gallons": 10,
+                    "cost_per_gallon": 3.5,
+                    "entry_date": "2024-01-01",
+                    "entry_time": f"{minute // 60 % 24:02d}:{minute % 60:02d}",
+                },
+            )
+        statuses.append(status)
+    writer.close()
+    return statuses
+
+
+async def run(clients: int, requests: int, readers: int) -> int:
+    server = Server(readers=readers)
+    listener = await server.start(port=0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection(HOST, port)
+        _, created = await request(
+            reader,
+            writer,
+            "POST",
+            "/vehicles",
+            dict(year=2020, make="Honda", model="Fit", color="Red", mileage=0),
+        )
+        vehicle_id = created["id"]
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(client(port, number, requests, vehicle_id) for number in range(clients))
+        )
+        elapsed = time.perf_counter() - start
+        _, metrics = await request(reader, writer, "GET", "/metrics")
+        writer.close()
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        server.close()
+
+    statuses = [status for result in results for status in result]
+    total = len(statuses)
+    print(f"{total:,} requests from {clients} clients in {elapsed:.2f}s "
+          f"({total / elapsed:,.0f} requests/sec)")
+    for route, summary in metrics["routes"].items():
+        print(f"{route:16} " + ", ".join(f"{k} {v}" for k, v in summary.items()))
+    print(f"{metrics['writes']:,} writes in {metrics['commits']:,} commits "
+          f"({metrics['writes_per_commit']} writes per commit)")
+
+    failures = 0
+    if failed := [status for status in statuses if status >= 400]:
+        print(f"FAIL {len(failed)} requests failed, e.g. status {failed[0]}")
+        failures += 1
+    expected = sum((len(result) + 1) // 2 for result in results)
+    query = "SELECT count(*) FROM logs WHERE VehicleID = ?"
+    (stored,) = get_connection().execute(query, (vehicle_id,)).fetchone()
+    if stored != expected:
+        print(f"FAIL {stored} fuel ups stored, {expected} sent")
+        failures += 1
+    close_connection()
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--readers", type=int, default=4)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["VEHICLE_VITALS_DATABASE_LOCATION"] = str(
+            Path(directory) / "VehicleVitals.db"
+        )
+        initialize_database()
+        close_connection()
+        failures = asyncio.run(run(options.clients, options.requests, options.readers))
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
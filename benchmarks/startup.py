@@ -0,0 +1,114 @@
+"""
+Check the cold start time of the `vv` command line against a budget.
+
+Runs `vv --version` and `vv display vehicles` in fresh interpreters against a
+temporary database and fails if:
+- the fastest wall clock time of a command is over --budget-ms,
+- the import time of the VehicleVitals modules themselves (from `python -X importtime`,
+  third party packages excluded) is over --own-budget-ms,
+- `vv --version` imports a subcommand module, which should only load on demand.
+
+Usage:
+    python -m benchmarks.startup --budget-ms 500 --own-budget-ms 25
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+LAZY_MODULES = (
+    "VehicleVitals.display",
+    "VehicleVitals.add_record",
+    "VehicleVitals.edit",
+    "VehicleVitals.export",
+    "VehicleVitals.fleet",
+    "VehicleVitals.history",
+    "VehicleVitals.import_records",
+    "VehicleVitals.mpg",
+    "VehicleVitals.profiling",
+    "VehicleVitals.report",
+    "VehicleVitals.search",
+    "VehicleVitals.server",
+    "VehicleVitals.shell",
+)
+
+COMMANDS = (["--version"], ["display", "vehicles"])
+
+
+def run_vv(args: list[str], env: dict, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *flags, "-m", "VehicleVitals.main", *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def wall_time_ms(args: list[str], env: dict, repeat: int) -> float:
+    """Return the fastest of `repeat` runs, the least noisy estimate of cold start."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_vv(args, env)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def import_times(args: list[str], env: dict) -> dict[str, int]:
+    """Return the self import time in microseconds of every module a command loads."""
+    output = run_vv(args, env, "-X", "importtime").stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(self_time)
+    return times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=500)
+    parser.add_argument("--own-budget-ms", type=float, default=25)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        env = os.environ | {
+            "VEHICLE_VITALS_DATABASE_LOCATION": str(Path(directory) / "startup.db")
+        }
+        run_vv(["display", "vehicles"], env)  # Create the database outside the timings
+
+        for args in COMMANDS:
+            command = " ".join(["vv", *args])
+            elapsed = wall_time_ms(args, env, options.repeat)
+            status = "ok  " if elapsed <= options.budget_ms else "FAIL"
+            failures += status == "FAIL"
+            print(f"{status} {command}: {elapsed:.0f} ms (budget {options.budget_ms} ms)")
+
+        times = import_times(["--version"], env)
+        own = sum(us for name, us in times.items() if name.startswith("VehicleVitals"))
+        status = "ok  " if own / 1000 <= options.own_budget_ms else "FAIL"
+        failures += status == "FAIL"
+        print(
+            f"{status} VehicleVitals import time: {own / 1000:.1f} ms "
+            f"(budget {options.own_budget_ms} ms)"
+        )
+
+        if eager := [name for name in LAZY_MODULES if name in times]:
+            failures += 1
+            print(f"FAIL vv --version imported {', '.join(eager)}")
+        else:
+            print("ok   vv --version did not import any subcommand module")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
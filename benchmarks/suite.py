@@ -0,0 +1,279 @@
+"""
+Time the main entry points of `vv` against a synthetic fleet and compare the timings
+with a stored baseline.
+
+A seeded fleet (benchmarks/fleet.py) is written to a temporary database in stages.
+At each stage the commands are run in process through the `vv` command, option
+parsing and vehicle resolution included, the way `vv shell` runs them:
+- add fuel-up: one committed fuel up per call, as the history of the vehicle grows,
+- display logs: the first page, a page deep in the history and one vehicle's logs,
+- display vehicles: the first page and one vehicle by name,
+- initialize_database: creating a new database and checking an up to date one.
+
+Results are written as JSON. With a baseline (from --save-baseline on a previous
+run) every timing is compared with it, and the run fails if one is slower by more
+than --tolerance.
+
+Usage:
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import click
+import typer
+
+from VehicleVitals.database_utilities import (
+    close_connection,
+    connection,
+    ensure_schema,
+    get_connection,
+    get_db_location,
+    initialize_database,
+)
+from VehicleVitals.display import encode_cursor
+from VehicleVitals.main import app as main_app
+
+from .fleet import Fleet
+
+BENCHMARKS_DIR = Path(__file__).parent
+DEFAULT_RESULTS = BENCHMARKS_DIR / "results.json"
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+
+# Differences below this are timer noise, however large they are relatively.
+MIN_REGRESSION_MS = 0.2
+
+DEEP_PAGE_QUERY = """
+    SELECT EntryTimestamp, rowid FROM logs
+    ORDER BY EntryTimestamp DESC, rowid DESC
+    LIMIT 1 OFFSET ?
+"""
+
+
+def use_database(path: Path):
+    """Point the shared connection at another database file."""
+    close_connection()
+    os.environ["VEHICLE_VITALS_DATABASE_LOCATION"] = str(path)
+    get_db_location.cache_clear()
+
+
+def vv(command: click.Command, *args: str):
+    """Run a `vv` command line in this process, its output discarded."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        command.main(list(args), prog_name="vv", standalone_mode=False)
+
+
+def timings_ms(work: Callable[[], object], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summary(timings: list[float]) -> dict:
+    """Median, 95th percentile and best of a list of timings in milliseconds."""
+    ordered = sorted(timings)
+    return {
+        "median_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "min_ms": round(ordered[0], 3),
+        "runs": len(ordered),
+    }
+
+
+def fuel_up_args(fuel_up: dict) -> list[str]:
+    """Command line of `vv add fuel-up` for a generated fuel up."""
+    entry_date, _, entry_time = fuel_up["entry_timestamp"].partition("T")
+    args = [
+        "add",
+        "fuel-up",
+        "--vehicle-id",
+        fuel_up["vehicle_id"][:8],
+        "--odometer",
+        str(fuel_up["odometer"]),
+        "--gallons",
+        str(fuel_up["gallons"]),
+        "--cost-per-gallon",
+        str(fuel_up["cost_per_gallon"]),
+        "--fuel-type",
+        fuel_up["fuel_type"].value,
+        "--entry-date",
+        entry_date,
+        "--entry-time",
+        entry_time,
+        "--location",
+        fuel_up["location"],
+    ]
+    if fuel_up["is_fill_up"] == "Partial":
+        args.append("--no-filled-up")
+    if fuel_up["is_fill_up"] == "Reset":
+        args.append("--missed-last-fill-up")
+    return args
+
+
+def run_suite(options: argparse.Namespace, directory: Path) -> dict[str, dict]:
+    command = typer.main.get_command(main_app)
+    results = {}
+
+    # Schema creation, each time in a new database file
+    paths = iter(directory / f"init-{number}.db" for number in range(options.repeat))
+
+    def create_database():
+        use_database(next(paths))
+        initialize_database()
+
+    results["initialize_database (new database)"] = summary(
+        timings_ms(create_database, options.repeat)
+    )
+    results["ensure_schema (up to date)"] = summary(
+        timings_ms(ensure_schema, options.repeat * 20)
+    )
+
+    use_database(directory / "fleet.db")
+    initialize_database()
+    fleet = Fleet(options.seed)
+    with connection() as conn:
+        fleet.add_vehicles(conn, options.vehicles)
+    vehicle = fleet.vehicles[0]
+
+    per_stage = options.logs // options.stages
+    for stage in range(1, options.stages + 1):
+        start = time.perf_counter()
+        with connection() as conn:
+            fleet.grow(conn, per_stage)
+        (total,) = get_connection().execute("SELECT count(*) FROM logs").fetchone()
+        print(
+            f"stage {stage}/{options.stages}: {total:,} logs "
+            f"(generated in {time.perf_counter() - start:.1f}s)",
+            file=sys.stderr,
+        )
+        label = f"@ {per_stage * stage:,} logs per vehicle"
+
+        results[f"add fuel-up {label}"] = summary(
+            timings_ms(
+                lambda: vv(command, *fuel_up_args(fleet.next_fuel_up(vehicle))),
+                options.inserts,
+            )
+        )
+        results[f"display logs first page {label}"] = summary(
+            timings_ms(lambda: vv(command, "display", "logs"), options.repeat)
+        )
+        depth = total // 2
+        query = get_connection().execute(DEEP_PAGE_QUERY, (depth,))
+        timestamp, rowid = query.fetchone()
+        after = encode_cursor([depth // 10 + 1, timestamp, rowid])
+        results[f"display logs deep page {label}"] = summary(
+            timings_ms(
+                lambda: vv(command, "display", "logs", "--after", after), options.repeat
+            )
+        )
+        results[f"display logs --vehicle-id {label}"] = summary(
+            timings_ms(
+                lambda: vv(command, "display", "logs", "--vehicle-id", vehicle.id[:8]),
+                options.repeat,
+            )
+        )
+
+    results["display vehicles first page"] = summary(
+        timings_ms(lambda: vv(command, "display", "vehicles"), options.repeat)
+    )
+    results["display vehicles --vehicle name"] = summary(
+        timings_ms(
+            lambda: vv(command, "display", "vehicles", "--vehicle", "car-0"),
+            options.repeat,
+        )
+    )
+    close_connection()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return the timings slower than their baseline by more than `tolerance`."""
+    regressions = []
+    for name, summary_ in results.items():
+        if name not in baseline:
+            continue
+        current, before = summary_["median_ms"], baseline[name]["median_ms"]
+        if current > before * (1 + tolerance) and current - before > MIN_REGRESSION_MS:
+            regressions.append(
+                f"{name}: {current:.3f} ms, baseline {before:.3f} ms "
+                f"(+{(current / before - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vehicles", type=int, default=20)
+    parser.add_argument("--logs", type=int, default=3000, help="Logs per vehicle.")
+    parser.add_argument("--stages", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--inserts", type=int, default=100, help="Fuel ups per stage.")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as baseline."
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.3, help="Allowed slowdown, 0.3 = 30%%."
+    )
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_suite(options, Path(directory))
+
+    parameters = {
+        name: getattr(options, name)
+        for name in ("vehicles", "logs", "stages", "seed", "inserts", "repeat")
+    }
+    report = {
+        "parameters": parameters,
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    for name, summary_ in results.items():
+        print(f"{name:52} median {summary_['median_ms']:9.3f} ms  "
+              f"p95 {summary_['p95_ms']:9.3f} ms")
+
+    options.output.write_text(json.dumps(report, indent=2) + "\n")
+    if options.save_baseline:
+        options.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Saved the baseline to {options.baseline}")
+        return 0
+
+    if not options.baseline.exists():
+        print(f"No baseline at {options.baseline}, store one with --save-baseline.")
+        return 0
+    baseline = json.loads(options.baseline.read_text())
+    if baseline["parameters"] != parameters:
+        print("The baseline was recorded with other parameters, not comparing.")
+        return 1
+    if regressions := compare(results, baseline["results"], options.tolerance):
+        for regression in regressions:
+            print(f"FAIL {regression}")
+        return 1
+    print(f"ok   every timing within {options.tolerance:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Fixtures shared by the tests: databases with the current schema.
+"""
+import sqlite3
+from collections.abc import Callable
+
+import pytest
+
+from VehicleVitals import database_utilities
+from VehicleVitals.add_record import insert_vehicle
+from VehicleVitals.database_utilities import connect
+from VehicleVitals.migrations import migrate
+
+# A fuel up stored without a natural key, as before natural keys or by another tool
+INSERT_UNKEYED_SQL = """
+    INSERT INTO logs (
+        VehicleID, EntryType, EntryTimestamp, OdometerReading, GallonsFilled,
+        TotalCostCents, IsFillUp
+    )
+    VALUES (?, 'Gas', ?, ?, 10, 3000, 'Full')
+"""
+
+
+@pytest.fixture
+def conn() -> sqlite3.Connection:
+    """An in-memory database with the current schema."""
+    conn = connect(":memory:")
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def shared_db(tmp_path, monkeypatch) -> sqlite3.Connection:
+    """
+    A database file with the current schema, configured as the database of the
+    commands so they use it through the shared connection.
+    """
+    monkeypatch.setenv("VEHICLE_VITALS_DATABASE_LOCATION", str(tmp_path / "vv.db"))
+    database_utilities.get_db_location.cache_clear()
+    database_utilities.close_connection()
+    database_utilities.initialize_database()
+    yield database_utilities.get_connection()
+    database_utilities.close_connection()
+    database_utilities.get_db_location.cache_clear()
+
+
+@pytest.fixture
+def vehicle_id(conn) -> str:
+    """ID of a vehicle in the `conn` database."""
+    return insert_vehicle(conn, 2020, "Honda", "Civic", "Red", 0, name="civic")
+
+
+@pytest.fixture
+def insert_unkeyed() -> Callable[[sqlite3.Connection, str, str, float], None]:
+    """Return a function inserting a fuel up without a natural key."""
+
+    def insert(conn, vehicle_id: str, timestamp: str, odometer: float):
+        conn.execute(INSERT_UNKEYED_SQL, (vehicle_id, timestamp, odometer))
+
+    return insert
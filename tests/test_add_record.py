@@ -0,0 +1,80 @@
+"""
+Tests of `vv add fuel-up` and `vv add service`: the entry time stored as a timestamp,
+costs as integer cents, and an entry recorded again not inserted twice.
+"""
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals.add_record import app, insert_vehicle
+
+FUEL_UP = [
+    "fuel-up",
+    "--odometer",
+    "1000",
+    "--gallons",
+    "10",
+    "--cost-per-gallon",
+    "3.199",
+]
+SERVICE = [
+    "service",
+    "--odometer",
+    "1200",
+    "--service-type",
+    "Oil Change",
+    "--cost",
+    "49.99",
+]
+
+
+@pytest.fixture
+def vehicle(shared_db) -> str:
+    return insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0, name="civic")
+
+
+def add(*args: str):
+    return CliRunner().invoke(app, [*args, "--vehicle-id", "civic"])
+
+
+def test_fuel_up_recorded_again_is_not_inserted(shared_db, vehicle):
+    when = ["--entry-date", "2024-01-15", "--entry-time", "6:30 pm"]
+    result = add(*FUEL_UP, *when)
+    assert result.exit_code == 0, result.output
+    assert f"Added log entry for {vehicle}." in result.output
+
+    result = add(*FUEL_UP, *when)
+    assert result.exit_code == 0, result.output
+    assert f"The log entry for {vehicle} was already recorded." in result.output
+    rows = shared_db.execute(
+        "SELECT EntryTimestamp, CostPerGallonMills, TotalCostCents FROM logs"
+    ).fetchall()
+    assert rows == [("2024-01-15T18:30:00", 3199, 3199)]
+
+
+def test_service_recorded_again_is_not_inserted(shared_db, vehicle):
+    service = [*SERVICE, "--entry-date", "2024-02-01", "--entry-time", "09:15"]
+    assert add(*service).exit_code == 0
+    result = add(*service)
+    assert "already recorded" in result.output
+    rows = shared_db.execute("SELECT EntryTimestamp, TotalCostCents FROM logs")
+    assert rows.fetchall() == [("2024-02-01T09:15:00", 4999)]
+
+
+@pytest.mark.parametrize(
+    "option, value",
+    [
+        ("--entry-date", "garbage"),
+        ("--entry-date", "01/15/2024"),
+        ("--entry-time", "25:99"),
+    ],
+)
+@pytest.mark.parametrize("command", [FUEL_UP, SERVICE], ids=["fuel-up", "service"])
+def test_invalid_entry_time_is_a_usage_error(
+    shared_db, vehicle, command, option, value
+):
+    result = add(*command, option, value)
+    assert result.exit_code == 2
+    assert option in result.output
+    assert value in result.output
+    (count,) = shared_db.execute("SELECT COUNT(*) FROM logs").fetchone()
+    assert count == 0
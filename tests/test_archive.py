@@ -0,0 +1,67 @@
+"""
+Tests of moving older logs to the archive database (`vv db maintain --archive-before`).
+"""
+import sqlite3
+
+import pytest
+import typer
+
+from VehicleVitals.add_record import insert_fuel_up, insert_vehicle
+from VehicleVitals.manage import archive_logs
+
+CUTOFF = "2024-03-01"
+
+# Stops the delete of the moved logs, as if the process died between the copy and
+# the delete transaction.
+INTERRUPT_SQL = """
+    CREATE TEMP TRIGGER interrupt BEFORE DELETE ON main.logs
+    BEGIN SELECT RAISE(ABORT, 'interrupted'); END
+"""
+
+
+@pytest.fixture
+def vehicle(shared_db, insert_unkeyed) -> str:
+    """A vehicle with a fuel up a month from January to May, two without a key."""
+    vehicle_id = insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0)
+    for month in range(1, 6):
+        timestamp = f"2024-{month:02}-15T08:00:00"
+        if month in (1, 4):
+            insert_unkeyed(shared_db, vehicle_id, timestamp, month * 300)
+        else:
+            insert_fuel_up(shared_db, vehicle_id, month * 300, 10, 3, timestamp)
+    shared_db.commit()
+    return vehicle_id
+
+
+def counts(conn: sqlite3.Connection) -> tuple[int, int]:
+    (live,) = conn.execute("SELECT COUNT(*) FROM main.logs").fetchone()
+    (archived,) = conn.execute("SELECT COUNT(*) FROM archive.logs").fetchone()
+    return live, archived
+
+
+def test_archive_moves_the_older_logs(shared_db, vehicle):
+    stats = shared_db.execute("SELECT * FROM vehicle_stats").fetchall()
+    assert archive_logs(shared_db, CUTOFF) == 2
+    assert counts(shared_db) == (3, 2)
+    # Archived logs stay counted
+    assert shared_db.execute("SELECT * FROM vehicle_stats").fetchall() == stats
+
+
+def test_interrupted_archive_is_not_copied_twice(shared_db, vehicle):
+    shared_db.execute(INTERRUPT_SQL)
+    with pytest.raises(sqlite3.DatabaseError):
+        archive_logs(shared_db, CUTOFF)
+    assert counts(shared_db) == (5, 2)
+
+    shared_db.execute("DROP TRIGGER temp.interrupt")
+    assert archive_logs(shared_db, CUTOFF) == 2
+    assert counts(shared_db) == (3, 2)
+
+
+def test_archive_refuses_unkeyed_duplicates(shared_db, vehicle, insert_unkeyed):
+    insert_unkeyed(shared_db, vehicle, "2024-01-15T08:00:00", 300)
+    shared_db.commit()
+    with pytest.raises(typer.Exit):
+        archive_logs(shared_db, CUTOFF)
+    (live,) = shared_db.execute("SELECT COUNT(*) FROM logs").fetchone()
+    assert live == 6
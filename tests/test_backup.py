@@ -0,0 +1,121 @@
+"""
+Tests of `vv db backup`: a verified, self-contained copy of the database as of the
+start of the backup, written while other connections keep committing.
+"""
+import gzip
+import sqlite3
+
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals import backup
+from VehicleVitals.add_record import insert_fuel_up, insert_vehicle
+from VehicleVitals.backup import backup_database, list_backups
+from VehicleVitals.database_utilities import connect, get_db_location
+from VehicleVitals.manage import app
+
+FUEL_UPS = 300  # A fuel up a day, January to November
+
+
+@pytest.fixture
+def vehicle(shared_db) -> str:
+    """A vehicle with FUEL_UPS fuel ups, the database spans many pages."""
+    vehicle_id = insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0)
+    for day in range(FUEL_UPS):
+        timestamp = f"2024-{day // 28 + 1:02}-{day % 28 + 1:02}T08:00:00"
+        insert_fuel_up(shared_db, vehicle_id, 1000 + day * 300, 10, 3, timestamp)
+    shared_db.commit()
+    return vehicle_id
+
+
+def log_count(path) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        (count,) = conn.execute("SELECT COUNT(*) FROM logs").fetchone()
+        return count
+    finally:
+        conn.close()
+
+
+def test_backup_command(shared_db, vehicle, tmp_path):
+    directory = tmp_path / "backups"
+    result = CliRunner().invoke(app, ["backup", "--directory", str(directory)])
+    assert result.exit_code == 0, result.output
+    assert "integrity check ok" in result.output
+
+    (path,) = directory.iterdir()
+    assert list_backups(directory, get_db_location()) == [path]
+    # A single file in the rollback journal mode, no -wal to copy with it
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    assert conn.execute("PRAGMA quick_check").fetchone() == ("ok",)
+    conn.close()
+    assert log_count(path) == FUEL_UPS
+
+
+def test_compressed_backup(shared_db, vehicle, tmp_path):
+    (tmp_path / "out").mkdir()
+    destination = tmp_path / "out" / "vv.db.gz"
+    backup_database(get_db_location(), destination, compress=True)
+    # The uncompressed copy is gone
+    assert list(destination.parent.iterdir()) == [destination]
+
+    restored = tmp_path / "restored.db"
+    restored.write_bytes(gzip.decompress(destination.read_bytes()))
+    assert log_count(restored) == FUEL_UPS
+
+
+def test_backup_is_the_database_at_its_start(
+    shared_db, vehicle, tmp_path, monkeypatch
+):
+    # Another connection commits after every page copied
+    monkeypatch.setattr(backup, "BACKUP_STEP_PAGES", 1)
+    writer = connect(get_db_location())
+    steps = []
+
+    def progress(status: int, remaining: int, total: int):
+        steps.append(remaining)
+        odometer = 200000 + len(steps)
+        insert_fuel_up(writer, vehicle, odometer, 10, 3, "2025-01-01T08:00:00")
+        writer.commit()
+
+    (tmp_path / "out").mkdir()
+    destination = tmp_path / "out" / "vv.db"
+    backup_database(get_db_location(), destination, progress=progress)
+    writer.close()
+    assert len(steps) > 1
+    assert log_count(destination) == FUEL_UPS
+    assert log_count(get_db_location()) == FUEL_UPS + len(steps)
+
+
+def test_keep_deletes_the_oldest_backups(shared_db, vehicle, tmp_path):
+    directory = tmp_path / "backups"
+    directory.mkdir()
+    stem = get_db_location().stem
+    older = [directory / f"{stem}-2023010{day}-080000.db" for day in range(1, 4)]
+    for path in older:
+        path.write_bytes(b"")
+    # Neither a backup of this database nor one of another label
+    others = [
+        directory / "notes.txt",
+        directory / f"{stem}-pre-migration-20230101-080000.db",
+    ]
+    for path in others:
+        path.write_bytes(b"")
+
+    args = ["backup", "--directory", str(directory), "--compress", "--keep", "2"]
+    result = CliRunner().invoke(app, args)
+    assert result.exit_code == 0, result.output
+    assert "Deleted 2 older backups." in result.output
+    backups = list_backups(directory, get_db_location())
+    assert backups[0] == older[-1]
+    assert backups[1].name.endswith(".db.gz")
+    assert all(path.exists() for path in others)
+
+
+def test_backup_without_a_database(shared_db, tmp_path, monkeypatch):
+    monkeypatch.setenv("VEHICLE_VITALS_DATABASE_LOCATION", str(tmp_path / "none.db"))
+    get_db_location.cache_clear()
+    result = CliRunner().invoke(app, ["backup"])
+    assert result.exit_code == 1
+    assert "There is no database" in result.output
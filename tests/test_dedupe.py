@@ -0,0 +1,85 @@
+"""
+Tests of natural keys: a log entry recorded again is not inserted, and
+`vv db dedupe` finds and deletes the copies recorded without a key.
+"""
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals.add_record import (
+    ServiceTypes,
+    insert_fuel_up,
+    insert_service,
+    insert_vehicle,
+)
+from VehicleVitals.database_utilities import natural_key
+from VehicleVitals.manage import app
+
+
+def test_natural_key_normalizes_numbers():
+    key = natural_key("vehicle", "2024-01-01T08:00:00", 1000, "Gas", 3000)
+    assert key == natural_key("vehicle", "2024-01-01T08:00:00", 1000.0, "Gas", 3000.0)
+    assert key != natural_key("vehicle", "2024-01-01T08:00:00", 1000, "Gas", 3001)
+
+
+def test_recording_an_entry_again_does_not_insert_it(conn, vehicle_id):
+    timestamp = "2024-01-01T08:00:00"
+    log_id, added = insert_fuel_up(conn, vehicle_id, 1000, 10, 3, timestamp)
+    assert added
+    assert insert_fuel_up(conn, vehicle_id, 1000, 10, 3, timestamp) == (log_id, False)
+
+    service = (vehicle_id, 1200, ServiceTypes("Oil Change"), 50, timestamp)
+    service_id, added = insert_service(conn, *service)
+    assert added
+    assert insert_service(conn, *service) == (service_id, False)
+    (count,) = conn.execute("SELECT COUNT(*) FROM logs").fetchone()
+    assert count == 2
+
+
+@pytest.fixture
+def duplicated(shared_db, insert_unkeyed) -> str:
+    """
+    A vehicle with three fuel ups recorded without a natural key, the second twice,
+    and the third also recorded with a key.
+    """
+    vehicle_id = insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0)
+    days = ["2024-01-01T08:00:00", "2024-01-05T08:00:00", "2024-01-09T08:00:00"]
+    for timestamp, odometer in [(days[0], 1000), (days[1], 1300), (days[1], 1300)]:
+        insert_unkeyed(shared_db, vehicle_id, timestamp, odometer)
+    insert_fuel_up(shared_db, vehicle_id, 1600, 10, 3, days[2])
+    insert_unkeyed(shared_db, vehicle_id, days[2], 1600)
+    shared_db.commit()
+    return vehicle_id
+
+
+def logs(conn) -> list[tuple]:
+    return conn.execute(
+        "SELECT rowid, OdometerReading, NaturalKey, MPG FROM logs ORDER BY rowid"
+    ).fetchall()
+
+
+def test_dedupe_only_lists_without_delete(shared_db, duplicated):
+    before = logs(shared_db)
+    result = CliRunner().invoke(app, ["dedupe"])
+    assert result.exit_code == 0, result.output
+    assert "2 duplicate log entries" in result.output
+    assert logs(shared_db) == before
+
+
+def test_dedupe_delete_keeps_the_first_copy(shared_db, duplicated):
+    result = CliRunner().invoke(app, ["dedupe", "--delete"])
+    assert result.exit_code == 0, result.output
+    assert "Deleted 2 duplicate log entries." in result.output
+
+    rows = logs(shared_db)
+    assert [(rowid, odometer) for rowid, odometer, *_ in rows] == [
+        (1, 1000),
+        (2, 1300),
+        (4, 1600),
+    ]
+    # The entries kept got their key, the MPG around the deleted copies is recomputed
+    assert all(key for _, _, key, _ in rows)
+    assert rows[1][3] == pytest.approx(30)
+    assert rows[2][3] == pytest.approx(30)
+
+    result = CliRunner().invoke(app, ["dedupe"])
+    assert "No duplicate log entries found." in result.output
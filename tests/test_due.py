@@ -0,0 +1,83 @@
+"""
+Tests of the service forecast (`vv display due`): due_query against a small fleet whose
+due dates are worked out by hand.
+"""
+from datetime import date
+
+import pytest
+
+from VehicleVitals.add_record import (
+    ServiceTypes,
+    insert_fuel_up,
+    insert_service,
+    insert_vehicle,
+)
+from VehicleVitals.display import due_query
+
+TODAY = date(2024, 3, 1)
+
+# Services the first vehicle has no record of, in name order
+NEVER_SERVICED = [
+    "Air Filter",
+    "Cabin Filter",
+    "Car Detailing",
+    "Tire Replacement",
+    "Tire Rotation",
+]
+
+
+@pytest.fixture
+def fleet(conn) -> tuple[str, str]:
+    """
+    A vehicle driven 100 miles a day from 10,000 miles on January 1st to 16,000 on
+    March 1st:
+    - Oil Change (180 days, 5,000 miles) at 10,000 miles on January 1st, overdue by
+      miles: 15,000 miles were reached 10 days before March 1st.
+    - Car Wash (30 days) on January 15th, overdue by date since February 14th.
+    - The other services never done.
+    And a second vehicle without any service.
+    """
+    vehicle_id = insert_vehicle(conn, 2020, "Honda", "Civic", "Red", 0, name="civic")
+    idle_id = insert_vehicle(conn, 2018, "Ford", "Focus", "Blue", 0, name="focus")
+    insert_fuel_up(conn, vehicle_id, 10000, 10, 3, "2024-01-01T00:00:00")
+    insert_fuel_up(conn, vehicle_id, 16000, 10, 3, "2024-03-01T00:00:00")
+    for odometer, service_type, timestamp in [
+        (10000, ServiceTypes.oil_change, "2024-01-01T00:00:00"),
+        (11400, ServiceTypes.car_wash, "2024-01-15T00:00:00"),
+    ]:
+        insert_service(conn, vehicle_id, odometer, service_type, 50, timestamp)
+    conn.commit()
+    return vehicle_id, idle_id
+
+
+def forecast(conn, **kwargs) -> list[tuple]:
+    query, params = due_query(today=TODAY, **kwargs)
+    return [
+        (f"{row[2]} {row[4]}", row[5], row[7], row[8], row[9])
+        for row in conn.execute(query, params)
+    ]
+
+
+def test_overdue_by_miles_and_by_date(conn, fleet):
+    assert forecast(conn) == [
+        ("Civic Car Wash", "2024-01-15T00:00:00", None, "2024-02-14", -16),
+        ("Civic Oil Change", "2024-01-01T00:00:00", 15000, "2024-02-20", -10),
+    ]
+
+
+def test_never_serviced_are_listed_last(conn, fleet):
+    vehicle_id, idle_id = fleet
+    every_service = sorted([*NEVER_SERVICED, "Car Wash", "Oil Change"])
+    rows = forecast(conn, include_never=True)
+    assert rows[:2] == forecast(conn)
+    # Nothing is known without a record, the vehicles come in display order
+    assert rows[2:] == [
+        *[(f"Civic {service}", None, None, None, None) for service in NEVER_SERVICED],
+        *[(f"Focus {service}", None, None, None, None) for service in every_service],
+    ]
+
+    assert forecast(conn, vehicle_id=vehicle_id) == forecast(conn)
+    assert forecast(conn, vehicle_id=idle_id) == []
+    assert len(forecast(conn, vehicle_id=idle_id, include_never=True)) == len(
+        every_service
+    )
@@ -0,0 +1,57 @@
+"""
+Tests of `vv edit vehicle`: renaming a vehicle, clearing its name and the unique name
+error.
+"""
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals.add_record import insert_vehicle
+from VehicleVitals.main import app
+
+
+@pytest.fixture
+def vehicles(shared_db) -> list[str]:
+    vehicle_ids = [
+        insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0, name=name)
+        for name in ("civic", "spare")
+    ]
+    shared_db.commit()
+    return vehicle_ids
+
+
+def edit(vehicle: str, *args: str):
+    return CliRunner().invoke(
+        app, ["edit", "vehicle", "--vehicle", vehicle, "--no-confirm", *args]
+    )
+
+
+def names(conn) -> dict[str, str | None]:
+    return dict(conn.execute("SELECT id, name FROM vehicles"))
+
+
+def test_rename(shared_db, vehicles):
+    result = edit("civic", "--name", "Daily Driver", "--mileage", "51200")
+    assert result.exit_code == 0, result.output
+    assert names(shared_db)[vehicles[0]] == "Daily Driver"
+
+    # The old name no longer resolves, the new one does
+    assert edit("civic", "--mileage", "1").exit_code == 2
+    assert edit("Daily Driver", "--mileage", "51300").exit_code == 0
+    (mileage,) = shared_db.execute(
+        "SELECT mileage FROM vehicles WHERE id = ?", (vehicles[0],)
+    ).fetchone()
+    assert mileage == 51300
+
+
+def test_blank_name_clears_it(shared_db, vehicles):
+    for name in ("civic", "spare"):
+        result = edit(name, "--name", "")
+        assert result.exit_code == 0, result.output
+    assert names(shared_db) == {vehicle_id: None for vehicle_id in vehicles}
+
+
+def test_name_of_another_vehicle_is_refused(shared_db, vehicles):
+    result = edit("spare", "--name", "civic")
+    assert result.exit_code == 2
+    assert "Another vehicle is named civic." in result.output
+    assert names(shared_db) == dict(zip(vehicles, ("civic", "spare")))
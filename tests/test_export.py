@@ -0,0 +1,92 @@
+"""
+Tests of `vv export`: CSV and JSON Lines exports, archived logs included, read back by
+`vv import` into another database.
+"""
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals import database_utilities
+from VehicleVitals.add_record import (
+    ServiceTypes,
+    insert_fuel_up,
+    insert_service,
+    insert_vehicle,
+)
+from VehicleVitals.database_utilities import attach_archive
+from VehicleVitals.export import app as export_app
+from VehicleVitals.import_records import LOG_COLUMNS
+from VehicleVitals.import_records import app as import_app
+from VehicleVitals.manage import archive_logs
+
+LOGS_QUERY = f"""
+    SELECT {", ".join(LOG_COLUMNS)}, NaturalKey FROM {{table}}
+    ORDER BY EntryTimestamp, EntryType
+"""
+
+
+@pytest.fixture
+def exported(shared_db) -> list[tuple]:
+    """
+    A vehicle with a fuel up a month from January to May and a service, the logs
+    before March archived. Returns the logs, archived ones included.
+    """
+    vehicle_id = insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0, "civic")
+    for month in range(1, 6):
+        timestamp = f"2024-{month:02}-15T08:00:00"
+        insert_fuel_up(shared_db, vehicle_id, month * 300, 10, 3.459, timestamp)
+    oil_change = (400, ServiceTypes.oil_change, 49.99, "2024-01-20T09:00:00")
+    insert_service(shared_db, vehicle_id, *oil_change)
+    shared_db.commit()
+    assert archive_logs(shared_db, "2024-03-01") == 3
+    attach_archive(shared_db)
+    return shared_db.execute(LOGS_QUERY.format(table="all_logs")).fetchall()
+
+
+def reopen(monkeypatch, path):
+    """Switch the shared connection to another database with the same vehicles."""
+    vehicles = database_utilities.get_connection().execute("SELECT * FROM vehicles")
+    vehicles = vehicles.fetchall()
+    monkeypatch.setenv("VEHICLE_VITALS_DATABASE_LOCATION", str(path))
+    database_utilities.get_db_location.cache_clear()
+    database_utilities.close_connection()
+    database_utilities.initialize_database()
+    conn = database_utilities.get_connection()
+    for vehicle in vehicles:
+        values = ", ".join("?" for _ in vehicle)
+        conn.execute(f"INSERT INTO vehicles VALUES ({values})", vehicle)
+    conn.commit()
+    return conn
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".jsonl"])
+def test_export_round_trip(exported, monkeypatch, tmp_path, suffix):
+    destination = tmp_path / f"logs{suffix}"
+    result = CliRunner().invoke(export_app, [str(destination), "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Exported 6 log entries" in result.output
+    if suffix == ".jsonl":
+        first = json.loads(destination.read_text().splitlines()[0])
+        assert first["VehicleName"] == "civic"
+
+    conn = reopen(monkeypatch, tmp_path / "restored.db")
+    result = CliRunner().invoke(import_app, [str(destination)])
+    assert result.exit_code == 0, result.output
+    assert conn.execute(LOGS_QUERY.format(table="logs")).fetchall() == exported
+
+
+def test_export_filters(exported, tmp_path):
+    destination = tmp_path / "logs.csv"
+    result = CliRunner().invoke(
+        export_app,
+        [str(destination), "--since", "2024-02-01", "--until", "2024-03-15"],
+    )
+    assert result.exit_code == 0, result.output
+    lines = destination.read_text().splitlines()
+    # The header, the March fuel up and the archived February one, in storage order
+    assert len(lines) == 3
+    assert sorted(line.split(",")[4] for line in lines[1:]) == [
+        "2024-02-15T08:00:00",
+        "2024-03-15T08:00:00",
+    ]
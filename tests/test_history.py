@@ -0,0 +1,75 @@
+"""
+Tests of the per connection caches of vehicle histories (history.py) and resolved
+vehicles (resolver.py): cleared when the database changes, and holding their
+connections weakly.
+"""
+import gc
+
+import pytest
+
+from VehicleVitals.add_record import insert_fuel_up, insert_vehicle
+from VehicleVitals.database_utilities import connect, get_db_location
+from VehicleVitals.history import HistoryCache
+from VehicleVitals.resolver import UnknownVehicleError, VehicleResolver
+
+
+@pytest.fixture
+def vehicle(shared_db) -> str:
+    vehicle_id = insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0, "civic")
+    insert_fuel_up(shared_db, vehicle_id, 1000, 10, 3, "2024-01-01T08:00:00")
+    shared_db.commit()
+    return vehicle_id
+
+
+def test_commit_of_another_connection_clears_the_histories(shared_db, vehicle):
+    cache = HistoryCache()
+    history = cache.load(shared_db, vehicle)
+    assert len(history) == 1
+    assert cache.load(shared_db, vehicle) is history
+
+    other = connect(get_db_location())
+    insert_fuel_up(other, vehicle, 1300, 10, 3, "2024-01-05T08:00:00")
+    other.commit()
+    other.close()
+    # PRAGMA data_version of shared_db changed
+    assert len(cache.load(shared_db, vehicle)) == 2
+
+
+def test_write_through_the_connection_clears_the_histories(shared_db, vehicle):
+    cache = HistoryCache()
+    history = cache.load(shared_db, vehicle)
+    # Not committed yet, total_changes of shared_db changed
+    insert_fuel_up(shared_db, vehicle, 1300, 10, 3, "2024-01-05T08:00:00")
+    reloaded = cache.load(shared_db, vehicle)
+    assert reloaded is not history
+    assert len(reloaded) == 2
+
+
+def test_caches_do_not_keep_connections_alive(shared_db, vehicle):
+    histories, resolver = HistoryCache(), VehicleResolver()
+    conn = connect(get_db_location())
+    histories.load(conn, vehicle)
+    resolver.resolve(conn, "civic")
+    assert len(histories.versions) == len(resolver.versions) == 1
+
+    conn.close()
+    del conn
+    gc.collect()
+    assert len(histories.versions) == len(resolver.versions) == 0
+
+
+def test_resolver_is_cleared_for_a_new_connection(shared_db, vehicle):
+    resolver = VehicleResolver()
+    assert resolver.resolve(shared_db, "civic") == vehicle
+
+    # Renamed through a connection the resolver has not seen, without `clear`
+    conn = connect(get_db_location())
+    conn.execute("UPDATE vehicles SET name = 'daily' WHERE id = ?", (vehicle,))
+    conn.commit()
+    with pytest.raises(UnknownVehicleError):
+        resolver.resolve(conn, "civic")
+    assert resolver.resolve(conn, "daily") == vehicle
+    conn.close()
+
+    # The commit changed the data_version of the connection that was seen
+    assert resolver.resolve(shared_db, "daily") == vehicle
@@ -0,0 +1,100 @@
+"""
+Tests of `vv import`: records converted like the add commands, entries already recorded
+skipped, and a bad record stopping the import with its number.
+"""
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals.add_record import insert_vehicle
+from VehicleVitals.import_records import app
+
+CSV_EXPORT = """\
+VehicleID,EntryType,EntryDate,EntryTime,OdometerReading,IsFillUp,CostPerGallon,\
+GallonsFilled,TotalCost,Services
+{vehicle},Gas,2024-01-01,08:00 AM,"1,000",Full,$3.000,10,,
+{vehicle},Service,2024-01-03,,1100,,,,$45.50,Oil Change
+{vehicle},Gas,2024-01-05,6:30 PM,1300,Full,$3.100,10,,
+"""
+
+
+@pytest.fixture
+def vehicle(shared_db) -> str:
+    return insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 500)
+
+
+def import_file(path, *args: str):
+    return CliRunner().invoke(app, [str(path), *args])
+
+
+def test_import_csv_export(shared_db, vehicle, tmp_path):
+    source = tmp_path / "export.csv"
+    source.write_text(CSV_EXPORT.format(vehicle=vehicle))
+
+    result = import_file(source, "--batch-size", "2")
+    assert result.exit_code == 0, result.output
+    assert "Imported 3 log entries for 1 vehicles" in result.output
+    rows = shared_db.execute(
+        """
+        SELECT EntryTimestamp, OdometerReading, TotalCostCents, MPG
+        FROM logs ORDER BY EntryTimestamp
+        """
+    ).fetchall()
+    assert rows == [
+        ("2024-01-01T08:00:00", 1000, 3000, None),
+        ("2024-01-03T00:00:00", 1100, 4550, None),
+        ("2024-01-05T18:30:00", 1300, 3100, pytest.approx(30)),
+    ]
+    (mileage,) = shared_db.execute(
+        "SELECT mileage FROM vehicles WHERE id = ?", (vehicle,)
+    ).fetchone()
+    assert mileage == 1300
+
+    # Importing the same file again adds nothing
+    result = import_file(source)
+    assert result.exit_code == 0, result.output
+    assert "Skipped 3 entries that were already recorded." in result.output
+    (count,) = shared_db.execute("SELECT COUNT(*) FROM logs").fetchone()
+    assert count == 3
+
+
+def write_jsonl(path, lines: list[str]):
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def fuel_up(vehicle: str, day: int) -> str:
+    return json.dumps(
+        {
+            "VehicleID": vehicle,
+            "EntryType": "Gas",
+            "EntryTimestamp": f"2024-01-0{day}T08:00:00",
+            "OdometerReading": 1000 * day,
+            "GallonsFilled": 10,
+            "TotalCostCents": 3000,
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "bad_line, message",
+    [
+        ('{"VehicleID": ', "Record 2: Line 2: Expecting value"),
+        ("[1, 2]", "Record 2: Line 2: Not a JSON object"),
+        ('{"VehicleID": "none", "EntryDate": "2024-01-02"}', "Unknown VehicleID none"),
+        ('{"VehicleID": "{vehicle}", "EntryDate": "02/01/2024"}', "Record 2: time"),
+    ],
+)
+def test_bad_record_stops_the_import(shared_db, vehicle, tmp_path, bad_line, message):
+    bad_line = bad_line.replace("{vehicle}", vehicle)
+    source = write_jsonl(
+        tmp_path / "logs.jsonl", [fuel_up(vehicle, 1), bad_line, fuel_up(vehicle, 3)]
+    )
+    result = import_file(source)
+    assert result.exit_code == 1
+    assert isinstance(result.exception, SystemExit)
+    assert message in result.output
+    assert "Traceback" not in result.output
+    (count,) = shared_db.execute("SELECT COUNT(*) FROM logs").fetchone()
+    assert count == 0
@@ -0,0 +1,122 @@
+"""
+Tests of the MPG calculation: Full, Partial and Reset fuel ups, and the window of fuel
+ups recomputed when one is inserted out of order.
+"""
+import random
+
+import pytest
+
+from VehicleVitals.add_record import insert_fuel_up
+from VehicleVitals.mpg import FULL, PARTIAL, RESET, compute_mpg, recompute_all
+
+
+def add(conn, vehicle_id, day: int, odometer: float, gallons: float, is_fill_up=FULL):
+    insert_fuel_up(
+        conn,
+        vehicle_id,
+        odometer,
+        gallons,
+        3.0,
+        f"2024-01-{day:02}T08:00:00",
+        is_fill_up=is_fill_up,
+    )
+
+
+def mpg_by_odometer(conn, vehicle_id) -> dict[float, float | None]:
+    rows = conn.execute(
+        "SELECT OdometerReading, MPG FROM logs WHERE VehicleID = ?", (vehicle_id,)
+    )
+    return {odometer: mpg for odometer, mpg in rows}
+
+
+def test_compute_mpg_carries_partial_gallons_into_the_next_full_tank():
+    fuel_ups = [(1000, 10, FULL), (1100, 4, PARTIAL), (1300, 6, FULL)]
+    assert compute_mpg(fuel_ups) == [None, None, pytest.approx(30)]
+
+
+def test_compute_mpg_reset_restarts_the_chain():
+    fuel_ups = [(1000, 10, FULL), (1500, 8, RESET), (1750, 10, FULL)]
+    assert compute_mpg(fuel_ups) == [None, None, pytest.approx(25)]
+
+
+def test_compute_mpg_needs_a_full_tank_to_start():
+    fuel_ups = [(900, 5, PARTIAL), (1000, 10, FULL), (1200, 8, FULL)]
+    assert compute_mpg(fuel_ups) == [None, None, pytest.approx(25)]
+
+
+def test_compute_mpg_other_values_count_as_partial():
+    fuel_ups = [(1000, 10, FULL), (1100, 4, None), (1300, 6, FULL)]
+    assert compute_mpg(fuel_ups) == [None, None, pytest.approx(30)]
+
+
+def test_partial_then_full(conn, vehicle_id):
+    add(conn, vehicle_id, 1, 1000, 10)
+    add(conn, vehicle_id, 2, 1100, 4, PARTIAL)
+    add(conn, vehicle_id, 3, 1300, 6)
+    assert mpg_by_odometer(conn, vehicle_id) == {
+        1000: None,
+        1100: None,
+        1300: pytest.approx(30),
+    }
+
+
+def test_reset_breaks_the_chain(conn, vehicle_id):
+    add(conn, vehicle_id, 1, 1000, 10)
+    add(conn, vehicle_id, 2, 1500, 8, RESET)
+    add(conn, vehicle_id, 3, 1750, 10)
+    assert mpg_by_odometer(conn, vehicle_id) == {
+        1000: None,
+        1500: None,
+        1750: pytest.approx(25),
+    }
+
+
+def test_backdated_full_tank_re_anchors_the_next_one(conn, vehicle_id):
+    add(conn, vehicle_id, 1, 1000, 10)
+    add(conn, vehicle_id, 5, 1300, 10)
+    add(conn, vehicle_id, 9, 1600, 10)
+    assert mpg_by_odometer(conn, vehicle_id)[1300] == pytest.approx(30)
+
+    add(conn, vehicle_id, 3, 1100, 5)
+    assert mpg_by_odometer(conn, vehicle_id) == {
+        1000: None,
+        1100: pytest.approx(20),
+        1300: pytest.approx(20),
+        1600: pytest.approx(30),
+    }
+
+
+def test_backdated_partial_adds_its_gallons_to_the_next_full_tank(conn, vehicle_id):
+    add(conn, vehicle_id, 1, 1000, 10)
+    add(conn, vehicle_id, 5, 1300, 10)
+    add(conn, vehicle_id, 3, 1100, 5, PARTIAL)
+    assert mpg_by_odometer(conn, vehicle_id) == {
+        1000: None,
+        1100: None,
+        1300: pytest.approx(20),
+    }
+
+
+def test_backdated_reset_clears_the_next_mpg(conn, vehicle_id):
+    add(conn, vehicle_id, 1, 1000, 10)
+    add(conn, vehicle_id, 5, 1300, 10)
+    add(conn, vehicle_id, 3, 1100, 5, RESET)
+    assert mpg_by_odometer(conn, vehicle_id) == {
+        1000: None,
+        1100: None,
+        1300: pytest.approx(20),
+    }
+
+
+def test_windowed_recompute_matches_a_full_recompute(conn, vehicle_id):
+    rng = random.Random(7)
+    days = rng.sample(range(1, 29), 20)
+    for day in days:
+        is_fill_up = rng.choice([FULL, FULL, PARTIAL, RESET])
+        add(conn, vehicle_id, day, 1000 + day * 150, rng.uniform(3, 12), is_fill_up)
+    incremental = mpg_by_odometer(conn, vehicle_id)
+
+    conn.execute("UPDATE logs SET MPG = NULL")
+    read, _ = recompute_all(conn, vehicle_id)
+    assert read == len(days)
+    assert mpg_by_odometer(conn, vehicle_id) == incremental
@@ -0,0 +1,106 @@
+"""
+Tests of the keyset pagination of `vv display logs`: every log is on exactly one page,
+newest first, the logs without a timestamp last.
+"""
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals import display
+from VehicleVitals.add_record import insert_vehicle
+from VehicleVitals.display import (
+    LOGS_CURSOR_SIZE,
+    logs_cursor,
+    logs_query,
+    read_cursor,
+)
+
+INSERT_LOG_SQL = """
+    INSERT INTO logs (VehicleID, EntryType, EntryTimestamp, OdometerReading)
+    VALUES (?, 'Gas', ?, ?)
+"""
+
+# Timestamps of the logs in insert order, None for a log recorded without one
+TIMESTAMPS = [
+    "2024-01-02T08:00:00",
+    None,
+    "2024-01-01T08:00:00",
+    None,
+    "2024-01-02T08:00:00",
+    "2024-01-03T08:00:00",
+    None,
+]
+
+
+@pytest.fixture
+def vehicles(conn) -> list[str]:
+    """Two vehicles with the logs of TIMESTAMPS each."""
+    vehicle_ids = [
+        insert_vehicle(conn, 2020, "Honda", "Civic", "Red", 0, name=f"car{n}")
+        for n in range(2)
+    ]
+    for vehicle_id in vehicle_ids:
+        for odometer, timestamp in enumerate(TIMESTAMPS):
+            conn.execute(INSERT_LOG_SQL, (vehicle_id, timestamp, odometer))
+    conn.commit()
+    return vehicle_ids
+
+
+def all_pages(conn, page_size: int, vehicle_id: str = "") -> list[list[int]]:
+    """The rowids of every page, following the cursors to the end."""
+    pages, after = [], ""
+    while True:
+        page, last_row = read_cursor(after, LOGS_CURSOR_SIZE)
+        rows = conn.execute(*logs_query(page_size, vehicle_id, last_row)).fetchall()
+        if not rows:
+            return pages
+        pages.append([row[-1] for row in rows])
+        after = logs_cursor(page, rows[-1])
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 3, 100])
+@pytest.mark.parametrize("filtered", [False, True])
+def test_pages_hold_every_log_once(conn, vehicles, page_size, filtered):
+    vehicle_id = vehicles[1] if filtered else ""
+    expected = [
+        row[0]
+        for row in conn.execute(
+            """
+            SELECT rowid FROM logs WHERE VehicleID = ? OR ? = ''
+            ORDER BY EntryTimestamp IS NULL, EntryTimestamp DESC, rowid DESC
+            """,
+            (vehicle_id, vehicle_id),
+        )
+    ]
+    pages = all_pages(conn, page_size, vehicle_id)
+    assert [rowid for page in pages for rowid in page] == expected
+    assert all(len(page) == page_size for page in pages[:-1])
+
+
+def test_cli_pages_past_logs_without_a_timestamp(shared_db):
+    vehicle_id = insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0)
+    for odometer, timestamp in enumerate(TIMESTAMPS):
+        shared_db.execute(INSERT_LOG_SQL, (vehicle_id, timestamp, odometer))
+    shared_db.commit()
+
+    rows, after = [], ""
+    for _ in TIMESTAMPS:
+        result = CliRunner().invoke(
+            display.app,
+            ["logs", "--page-size", "2", "--format", "tsv", "--after", after],
+        )
+        assert result.exit_code == 0, result.output
+        # The next page cursor is printed on stderr, mixed into the output here
+        lines, _, after = result.output.partition("Next page: --after ")
+        rows += [line.split("\t")[4:6] for line in lines.splitlines()[1:]]
+        if not after:
+            break
+        after = after.strip()
+    assert rows == [
+        ["2024-01-03T08:00:00", "5.0"],
+        ["2024-01-02T08:00:00", "4.0"],
+        ["2024-01-02T08:00:00", "0.0"],
+        ["2024-01-01T08:00:00", "2.0"],
+        ["", "6.0"],
+        ["", "3.0"],
+        ["", "1.0"],
+    ]
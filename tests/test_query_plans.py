@@ -0,0 +1,226 @@
+"""
+Check that the hot path queries are served by indexes: EXPLAIN QUERY PLAN of each
+statement on an empty database with the current schema must use the expected index,
+without a full table scan or a temporary B-tree sort.
+"""
+import sqlite3
+
+import pytest
+
+from VehicleVitals.add_record import LOG_BY_NATURAL_KEY_QUERY
+from VehicleVitals.display import (
+    logs_query,
+    service_history_query,
+    service_spend_query,
+    stats_query,
+    vehicles_count_query,
+    vehicles_query,
+)
+from VehicleVitals.edit import vehicle_update_query
+from VehicleVitals.history import HISTORY_QUERY
+from VehicleVitals.manage import UNKEYED_LOGS_QUERY
+from VehicleVitals.mpg import (
+    ANCHOR_AFTER_QUERY,
+    ANCHOR_BEFORE_QUERY,
+    FUELED_VEHICLES_QUERY,
+    window_query,
+)
+from VehicleVitals.resolver import (
+    VEHICLE_BY_ID_QUERY,
+    VEHICLE_BY_NAME_QUERY,
+    VEHICLES_BY_PREFIX_QUERY,
+    prefix_range,
+)
+
+POSITION = ("2024-01-01T08:00:00", 1000.0)
+
+# (description, query, params, expected index, temporary B-tree sort allowed)
+CHECKS = [
+    (
+        "mpg full tank before a fuel up",
+        ANCHOR_BEFORE_QUERY,
+        ("vehicle", *POSITION),
+        "logs_vehicle_type_timestamp_idx",
+        False,
+    ),
+    (
+        "mpg full tank after a fuel up",
+        ANCHOR_AFTER_QUERY,
+        ("vehicle", *POSITION),
+        "logs_vehicle_type_timestamp_idx",
+        False,
+    ),
+    (
+        "mpg recompute window",
+        window_query(POSITION, POSITION),
+        ("vehicle", *POSITION, *POSITION),
+        "logs_vehicle_type_timestamp_idx",
+        False,
+    ),
+    (
+        "mpg recompute-mpg vehicle history",
+        window_query(None, None),
+        ("vehicle",),
+        "logs_vehicle_type_timestamp_idx",
+        False,
+    ),
+    (
+        "mpg recompute-mpg vehicles",
+        FUELED_VEHICLES_QUERY,
+        (),
+        "logs_vehicle",
+        False,
+    ),
+    (
+        "add_record entry by natural key",
+        LOG_BY_NATURAL_KEY_QUERY,
+        ("key",),
+        "logs_natural_key_idx (NaturalKey=?)",
+        False,
+    ),
+    (
+        "manage.dedupe unkeyed entries",
+        UNKEYED_LOGS_QUERY,
+        (),
+        "logs_natural_key_idx (NaturalKey=?)",
+        False,
+    ),
+    ("display.logs", *logs_query(10), "logs_timestamp_idx", False),
+    (
+        "display.logs --after",
+        *logs_query(10, after=("2024-01-01T08:00:00", 42)),
+        "logs_timestamp_idx",
+        False,
+    ),
+    (
+        "display.logs --vehicle-id --after",
+        *logs_query(10, "vehicle", ("2024-01-01T08:00:00", 42)),
+        "logs_vehicle_timestamp_idx",
+        False,
+    ),
+    (
+        "display.logs --after a log without a timestamp",
+        *logs_query(10, after=(None, 42)),
+        "logs_timestamp_idx (EntryTimestamp=? AND rowid<?)",
+        False,
+    ),
+    (
+        "display.vehicles --after",
+        *vehicles_query(10, after=(2020, "Toyota", "Camry", "id")),
+        "vehicles_display_order_idx",
+        False,
+    ),
+    (
+        "display.vehicles --vehicle",
+        *vehicles_query(10, "vehicle"),
+        "USING INDEX sqlite_autoindex_vehicles_1 (id=?)",
+        False,
+    ),
+    (
+        "display.vehicles --vehicle count",
+        *vehicles_count_query("vehicle"),
+        "USING COVERING INDEX sqlite_autoindex_vehicles_1 (id=?)",
+        False,
+    ),
+    ("display.stats", *stats_query(), "vehicles_display_order_idx", False),
+    (
+        "display.stats --vehicle-id",
+        *stats_query("vehicle"),
+        "USING PRIMARY KEY (VehicleID=?)",
+        False,
+    ),
+    # One aggregated row per vehicle is sorted, the month range is a key seek.
+    (
+        "display.stats --months",
+        *stats_query(months=12),
+        "USING PRIMARY KEY (VehicleID=? AND month>?)",
+        True,
+    ),
+    (
+        "display.service-history",
+        *service_history_query(),
+        "USING PRIMARY KEY (log_id=?)",
+        False,
+    ),
+    (
+        "display.service-history --vehicle-id",
+        *service_history_query("vehicle"),
+        "logs_vehicle_timestamp_idx (VehicleID=?)",
+        False,
+    ),
+    (
+        "display.service-history --vehicle-id --service-type",
+        *service_history_query("vehicle", "Oil Change"),
+        "logs_service_due_idx (VehicleID=? AND service_type_id=?)",
+        False,
+    ),
+    # One row per service type is grouped and sorted by spend.
+    (
+        "display.service-history spend",
+        *service_spend_query(),
+        "logs_service_due_idx",
+        True,
+    ),
+    (
+        "edit.vehicle",
+        *vehicle_update_query("vehicle", mileage=1000),
+        "sqlite_autoindex_vehicles_1 (id=?)",
+        False,
+    ),
+    (
+        "history vehicle history",
+        HISTORY_QUERY,
+        ("vehicle",),
+        "logs_vehicle_timestamp_idx (VehicleID=?)",
+        False,
+    ),
+    (
+        "resolver vehicle by ID",
+        VEHICLE_BY_ID_QUERY,
+        ("vehicle",),
+        "sqlite_autoindex_vehicles_1 (id=?)",
+        False,
+    ),
+    (
+        "resolver vehicle by name",
+        VEHICLE_BY_NAME_QUERY,
+        ("vehicle",),
+        "vehicles_name_idx (name=?)",
+        False,
+    ),
+    (
+        "resolver vehicle by ID prefix",
+        VEHICLES_BY_PREFIX_QUERY,
+        (*prefix_range("6ce1"), 6),
+        "sqlite_autoindex_vehicles_1 (id>? AND id<?)",
+        False,
+    ),
+]
+
+
+def query_plan(conn: sqlite3.Connection, query: str, params) -> list[str]:
+    """Return the detail column of EXPLAIN QUERY PLAN for a statement."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+def plan_problems(plan: list[str], index: str, allow_temp_sort: bool) -> list[str]:
+    """Return the reasons a query plan is not acceptable, empty if it is."""
+    problems = []
+    if not any(index in detail for detail in plan):
+        problems.append(f"does not use {index}")
+    for detail in plan:
+        if detail.startswith("SCAN") and "USING" not in detail:
+            problems.append(f"full table scan: {detail}")
+        if "TEMP B-TREE" in detail and not allow_temp_sort:
+            problems.append(f"temporary sort: {detail}")
+    return problems
+
+
+@pytest.mark.parametrize(
+    "query, params, index, allow_temp_sort",
+    [check[1:] for check in CHECKS],
+    ids=[check[0] for check in CHECKS],
+)
+def test_query_plan(conn, query, params, index, allow_temp_sort):
+    plan = query_plan(conn, query, params)
+    assert plan_problems(plan, index, allow_temp_sort) == [], plan
@@ -0,0 +1,185 @@
+"""
+Tests of `vv serve`: the writer thread surviving a failed batch, and the page cursors
+shared with `vv display`.
+"""
+import asyncio
+import re
+import sqlite3
+import threading
+
+import pytest
+from typer.testing import CliRunner
+
+from VehicleVitals import display
+from VehicleVitals.add_record import insert_fuel_up, insert_vehicle
+from VehicleVitals.database_utilities import get_db_location
+from VehicleVitals.server import Server, Writer
+
+
+@pytest.fixture
+def fleet(shared_db) -> sqlite3.Connection:
+    """The shared database with three vehicles and five fuel ups of the first one."""
+    vehicle_ids = [
+        insert_vehicle(shared_db, 2020 - n, "Honda", "Civic", "Red", 0, name=f"car{n}")
+        for n in range(3)
+    ]
+    for day in range(1, 6):
+        insert_fuel_up(
+            shared_db, vehicle_ids[0], 1000 * day, 10, 3, f"2024-01-0{day}T08:00:00"
+        )
+    shared_db.commit()
+    return shared_db
+
+
+def submit(writer: Writer, work):
+    async def run():
+        return await writer.submit(work)
+
+    return asyncio.run(run())
+
+
+def add_vehicle(conn: sqlite3.Connection) -> str:
+    return insert_vehicle(conn, 2024, "Toyota", "Camry", "Blue", 0)
+
+
+def test_writer_start_raises_when_the_database_cannot_be_opened(
+    shared_db, monkeypatch, tmp_path
+):
+    missing = tmp_path / "missing" / "vv.db"
+    monkeypatch.setenv("VEHICLE_VITALS_DATABASE_LOCATION", str(missing))
+    get_db_location.cache_clear()
+
+    writer = Writer()
+    errors = []
+
+    def start():
+        try:
+            writer.start()
+        except sqlite3.Error as error:
+            errors.append(error)
+
+    starting = threading.Thread(target=start, daemon=True)
+    starting.start()
+    starting.join(timeout=5)
+    assert not starting.is_alive(), "start() waits for a writer that has died"
+    assert isinstance(errors[0], sqlite3.OperationalError)
+    assert not writer.thread.is_alive()
+
+
+def test_writer_survives_a_locked_database(shared_db, monkeypatch):
+    monkeypatch.setenv("VEHICLE_VITALS_BUSY_TIMEOUT_MS", "50")
+    writer = Writer()
+    writer.start()
+    try:
+        blocker = sqlite3.connect(get_db_location())
+        blocker.execute("BEGIN IMMEDIATE")
+        with pytest.raises(sqlite3.OperationalError):
+            submit(writer, add_vehicle)
+        blocker.rollback()
+        blocker.close()
+
+        vehicle_id = submit(writer, add_vehicle)
+    finally:
+        writer.stop()
+    assert shared_db.execute(
+        "SELECT 1 FROM vehicles WHERE id = ?", (vehicle_id,)
+    ).fetchone()
+
+
+def test_failing_write_leaves_the_rest_of_the_batch(shared_db):
+    def fail(conn: sqlite3.Connection):
+        add_vehicle(conn)
+        raise ValueError("bad request")
+
+    async def run(writer: Writer):
+        return await asyncio.gather(
+            writer.submit(add_vehicle),
+            writer.submit(fail),
+            writer.submit(add_vehicle),
+            return_exceptions=True,
+        )
+
+    writer = Writer()
+    writer.start()
+    try:
+        first, failed, last = asyncio.run(run(writer))
+    finally:
+        writer.stop()
+    assert isinstance(failed, ValueError)
+    (count,) = shared_db.execute("SELECT COUNT(*) FROM vehicles").fetchone()
+    assert count == 2
+    assert {first, last} == {
+        row[0] for row in shared_db.execute("SELECT id FROM vehicles")
+    }
+
+
+def test_failing_write_in_a_group_commit(shared_db):
+    # Writes queued while the writer is busy commit together, minus the failing one
+    busy, release = threading.Event(), threading.Event()
+    error = ValueError("bad request")
+
+    def hold(conn: sqlite3.Connection):
+        busy.set()
+        release.wait()
+
+    def fail(conn: sqlite3.Connection):
+        add_vehicle(conn)
+        raise error
+
+    async def run(writer: Writer):
+        held = writer.submit(hold)
+        await asyncio.to_thread(busy.wait)
+        futures = [writer.submit(work) for work in (add_vehicle, fail, add_vehicle)]
+        commits = writer.commits
+        release.set()
+        await held
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return results, writer.commits - commits
+
+    writer = Writer()
+    writer.start()
+    try:
+        (first, failed, last), commits = asyncio.run(run(writer))
+    finally:
+        writer.stop()
+    # The batch holding the three writes, after the one holding `hold`
+    assert commits == 2
+    assert failed is error
+    ids = {row[0] for row in shared_db.execute("SELECT id FROM vehicles")}
+    assert ids == {first, last}
+
+
+def cli_page(command: str, *args: str) -> tuple[str, str | None]:
+    """Output of `vv display <command> --page-size 2` and its next page cursor."""
+    result = CliRunner().invoke(display.app, [command, "--page-size", "2", *args])
+    assert result.exit_code == 0, result.output
+    match = re.search(r"--after (\S+)", result.output)
+    return result.output, match[1] if match else None
+
+
+@pytest.mark.parametrize(
+    "command, route, items",
+    [("logs", "get_logs", "logs"), ("vehicles", "get_vehicles", "vehicles")],
+)
+def test_cursors_are_shared_with_the_cli(fleet, command, route, items):
+    server = Server(readers=1)
+    try:
+
+        def page(after: str) -> dict:
+            get = getattr(server, route)
+            _, payload = asyncio.run(get({"page_size": "2", "after": after}))
+            return payload
+
+        first = page("")
+        # The cursor of the server's first page is the CLI's
+        _, cli_cursor = cli_page(command)
+        assert first["after"] == cli_cursor
+
+        # Each accepts the other's cursor and returns the same page
+        second = page(cli_cursor)
+        output, _ = cli_page(command, "--after", first["after"])
+        assert output.startswith("Page 2")
+        assert second[items]
+        assert second["after"] == cli_page(command, "--after", cli_cursor)[1]
+    finally:
+        server.close()
@@ -0,0 +1,106 @@
+"""
+Tests of the stats triggers: vehicle_stats and vehicle_monthly_stats kept current by the
+logs_stats_* triggers must match a rebuild from the logs (REBUILD_STATS_SQL).
+"""
+import random
+
+from VehicleVitals.add_record import insert_fuel_up, insert_vehicle
+from VehicleVitals.database_utilities import REBUILD_STATS_SQL, attach_archive
+from VehicleVitals.manage import archive_logs
+from VehicleVitals.shell import Shell
+
+INSERT_LOG_SQL = """
+    INSERT INTO logs (
+        VehicleID, EntryType, EntryTimestamp, OdometerReading, GallonsFilled,
+        TotalCostCents, MPG
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def stats_tables(conn) -> tuple[list, list]:
+    """Rows of both stats tables in key order, floats rounded."""
+
+    def rows(query):
+        return [
+            tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+            for row in conn.execute(query)
+        ]
+
+    return (
+        rows("SELECT * FROM vehicle_stats ORDER BY VehicleID"),
+        rows("SELECT * FROM vehicle_monthly_stats ORDER BY VehicleID, month"),
+    )
+
+
+def random_log(rng: random.Random, vehicle_ids: list[str]) -> tuple:
+    gas = rng.random() < 0.7
+    timestamp = f"2024-{rng.randint(1, 4):02}-{rng.randint(1, 28):02}T08:00:00"
+    return (
+        rng.choice(vehicle_ids),
+        "Gas" if gas else "Service",
+        None if rng.random() < 0.05 else timestamp,
+        rng.choice([None, *range(1000, 5000, 37)]),
+        rng.uniform(3, 12) if gas else None,
+        rng.randint(1000, 20000),
+        rng.uniform(20, 40) if gas and rng.random() < 0.7 else None,
+    )
+
+
+def test_triggers_match_a_rebuild(conn):
+    rng = random.Random(11)
+    vehicle_ids = [
+        insert_vehicle(conn, 2020, "Honda", "Civic", "Red", 0, name=f"car{n}")
+        for n in range(3)
+    ]
+    for _ in range(300):
+        conn.execute(INSERT_LOG_SQL, random_log(rng, vehicle_ids))
+
+    rowids = [row[0] for row in conn.execute("SELECT rowid FROM logs")]
+    for rowid in rng.sample(rowids, 120):
+        column, value = rng.choice(
+            [
+                ("MPG", rng.choice([None, rng.uniform(20, 40)])),
+                ("TotalCostCents", rng.randint(0, 20000)),
+                ("GallonsFilled", rng.uniform(3, 12)),
+                ("OdometerReading", rng.choice([None, rng.randint(1000, 5000)])),
+                ("EntryTimestamp", random_log(rng, vehicle_ids)[2]),
+                ("EntryType", rng.choice(["Gas", "Service"])),
+                ("VehicleID", rng.choice(vehicle_ids)),
+            ]
+        )
+        conn.execute(f"UPDATE logs SET {column} = ? WHERE rowid = ?", (value, rowid))
+    for rowid in rng.sample(rowids, 100):
+        conn.execute("DELETE FROM logs WHERE rowid = ?", (rowid,))
+    # Every log of one vehicle removed, its stats rows go with them
+    conn.execute("DELETE FROM logs WHERE VehicleID = ?", (vehicle_ids[0],))
+    conn.commit()
+
+    maintained = stats_tables(conn)
+    attach_archive(conn)
+    with conn:
+        for statement in REBUILD_STATS_SQL.split(";"):
+            conn.execute(statement)
+    assert maintained[0], "no stats left to compare"
+    assert maintained == stats_tables(conn)
+
+
+def test_rebuild_is_refused_inside_a_shell_transaction(shared_db, capsys):
+    vehicle_id = insert_vehicle(shared_db, 2020, "Honda", "Civic", "Red", 0)
+    for month in range(1, 5):
+        insert_fuel_up(
+            shared_db, vehicle_id, month * 300, 10, 3, f"2024-{month:02}-15T08:00:00"
+        )
+    shared_db.commit()
+    archive_logs(shared_db, "2024-03-01")
+    maintained = stats_tables(shared_db)
+
+    shell = Shell()
+    shell.run_line("begin")
+    assert shell.run_line("display stats --rebuild") == 1
+    assert "commit or rollback" in capsys.readouterr().err
+    shell.run_line("commit")
+
+    # Outside of it the rebuild reads the archived logs too
+    assert shell.run_line("display stats --rebuild") == 0
+    assert stats_tables(shared_db) == maintained